@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of vardbg's diff engine against dictdiffer on snapshots from the sorting algorithm tests.
+Snapshots are taken the same way as the tracer does, so unchanged values are shared between them.
+"""
+
+import random
+import sys
+import timeit
+
+import dictdiffer
+
+import setup_path  # noqa: F401
+from algos.sorting import bubble_sort, insertion_sort, merge_sort, selection_sort, shell_sort
+from vardbg import diff, snapshot
+
+SORT_FUNCS = (bubble_sort, merge_sort, insertion_sort, shell_sort, selection_sort)
+LIST_SIZES = (10, 50, 100)
+ROUNDS = 3
+
+
+def collect_snapshots(func, lst):
+    snapshots = []
+    comparable_names = set()
+    prev_locals = {}
+
+    def trace(frame, event, arg):
+        nonlocal prev_locals
+
+        if frame.f_code is func.__code__:
+            prev_locals, _ = snapshot.take(frame.f_locals, prev_locals, comparable_names)
+            snapshots.append(prev_locals)
+
+        return trace
+
+    sys.settrace(trace)
+    func(lst)
+    sys.settrace(None)
+
+    return list(zip(snapshots, snapshots[1:]))
+
+
+def run_dictdiffer(pairs):
+    for prev, new in pairs:
+        list(dictdiffer.diff(prev, new))
+
+
+def run_vardbg(pairs):
+    for prev, new in pairs:
+        list(diff.diff_locals(prev, new))
+
+
+def main():
+    random.seed(0)
+    print(f"{'function':<16} {'size':>5} {'pairs':>7} {'dictdiffer':>12} {'vardbg':>12} {'speedup':>8}")
+
+    for size in LIST_SIZES:
+        sample = random.sample(range(size * 10), size)
+
+        for func in SORT_FUNCS:
+            pairs = collect_snapshots(func, sample.copy())
+
+            time_dictdiffer = min(timeit.repeat(lambda: run_dictdiffer(pairs), number=1, repeat=ROUNDS))
+            time_vardbg = min(timeit.repeat(lambda: run_vardbg(pairs), number=1, repeat=ROUNDS))
+
+            speedup = time_dictdiffer / time_vardbg
+            print(
+                f"{func.__name__:<16} {size:>5} {len(pairs):>7} "
+                f"{time_dictdiffer * 1000:>9.1f} ms {time_vardbg * 1000:>9.1f} ms {speedup:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the size and loading time of recordings of the sorting algorithm tests in each recording format.
+"""
+
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import setup_path  # noqa: F401
+from algos.sorting import bubble_sort, insertion_sort, merge_sort, selection_sort, shell_sort
+from vardbg import Debugger, recording
+
+SORT_FUNCS = (bubble_sort, merge_sort, insertion_sort, shell_sort, selection_sort)
+LIST_SIZE = 100
+FORMATS = (".json", ".jsonl", ".jsonl.gz", ".vardbg", ".vardbg.gz")
+
+
+def measure(func, lst, path):
+    start_time = time.perf_counter()
+    with Debugger(json_out_path=str(path), quiet=True) as dbg:
+        dbg.run(func, lst)
+    record_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    events = sum(1 for _ in recording.read_events(path, {}))
+    load_time = time.perf_counter() - start_time
+
+    return path.stat().st_size, record_time, load_time, events
+
+
+def main():
+    random.seed(0)
+    sample = random.sample(range(LIST_SIZE * 10), LIST_SIZE)
+    print(f"{'function':<16} {'format':<11} {'events':>7} {'size':>12} {'record':>9} {'load':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for func in SORT_FUNCS:
+            for suffix in FORMATS:
+                path = Path(tmp_dir) / f"{func.__name__}{suffix}"
+                size, record_time, load_time, events = measure(func, sample.copy(), path)
+                print(
+                    f"{func.__name__:<16} {suffix:<11} {events:>7} {size / 1024:>8.1f} KiB "
+                    f"{record_time:>7.2f} s {load_time:>7.2f} s"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the memory retained by vardbg's data model while debugging the sorting algorithm tests.
+This includes the variable history, profiler timings, and frame information that are kept until the end of the run.
+"""
+
+import gc
+import random
+import tracemalloc
+
+import setup_path  # noqa: F401
+from algos.sorting import bubble_sort, insertion_sort, merge_sort, selection_sort, shell_sort
+from vardbg import Debugger
+
+SORT_FUNCS = (bubble_sort, merge_sort, insertion_sort, shell_sort, selection_sort)
+LIST_SIZES = (10, 50, 100)
+
+
+def measure(func, lst):
+    gc.collect()
+    tracemalloc.start()
+    start_size, _ = tracemalloc.get_traced_memory()
+
+    dbg = Debugger(quiet=True)
+    dbg.run(func, lst)
+
+    # Only count what's still referenced after the run
+    gc.collect()
+    end_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    events = sum(len(exec_times) for exec_times in dbg.frame_exec_times.values())
+    dbg.close()
+
+    return end_size - start_size, events
+
+
+def main():
+    random.seed(0)
+    print(f"{'function':<16} {'size':>5} {'events':>7} {'retained':>12} {'per event':>12}")
+
+    for size in LIST_SIZES:
+        sample = random.sample(range(size * 10), size)
+
+        for func in SORT_FUNCS:
+            retained, events = measure(func, sample.copy())
+            print(f"{func.__name__:<16} {size:>5} {events:>7} {retained / 1024:>9.1f} KiB {retained / events:>10.1f} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+"""
+Makes vardbg and the algorithms from the tests importable, so benchmarks can be run from any directory without
+installing vardbg first, e.g. python benchmarks/bench_diff.py. Benchmarks import this before anything else.
+"""
+
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+for path in (ROOT_DIR / "tests", ROOT_DIR):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
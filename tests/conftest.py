@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+from algos.sorting import merge_sort
+
+from vardbg import Debugger, index
+
+# Formats that recordings are made in for the tests, by extension
+FORMATS = (".json", ".jsonl", ".vardbg")
+STREAMED_FORMATS = (".jsonl", ".vardbg")
+# Blocks are kept small so that the recordings are split into many of them
+BLOCK_EVENTS = 32
+SORT_INPUT = [5, 2, 9, 1, 7, 3, 8, 6, 4, 0]
+# Recording of tests/recordings/v1_program.py made by a version of vardbg that wrote format version 1
+V1_RECORDING = Path(__file__).parent / "recordings" / "v1.json"
+
+
+def record(path, func, *args):
+    block_events = index.BLOCK_EVENTS
+    index.BLOCK_EVENTS = BLOCK_EVENTS
+    try:
+        with Debugger(json_out_path=str(path), quiet=True) as dbg:
+            dbg.run(func, *args)
+    finally:
+        index.BLOCK_EVENTS = block_events
+
+    return path
+
+
+@pytest.fixture(scope="session")
+def recordings(tmp_path_factory):
+    """Map of extensions to recordings of merge sort in each format"""
+
+    tmp_dir = tmp_path_factory.mktemp("recordings")
+    return {suffix: record(tmp_dir / f"merge_sort{suffix}", merge_sort, SORT_INPUT.copy()) for suffix in FORMATS}
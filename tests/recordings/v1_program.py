@@ -0,0 +1,18 @@
+# Program that v1.json was recorded from by a version of vardbg that wrote format version 1
+
+
+def main():
+    x = 1
+    x = 2
+    x = 3
+    lst = [1]
+    lst.append(2)
+    lst[0] = 5
+    lst.pop()
+    d = {"a": 1}
+    d["b"] = 2
+    del d["b"]
+    s = {1}
+    s.add(2)
+    print("done")
+    del x
@@ -0,0 +1,154 @@
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+from vardbg import Debugger, recording, snapshot
+from vardbg.main import cli
+
+requires_monitoring = pytest.mark.skipif(
+    not hasattr(sys, "monitoring"), reason="sys.monitoring requires Python 3.12 or newer"
+)
+
+
+def trace(tmp_path, backend, func, **options):
+    path = tmp_path / f"{backend}.jsonl"
+    with Debugger(json_out_path=str(path), quiet=True, profiler_output=True, backend=backend, **options) as dbg:
+        dbg.run(func)
+
+    return [normalize(event) for event in recording.read_events(path, {})]
+
+
+def plain(value):
+    # Objects like generators and exceptions don't compare equal to their copies from another run
+    return value if snapshot.is_comparable(value) else type(value).__name__
+
+
+def normalize(event):
+    # Times differ between runs, and records are compared by their contents
+    normalized = {}
+    for key, value in event.items():
+        if key in ("time", "exec_time", "process"):
+            continue
+        elif key == "frame_info":
+            value = value.function, value.line
+        elif key == "var":
+            value = value.name
+        elif key == "values":
+            value = [(plain(var_value.value), var_value.file_line) for var_value in value]
+        elif key in ("value", "value_before", "value_after"):
+            value = plain(value)
+
+        normalized[key] = value
+
+    return normalized
+
+
+def add(a, b):
+    c = a + b
+    return c
+
+
+def call_add():
+    x = add(1, 2)
+    y = add(x, 3)
+    return y
+
+
+def count_up(n):
+    for i in range(n):
+        doubled = i * 2
+        yield doubled
+
+
+def iterate_generators():
+    total = 0
+    for value in count_up(3):
+        total += value
+
+    # Generators that are closed or have exceptions thrown into them while suspended
+    closed = count_up(5)
+    first = next(closed)
+    closed.close()
+
+    thrown = count_up(5)
+    next(thrown)
+    try:
+        thrown.throw(ValueError("stop"))
+    except ValueError:
+        total += first
+
+    return total
+
+
+def fail(n):
+    half = n // 2
+    raise ValueError(half)
+
+
+def catch_exceptions():
+    caught = []
+    for n in range(3):
+        try:
+            fail(n)
+        except ValueError as e:
+            caught.append(e.args[0])
+
+    return caught
+
+
+@requires_monitoring
+@pytest.mark.parametrize("func", [call_add, iterate_generators, catch_exceptions])
+def test_same_events_as_settrace(tmp_path, func):
+    assert trace(tmp_path, "monitoring", func) == trace(tmp_path, "settrace", func)
+
+
+@requires_monitoring
+@pytest.mark.parametrize("options", [{"max_depth": 0}, {"calls_only": True}], ids=["max_depth", "calls_only"])
+def test_same_events_as_settrace_with_options(tmp_path, options):
+    for func in (call_add, iterate_generators, catch_exceptions):
+        assert trace(tmp_path, "monitoring", func, **options) == trace(tmp_path, "settrace", func, **options)
+
+
+@requires_monitoring
+def test_rejected_code_is_traced_by_later_sessions(tmp_path):
+    excluded = trace(tmp_path, "monitoring", call_add, exclude=["test_backends"])
+    assert excluded == []
+
+    functions = {event["frame_info"][0] for event in trace(tmp_path, "monitoring", call_add) if "frame_info" in event}
+    assert functions == {"call_add", "add"}
+
+
+@requires_monitoring
+def test_other_tools_are_left_alone(tmp_path):
+    mon = sys.monitoring
+    calls = []
+
+    def disable_add(code, offset):
+        if code is add.__code__:
+            calls.append(code)
+            return mon.DISABLE
+
+    mon.use_tool_id(mon.PROFILER_ID, "test")
+    mon.register_callback(mon.PROFILER_ID, mon.events.PY_START, disable_add)
+    mon.set_events(mon.PROFILER_ID, mon.events.PY_START)
+    try:
+        add(1, 2)
+        trace(tmp_path, "monitoring", call_add)
+        add(1, 2)
+    finally:
+        mon.set_events(mon.PROFILER_ID, 0)
+        mon.register_callback(mon.PROFILER_ID, mon.events.PY_START, None)
+        mon.free_tool_id(mon.PROFILER_ID)
+
+    # The location that the other tool disabled stays disabled
+    assert len(calls) == 1
+
+
+def test_monitoring_unavailable(monkeypatch):
+    monkeypatch.delattr(sys, "monitoring", raising=False)
+    result = CliRunner().invoke(cli, ["run", __file__, "call_add", "-b", "monitoring"])
+
+    assert result.exit_code != 0
+    assert result.exception is None or isinstance(result.exception, SystemExit)
+    assert "requires Python 3.12 or newer" in result.output
@@ -0,0 +1,180 @@
+import io
+import sys
+import threading
+
+import pytest
+
+from vardbg import binary, data, recording, snapshot
+
+
+def encode(events, metadata=None, keyframe=None):
+    file = io.BytesIO()
+    encoder = binary.BinaryEncoder(file)
+    if keyframe is not None:
+        encoder.start_block(keyframe)
+    for event in events:
+        encoder.write_event(event)
+    if metadata is not None:
+        encoder.write_metadata(metadata)
+
+    return file.getvalue()
+
+
+def decode(encoded, on_block=None):
+    return list(binary.read_records(io.BytesIO(encoded), on_block=on_block))
+
+
+def round_trip(value):
+    ((is_event, event),) = decode(encode([{"step": 1, "event": "test", "value": value}]))
+    assert is_event
+    return event["value"]
+
+
+def frame_info():
+    return data.FrameInfo(sys._getframe(1))
+
+
+@pytest.mark.parametrize("num", [0, 1, -1, 63, -64, 127, 128, -129, 2 ** 31, -(2 ** 63), 2 ** 64 + 1, -(10 ** 40)])
+def test_ints(num):
+    value = round_trip(num)
+    assert type(value) is int
+    assert value == num
+
+
+def test_varint_sizes():
+    for num, size in ((0, 1), (127, 1), (128, 2), (16383, 2), (16384, 3)):
+        buf = bytearray()
+        binary._write_uint(buf, num)
+        assert len(buf) == size
+
+
+@pytest.mark.parametrize(
+    "value",
+    [None, True, False, 1.5, float("inf"), complex(1, -2), "", "text é 😀", "x" * 100, b"\x00\xff", range(1, 10, 3)],
+)
+def test_scalars(value):
+    decoded = round_trip(value)
+    assert type(decoded) is type(value)
+    assert decoded == value
+
+
+@pytest.mark.parametrize("value", [[], (), set(), frozenset(), {}])
+def test_empty_containers(value):
+    decoded = round_trip(value)
+    assert type(decoded) is type(value)
+    assert decoded == value
+
+
+def test_nested_containers():
+    value = {"a": [1, (2, 3), {4}], (1, 2): frozenset((5,)), "b": {"c": [[], {}]}}
+    assert round_trip(value) == value
+
+
+def test_shared_objects():
+    shared = [1, 2, 3, 4, 5]
+    value = [shared, {"x": shared}, shared]
+    assert round_trip(value) == value
+
+
+def test_self_referencing_list():
+    value = [1]
+    value.append(value)
+
+    decoded = round_trip(value)
+    assert decoded[0] == 1
+    assert decoded[1] is decoded
+
+
+def test_uncopyable_value():
+    value = snapshot.Uncopyable(threading.Lock())
+    decoded = round_trip(value)
+    assert decoded == value
+    assert repr(decoded) == repr(value)
+
+
+def test_other_objects():
+    value = threading.Event
+    assert round_trip(value) is value
+
+
+def test_interned_objects():
+    frame = frame_info()
+    var = data.Variable("x", frame)
+    values = data.VarValues(data.VarValue([1, 2], frame), data.VarValue("y" * 80, frame), ignored=True)
+    values.deleted_line = frame.file_line
+    events = [
+        {"step": 1, "event": "new_frame", "frame_info": frame},
+        {"step": 2, "event": "var_values", "frame_info": frame, "var": var, "values": values},
+    ]
+
+    (_, first), (_, second) = decode(encode(events))
+    assert first["frame_info"] == frame
+    assert first["frame_info"].file_line == frame.file_line
+    assert second["frame_info"] is first["frame_info"]
+    assert second["var"] == var
+    assert second["var"].file_line == var.file_line
+
+    decoded = second["values"]
+    assert decoded.ignored
+    assert decoded.deleted_line == frame.file_line
+    assert [(value.value, value.file_line) for value in decoded] == [(value.value, value.file_line) for value in values]
+
+
+def test_delta_fields():
+    events = [
+        {"step": 1, "time": 1_700_000_000_000_000_000, "process": 100, "event": "a"},
+        {"step": 2, "time": 1_600_000_000_000_000_000, "process": 7, "event": "b"},
+        # Events from older versions don't have all of them
+        {"step": 3, "event": "c", "x": 1},
+    ]
+
+    assert [event for _, event in decode(encode(events))] == events
+
+
+def test_metadata_and_keyframes():
+    keyframes = []
+    records = decode(
+        encode([{"step": 1, "event": "a"}], metadata={"version": 3}, keyframe={"frames": [], "values": []}),
+        on_block=lambda offset, keyframe: keyframes.append(keyframe),
+    )
+
+    assert records == [(True, {"step": 1, "event": "a"}), (False, {"version": 3})]
+    assert keyframes == [{"frames": [], "values": []}]
+
+
+def test_truncated():
+    frame = frame_info()
+    events = [{"step": step, "event": "new_frame", "frame_info": frame, "value": [step] * 20} for step in range(1, 6)]
+    encoded = encode(events, metadata={"version": 3})
+
+    # Recordings that were cut off end at their last complete record
+    for end in range(len(binary.MAGIC), len(encoded)):
+        decoded = [event for _, event in decode(encoded[:end])]
+        assert decoded == events[: len(decoded)]
+
+    assert len(decode(encoded)) == len(events) + 1
+
+
+def test_not_binary():
+    with pytest.raises(ValueError):
+        decode(b"{}")
+
+
+def test_gzip(tmp_path):
+    path = tmp_path / "session.vardbg.gz"
+    events = [{"step": step, "event": "a", "value": list(range(step * 10))} for step in range(1, 4)]
+    with recording.open_recording(path, "wb") as f:
+        encoder = binary.BinaryEncoder(f)
+        for event in events:
+            encoder.write_event(event)
+        encoder.write_metadata({"version": 3})
+
+    metadata = {}
+    assert list(recording.read_events(path, metadata)) == events
+    assert metadata == {"version": 3}
+
+    # Compressed streams that were cut off end at their last complete record too
+    truncated = tmp_path / "truncated.vardbg.gz"
+    truncated.write_bytes(path.read_bytes()[:-12])
+    decoded = list(recording.read_events(truncated, {}))
+    assert decoded == events[: len(decoded)]
@@ -0,0 +1,99 @@
+import copy
+
+from vardbg.diff import ADD, CHANGE, REMOVE, Change, diff_locals
+
+
+def diff(before, after):
+    return list(diff_locals(before, after))
+
+
+def test_unchanged():
+    lst = [1, 2, 3]
+    assert diff({"a": 1, "lst": lst}, {"a": 1, "lst": lst}) == []
+    assert diff({"lst": [1, [2, 3]]}, {"lst": [1, [2, 3]]}) == []
+
+
+def test_add_variables():
+    assert diff({"a": 1}, {"a": 1, "b": 2, "c": 3}) == [Change(ADD, None, (), [("b", 2), ("c", 3)])]
+
+
+def test_remove_variables():
+    assert diff({"a": 1, "b": 2}, {"b": 2}) == [Change(REMOVE, None, (), [("a", 1)])]
+
+
+def test_change_scalar():
+    assert diff({"a": 1}, {"a": 2}) == [Change(CHANGE, "a", (), (1, 2))]
+
+
+def test_change_type():
+    assert diff({"a": [1]}, {"a": (1,)}) == [Change(CHANGE, "a", (), ([1], (1,)))]
+
+
+def test_change_sequence_elements():
+    assert diff({"lst": [1, 2, 3, 4]}, {"lst": [1, 5, 3, 6]}) == [
+        Change(CHANGE, "lst", (1,), (2, 5)),
+        Change(CHANGE, "lst", (3,), (4, 6)),
+    ]
+
+
+def test_change_nested():
+    before = {"grid": [[0, 0], [0, 0]], "d": {"k": {"x": 1}}}
+    after = {"grid": [[0, 0], [0, 7]], "d": {"k": {"x": 2}}}
+    assert diff(before, after) == [
+        Change(CHANGE, "grid", (1, 1), (0, 7)),
+        Change(CHANGE, "d", ("k", "x"), (1, 2)),
+    ]
+
+
+def test_add_sequence_elements():
+    assert diff({"lst": [1]}, {"lst": [1, 2, 3]}) == [Change(ADD, "lst", (), [(1, 2), (2, 3)])]
+
+
+def test_remove_sequence_elements():
+    # Elements are removed from the end first so that the indices stay valid
+    assert diff({"lst": [1, 2, 3]}, {"lst": [1]}) == [Change(REMOVE, "lst", (), [(2, 3), (1, 2)])]
+
+
+def test_mapping_keys():
+    assert diff({"d": {"a": 1, "b": 2}}, {"d": {"b": 3, "c": 4}}) == [
+        Change(CHANGE, "d", ("b",), (2, 3)),
+        Change(ADD, "d", (), [("c", 4)]),
+        Change(REMOVE, "d", (), [("a", 1)]),
+    ]
+
+
+def test_set_grow():
+    assert diff({"s": {1, 2}}, {"s": {1, 2, 3}}) == [Change(ADD, "s", (), [(None, {3})])]
+
+
+def test_set_reduce():
+    assert diff({"s": {1, 2, 3}}, {"s": {2}}) == [Change(REMOVE, "s", (), [(None, {1, 3})])]
+    assert diff({"s": frozenset((1, 2))}, {"s": frozenset((2, 4))}) == [
+        Change(ADD, "s", (), [(None, frozenset((4,)))]),
+        Change(REMOVE, "s", (), [(None, frozenset((1,)))]),
+    ]
+
+
+def test_self_referencing_list():
+    before = [1]
+    before.append(before)
+    after = copy.deepcopy(before)
+    after[0] = 2
+
+    assert diff({"a": before}, {"a": after}) == [Change(CHANGE, "a", (0,), (1, 2))]
+    assert diff({"a": before}, {"a": copy.deepcopy(before)}) == []
+
+
+def test_mutually_referencing_containers():
+    before = {"lst": [], "n": 1}
+    before["lst"].append(before)
+    after = copy.deepcopy(before)
+    after["n"] = 2
+
+    assert diff({"d": before}, {"d": after}) == [Change(CHANGE, "d", ("n",), (1, 2))]
+
+
+def test_change_to_equal_value_of_another_type():
+    assert diff({"a": 1}, {"a": True}) == [Change(CHANGE, "a", (), (1, True))]
+    assert diff({"lst": [1, 2]}, {"lst": [1, 2.0]}) == [Change(CHANGE, "lst", (1,), (2, 2.0))]
+    assert diff({"d": {"k": [0]}}, {"d": {"k": [False]}}) == [Change(CHANGE, "d", ("k", 0), (0, False))]
@@ -0,0 +1,135 @@
+import json
+import shutil
+
+import pytest
+from conftest import STREAMED_FORMATS
+
+from vardbg import index, recording
+from vardbg.output.json_writer import NEW_FRAME
+from vardbg.replayer import filter_events
+
+FILTERS = [
+    {"from_step": 100, "to_step": 250},
+    {"from_step": 600},
+    {"to_step": 10},
+    {"function": "merge"},
+    {"variable": "res"},
+    {"variable": "middle", "function": "merge_sort"},
+    {"variable": "res", "function": "merge", "from_step": 300, "to_step": 500},
+    {"variable": "missing"},
+]
+
+
+def steps(events):
+    return [event["step"] for event in events]
+
+
+def filtered_steps(path, filters):
+    # Reads only the blocks that the index selects
+    return steps(filter_events(recording.read_events(path, {}, **filters), **filters))
+
+
+def full_steps(path, filters):
+    return steps(filter_events(recording.read_events(path, {}), **filters))
+
+
+@pytest.fixture(params=STREAMED_FORMATS)
+def streamed(request, recordings, tmp_path):
+    # Each test gets its own copy because some of them change the index
+    path = tmp_path / recordings[request.param].name
+    shutil.copy(recordings[request.param], path)
+    shutil.copy(index.index_path(recordings[request.param]), index.index_path(path))
+    return path
+
+
+def test_blocks(streamed):
+    rec_index = index.RecordingIndex.load(streamed)
+    events = list(recording.read_events(streamed, {}))
+    assert len(rec_index.blocks) > 1
+    assert rec_index.last_step == len(events)
+
+    # Blocks start at frames and their events add up to the whole recording
+    block_steps = []
+    for block in range(len(rec_index.blocks)):
+        keyframe, block_events = recording.read_block(streamed, rec_index, block)
+        assert block_events[0]["event"] == NEW_FRAME
+        assert block_events[0]["step"] == rec_index.blocks[block][1]
+        block_steps += steps(block_events)
+
+    assert block_steps == steps(events)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filtered_replay(streamed, filters):
+    assert filtered_steps(streamed, filters) == full_steps(streamed, filters)
+
+
+def test_filtered_reads_fewer_events(streamed):
+    total = sum(1 for _ in recording.read_events(streamed, {}))
+    for filters in ({"from_step": 600}, {"to_step": 10}, {"variable": "middle"}):
+        assert sum(1 for _ in recording.read_events(streamed, {}, **filters)) < total
+
+
+def test_filtered_replay_reads_summaries(streamed):
+    metadata = {}
+    for _ in recording.read_events(streamed, metadata, to_step=10):
+        pass
+
+    assert "var_history" in metadata
+
+
+def test_change_steps(streamed):
+    rec_index = index.RecordingIndex.load(streamed)
+    changes = [event["step"] for event in recording.read_events(streamed, {}) if index.value_change(event)]
+    indexed = sorted(step for functions in rec_index.changes.values() for steps in functions.values() for step in steps)
+    assert indexed == changes
+
+
+def test_missing_index(streamed):
+    rec_index = index.RecordingIndex.load(streamed)
+    expected = {i: full_steps(streamed, filters) for i, filters in enumerate(FILTERS)}
+
+    # Filtered replays read the whole recording without an index
+    index_path = index.index_path(streamed)
+    shutil.move(index_path, str(streamed) + ".bak")
+    assert index.RecordingIndex.load(streamed) is None
+    for i, filters in enumerate(FILTERS):
+        assert filtered_steps(streamed, filters) == expected[i]
+
+    # Missing indices are rebuilt like the ones written along with the recording
+    rebuilt = recording.load_index(streamed)
+    with open(index_path) as f, open(str(streamed) + ".bak") as original:
+        assert json.load(f) == json.load(original)
+    assert rebuilt.blocks == rec_index.blocks
+
+
+def test_stale_index(streamed, recordings):
+    # Indices of recordings that changed since they were written are ignored
+    with open(index.index_path(streamed)) as f:
+        data = json.load(f)
+    data["size"] += 1
+    with open(index.index_path(streamed), "w") as f:
+        json.dump(data, f)
+
+    assert index.RecordingIndex.load(streamed) is None
+    for filters in FILTERS:
+        assert filtered_steps(streamed, filters) == full_steps(streamed, filters)
+
+    assert recording.load_index(streamed).blocks == index.RecordingIndex.load(recordings[streamed.suffix]).blocks
+
+
+def test_old_index_version(streamed):
+    with open(index.index_path(streamed)) as f:
+        data = json.load(f)
+    data["index_version"] = index.INDEX_VERSION - 1
+    with open(index.index_path(streamed), "w") as f:
+        json.dump(data, f)
+
+    assert index.RecordingIndex.load(streamed) is None
+    assert recording.load_index(streamed) is not None
+
+
+def test_documents_are_not_indexed(recordings):
+    with pytest.raises(ValueError):
+        recording.build_index(recordings[".json"])
+    assert recording.load_index(recordings[".json"]) is None
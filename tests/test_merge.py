@@ -0,0 +1,109 @@
+import sys
+
+from vardbg import data, recording
+from vardbg.output.json_lines_writer import JsonLinesWriter
+from vardbg.output.json_writer import (
+    ADD_VARIABLE,
+    NEW_FRAME,
+    UPDATE_VALUES,
+    ValueTimes,
+    combine_summaries,
+    merge_events,
+)
+
+
+def square():
+    return data.FrameInfo(sys._getframe())
+
+
+FRAME_INFO = square()
+V = data.Variable("v", FRAME_INFO)
+
+
+def frame(process, time):
+    return {"process": process, "thread": 0, "time": time, "event": NEW_FRAME}
+
+
+def add(process, time, value):
+    return {"process": process, "thread": 0, "time": time, "event": ADD_VARIABLE, "value": value}
+
+
+def var_values(process, time, *values, new=False):
+    return {"process": process, "time": time, "event": UPDATE_VALUES, "var": V, "new": new, "values": list(values)}
+
+
+def var_value(value):
+    return data.VarValue(value, FRAME_INFO)
+
+
+def test_merge_keeps_frames_with_their_events():
+    first = [frame(1, 10), add(1, 13, 3), frame(1, 20)]
+    second = [frame(2, 11), add(2, 12, 2), frame(2, 14)]
+
+    merged = [(event["process"], event["time"]) for event in merge_events([first, second])]
+    assert merged == [(1, 10), (1, 13), (2, 11), (2, 12), (2, 14), (1, 20)]
+
+
+def test_merge_events_before_first_frame():
+    first = [add(1, 5, 1), frame(1, 30)]
+    second = [frame(2, 10), frame(2, 40)]
+
+    merged = [(event["process"], event["time"]) for event in merge_events([first, second])]
+    assert merged == [(1, 5), (2, 10), (1, 30), (2, 40)]
+
+
+def test_combine_histories_by_time():
+    three, nine, two, four = map(var_value, (3, 9, 2, 4))
+    first = data.VarValues(three, nine)
+    second = data.VarValues(two, four)
+
+    value_times = ValueTimes()
+    events = [
+        var_values(2, 20, two, new=True),
+        var_values(1, 30, three, new=True),
+        var_values(2, 40, four),
+        var_values(1, 50, nine),
+    ]
+    for event in events:
+        value_times.add_event(event)
+
+    summaries = [(1, {"var_history": [(V, first)]}), (2, {"var_history": [(V, second)]})]
+    combine_summaries(summaries, value_times)
+
+    ((var, values),) = summaries[0][1]["var_history"]
+    assert var == V
+    assert [value.value for value in values] == [2, 3, 4, 9]
+
+
+def test_combine_exec_times():
+    summaries = [(1, {"frame_exec_times": [("a", [1])]}), (2, {"frame_exec_times": [("a", [2]), ("b", [3])]})]
+    combine_summaries(summaries, ValueTimes())
+
+    assert summaries[0][1]["frame_exec_times"] == [("a", [1, 2]), ("b", [3])]
+
+
+def write_events(writer, process, events):
+    for step, event in enumerate(events, start=1):
+        event.update(step=step, process=process, frame_info=FRAME_INFO, task=None)
+        if event["event"] == ADD_VARIABLE:
+            event.update(var_name="v", var=V, action="added", plural=False)
+
+        writer.append_event(event)
+
+
+def test_merge_json_lines_shards(tmp_path):
+    output_path = tmp_path / "merged.jsonl"
+    shard_dir = tmp_path / "shards"
+    shard_dir.mkdir()
+
+    main = JsonLinesWriter(output_path, shard_dir=shard_dir)
+    write_events(main, main.process_id, [frame(0, 10), add(0, 13, 3), frame(0, 20)])
+    child = JsonLinesWriter(shard_dir / "12345.jsonl")
+    write_events(child, 12345, [frame(0, 11), add(0, 12, 2), frame(0, 14)])
+    child.close()
+    main.close()
+
+    events = list(recording.read_events(output_path, {}))
+    merged = [(event["process"] == main.process_id, event["thread"], event["time"]) for event in events]
+    assert merged == [(True, 0, 10), (True, 0, 13), (False, 1, 11), (False, 1, 12), (False, 1, 14), (True, 0, 20)]
+    assert [event["step"] for event in events] == list(range(1, 7))
@@ -0,0 +1,135 @@
+import pytest
+from click.testing import CliRunner
+from conftest import FORMATS, V1_RECORDING, record
+
+from vardbg.main import cli
+from vardbg.query import UNDEFINED, RecordingQuery
+
+SEARCH_INPUT = [1, 3, 5, 7, 9, 11, 13]
+
+
+def search(lst, target):
+    lo = 0
+    hi = len(lst) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if lst[mid] < target:
+            lo = mid + 1
+        elif lst[mid] > target:
+            hi = mid - 1
+        else:
+            return mid
+
+    return -1
+
+
+@pytest.fixture(scope="module", params=FORMATS)
+def path(request, tmp_path_factory):
+    # Searching for a missing number ends with lo > hi
+    return record(tmp_path_factory.mktemp("query") / f"search{request.param}", search, SEARCH_INPUT, 4)
+
+
+def values(changes):
+    return [change.value for change in changes]
+
+
+def test_timeline(path):
+    query = RecordingQuery(path)
+    assert values(query.timeline("lo")) == [0, 2]
+    assert values(query.timeline("hi")) == [6, 2, 1]
+    assert values(query.timeline("mid")) == [3, 1, 2]
+    assert values(query.timeline("missing")) == []
+
+
+def test_expression_timeline(path):
+    query = RecordingQuery(path)
+    # Expressions are only reported when their value changes
+    assert values(query.timeline("lst[mid]")) == [7, 3, 5]
+    assert values(query.timeline("hi - lo")) == [6, 2, 0, -1]
+
+
+def test_timeline_steps(path):
+    query = RecordingQuery(path)
+    timeline = query.timeline("hi")
+    steps = [change.step for change in timeline]
+
+    assert steps == sorted(steps)
+    assert steps == query.changes("hi")
+    assert [change.file_line.split(":")[-1] for change in timeline] == ["13", "19", "19"]
+    assert all(change.var.name == "hi" and change.var.function == "search" for change in timeline)
+
+
+def test_first_and_last_change(path):
+    query = RecordingQuery(path)
+    assert query.first_change("mid").value == 3
+    assert query.last_change("mid").value == 2
+    assert query.last_change("hi").step == query.timeline("hi")[-1].step
+    assert query.last_change("lst[mid]").value == 5
+    assert query.first_change("missing") is None
+    assert query.last_change("missing") is None
+
+
+def test_function_filter(path):
+    query = RecordingQuery(path)
+    assert values(query.timeline("mid", function="search")) == [3, 1, 2]
+    assert query.timeline("mid", function="other") == []
+    assert query.changes("lo", function="other") == []
+
+
+def test_find(path):
+    query = RecordingQuery(path)
+
+    (match,) = query.find("lo > hi")
+    assert match.step == query.last_change("hi").step
+    # Matches have the values of the variables in the expression
+    assert match.value == {"lo": 2, "hi": 1}
+
+    assert [change.value["mid"] for change in query.find("lst[mid] > target")] == [3, 2]
+    assert query.find("missing > 0") == []
+
+
+def test_undefined(path):
+    query = RecordingQuery(path)
+    # Variables that aren't defined yet make expressions undefined, which doesn't count as a change
+    assert all(value is not UNDEFINED for value in values(query.timeline("lst[mid]")))
+
+
+def test_command(path):
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["query", str(path), "hi"])
+    assert result.exit_code == 0
+    assert [line.rsplit("| ", 1)[1] for line in result.output.splitlines()] == ["hi = 6", "hi = 2", "hi = 1"]
+
+    result = runner.invoke(cli, ["query", str(path), "lst[mid]", "--last"])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[0].endswith("(search) | lst[mid] = 5")
+
+    result = runner.invoke(cli, ["query", str(path), "mid", "--first"])
+    assert result.output.splitlines()[0].endswith("| mid = 3")
+
+    result = runner.invoke(cli, ["query", str(path), "-w", "lo > hi"])
+    (line,) = result.output.splitlines()
+    assert line.endswith("(search) | lo = 2, hi = 1")
+
+
+def test_command_invalid_expression(path):
+    result = CliRunner().invoke(cli, ["query", str(path), "lo >"])
+    assert result.exit_code != 0
+    assert "Invalid expression" in result.output
+
+
+def test_v1_recording():
+    query = RecordingQuery(V1_RECORDING)
+    assert [(change.step, change.value) for change in query.timeline("x")] == [(4, 1), (6, 2), (8, 3), (29, UNDEFINED)]
+    assert values(query.timeline("lst")) == [[1], [1, 2], [5, 2], [5]]
+    assert values(query.timeline("len(d)")) == [1, 2, 1]
+    assert query.last_change("s").value == {1, 2}
+
+    result = CliRunner().invoke(cli, ["query", str(V1_RECORDING), "x"])
+    assert [line.rsplit("| ", 1)[1] for line in result.output.splitlines()] == [
+        "x = 1",
+        "x = 2",
+        "x = 3",
+        "x = <undefined>",
+    ]
@@ -0,0 +1,131 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from vardbg import snapshot
+
+
+class Point:
+    def __init__(self, x):
+        self.x = x
+
+
+def test_copy_objects():
+    point = Point([1, 2])
+    copied = snapshot.copy_value(point)
+    assert type(copied) is Point
+    assert copied is not point
+    assert copied.x == point.x and copied.x is not point.x
+
+
+def test_copyable_verdicts_are_cached_by_type():
+    snapshot.copy_value(Point(1))
+    assert snapshot._copyable_types[Point]
+
+
+def test_uncopyable_values():
+    lock = threading.Lock()
+    copied = snapshot.copy_value([1, lock])
+    assert type(copied) is snapshot.Uncopyable
+    assert copied.value[1] is lock
+
+
+def test_connections_are_not_copied():
+    # Copies of connections close their file descriptors when they're destroyed
+    first, second = multiprocessing.Pipe()
+    try:
+        for conn in (first, second):
+            copied = snapshot.copy_value(conn)
+            assert type(copied) is snapshot.Uncopyable
+            assert copied.value is conn
+
+        first.send([1, 2])
+        assert second.recv() == [1, 2]
+    finally:
+        first.close()
+        second.close()
+
+
+@pytest.mark.parametrize(
+    "before, after",
+    [
+        (1, True),
+        (1, 1.0),
+        ([1, 1], [1, True]),
+        ([1, 2, 3], [1, 2.0, 3]),
+        ((1, [2]), (1, [2.0])),
+        ({"a": 1}, {"a": True}),
+        ({1: "a"}, {True: "a"}),
+        ({1, 2}, {True, 2}),
+        ({1, 2.0}, {1.0, 2}),
+        ({(1, (2,))}, {(1, (2.0,))}),
+        ({1: "a", 2.0: "b"}, {2: "b", 1: "a"}),
+        ([[0, 0], [0, 0]], [[0, 0], [0, False]]),
+    ],
+)
+def test_changed_types_are_detected(before, after):
+    assert before == after
+    assert not snapshot.is_equal(before, after)
+
+    comparable = set()
+    prev_locals, _ = snapshot.take({"x": before}, {}, comparable)
+    _, changed = snapshot.take({"x": after}, prev_locals, comparable)
+    assert changed == ["x"]
+
+
+def ordered_set(*values):
+    result = set()
+    for value in values:
+        result.add(value)
+
+    return result
+
+
+def test_unordered_types_are_compared_regardless_of_order():
+    # 1 and 9 collide in small sets, so the one that's added first comes first
+    assert list(ordered_set(1, 9)) != list(ordered_set(9, 1))
+    assert snapshot.is_equal(ordered_set(1, 9), ordered_set(9, 1))
+    assert snapshot.is_equal(ordered_set(1, 9.0), ordered_set(9.0, 1))
+    assert not snapshot.is_equal(ordered_set(1, 9.0), ordered_set(9, 1.0))
+
+    assert snapshot.is_equal({1: "a", 2.0: "b"}, {2.0: "b", 1: "a"})
+    assert snapshot.is_equal([{"k": {1, 9}}], [{"k": ordered_set(9, 1)}])
+
+
+def test_unchanged_values_are_reused():
+    values = {"n": 10**20, "lst": list(range(100)), "nested": {"a": [1, (2, 3)], "b": {4}}, "point": Point(1)}
+    comparable = set()
+    prev_locals, changed = snapshot.take(values, {}, comparable)
+    assert changed == list(values)
+    assert comparable == {"n", "lst", "nested"}
+
+    # Equal values are kept from the previous snapshot, but objects that can't be compared are always copied
+    new_locals, changed = snapshot.take(dict(values, n=int("1" + "0" * 20)), prev_locals, comparable)
+    assert changed == ["point"]
+    assert all(new_locals[name] is prev_locals[name] for name in ("n", "lst", "nested"))
+
+
+def test_changed_containers():
+    lst = list(range(100))
+    comparable = set()
+    prev_locals, _ = snapshot.take({"lst": lst}, {}, comparable)
+    assert prev_locals["lst"] == lst and prev_locals["lst"] is not lst
+
+    for change in (lambda: lst.append(1), lambda: lst.__setitem__(0, -1), lambda: lst.__setitem__(37, -1)):
+        change()
+        new_locals, changed = snapshot.take({"lst": lst}, prev_locals, comparable)
+        assert changed == ["lst"]
+        assert new_locals["lst"] == lst and new_locals["lst"] is not lst
+        prev_locals = new_locals
+
+
+def test_comparable_values():
+    nested = [1, [2, (3, frozenset((4,)))], {"a": {"b": None}}]
+    assert snapshot.is_comparable(nested)
+    assert not snapshot.is_comparable([1, [2, Point(3)]])
+    assert not snapshot.is_comparable({"a": [Point(1)]})
+
+    cyclic = [1]
+    cyclic.append(cyclic)
+    assert not snapshot.is_comparable(cyclic)
@@ -0,0 +1,183 @@
+import pytest
+from conftest import FORMATS, V1_RECORDING, record
+
+from vardbg import Debugger, debugger, index, recording
+from vardbg.state import State
+
+
+def snapshot(state):
+    # VarValues don't compare by value, so they're compared by their contents
+    values = {var: (repr(value.value), value.file_line) for var, value in state.values.items()}
+    return state.step, values, state.frames, state.outputs
+
+
+def replay_to(path, step):
+    state = State()
+    for event in recording.read_events(path, {}):
+        if event["step"] > step:
+            break
+
+        state.apply(event)
+
+    return state
+
+
+@pytest.fixture(scope="module")
+def sample_steps(recordings):
+    rec_index = recording.load_index(recordings[".vardbg"])
+    steps = {0, 1, rec_index.last_step}
+    for _, first_step, _ in rec_index.blocks:
+        # Steps at and around keyframes, and between them
+        steps.update((first_step - 1, first_step, first_step + 1, first_step + 13))
+
+    return sorted(step for step in steps if 0 <= step <= rec_index.last_step)
+
+
+@pytest.mark.parametrize("suffix", FORMATS)
+def test_state_at(recordings, sample_steps, suffix):
+    path = recordings[suffix]
+    dbg = Debugger()
+
+    for step in sample_steps:
+        assert snapshot(dbg.state_at(path, step)) == snapshot(replay_to(path, step))
+
+
+def test_state_at_matches_across_formats(recordings, sample_steps):
+    dbg = Debugger()
+    for step in sample_steps:
+        states = [snapshot(dbg.state_at(recordings[suffix], step)) for suffix in FORMATS]
+        assert states[0] == states[1] == states[2]
+
+
+def test_state_at_in_any_order(recordings, sample_steps):
+    path = recordings[".vardbg"]
+    dbg = Debugger()
+
+    # The last block read is kept, so jumping around must not mix up states
+    for step in reversed(sample_steps):
+        assert snapshot(dbg.state_at(path, step)) == snapshot(replay_to(path, step))
+
+
+def test_state_after_last_step(recordings):
+    path = recordings[".jsonl"]
+    last_step = recording.load_index(path).last_step
+    assert snapshot(Debugger().state_at(path, last_step + 100)) == snapshot(replay_to(path, last_step))
+
+
+def test_step_backward(recordings, sample_steps):
+    path = recordings[".jsonl"]
+    dbg = Debugger()
+    state = dbg.state_at(path, sample_steps[-1])
+
+    for steps in (1, 1, 5, 40, 100):
+        state = dbg.step_backward(path, state, steps)
+        assert snapshot(state) == snapshot(replay_to(path, state.step))
+
+    assert dbg.step_backward(path, state, 10_000).step == 0
+
+
+def test_keyframes(recordings):
+    path = recordings[".vardbg"]
+    rec_index = recording.load_index(path)
+
+    # Each keyframe holds the state right before the first event of its block
+    for block in range(len(rec_index.blocks)):
+        keyframe, _ = recording.read_block(path, rec_index, block)
+        first_step = rec_index.blocks[block][1]
+        state = State.from_keyframe(first_step - 1, keyframe)
+        assert snapshot(state) == snapshot(replay_to(path, first_step - 1))
+
+
+def print_squares():
+    for i in range(20):
+        square = i * i
+        print(square)
+
+
+SQUARES_OUTPUT = "".join(f"{i * i}\n" for i in range(20))
+
+
+@pytest.fixture(scope="module")
+def printed(tmp_path_factory):
+    """Map of extensions to recordings of a function that prints in every iteration"""
+
+    tmp_dir = tmp_path_factory.mktemp("printed")
+    return {suffix: record(tmp_dir / f"print_squares{suffix}", print_squares) for suffix in FORMATS}
+
+
+@pytest.mark.parametrize("suffix", FORMATS)
+def test_state_output(printed, suffix):
+    path = printed[suffix]
+    last_step = replay_to(path, float("inf")).step
+    dbg = Debugger()
+
+    for step in range(0, last_step + 1, 7):
+        assert dbg.state_at(path, step).outputs == replay_to(path, step).outputs
+    assert list(dbg.state_at(path, last_step).outputs.values()) == [SQUARES_OUTPUT]
+
+
+@pytest.mark.parametrize("suffix", FORMATS)
+def test_filtered_replay_output(printed, tmp_path, suffix):
+    path = printed[suffix]
+    from_step = replay_to(path, float("inf")).step // 2
+
+    # Replaying into another recording shows what the writers get
+    replayed = tmp_path / "replayed.jsonl"
+    with Debugger(json_out_path=str(replayed), quiet=True) as dbg:
+        dbg.replay(path, from_step=from_step)
+
+    # Output printed before the first replayed step comes with the first replayed frame
+    events = list(recording.read_events(replayed, {}))
+    assert len(events) < len(list(recording.read_events(path, {})))
+    assert "".join(event.get("new_output", "") for event in events) == SQUARES_OUTPUT
+
+
+# Values of the variables in the version 1 recording after some of its steps
+V1_VALUES = {
+    3: {},
+    4: {"x": 1},
+    8: {"x": 3},
+    12: {"x": 3, "lst": [1, 2]},
+    14: {"x": 3, "lst": [5, 2]},
+    16: {"x": 3, "lst": [5]},
+    20: {"x": 3, "lst": [5], "d": {"a": 1, "b": 2}},
+    22: {"x": 3, "lst": [5], "d": {"a": 1}},
+    26: {"x": 3, "lst": [5], "d": {"a": 1}, "s": {1, 2}},
+    29: {"lst": [5], "d": {"a": 1}, "s": {1, 2}},
+}
+
+
+def v1_values(state):
+    return {var.name: value.value for var, value in state.values.items()}
+
+
+@pytest.fixture(scope="module")
+def v1_streamed(tmp_path_factory):
+    # Blocks are kept tiny so that the converted recording has several keyframes
+    path = tmp_path_factory.mktemp("v1") / "v1.vardbg"
+    block_events = index.BLOCK_EVENTS
+    index.BLOCK_EVENTS = 4
+    try:
+        debugger.convert(V1_RECORDING, path)
+    finally:
+        index.BLOCK_EVENTS = block_events
+
+    return path
+
+
+def test_v1_state(v1_streamed):
+    dbg = Debugger()
+    for path in (V1_RECORDING, v1_streamed):
+        for step, values in V1_VALUES.items():
+            assert v1_values(dbg.state_at(path, step)) == values
+
+    # Values are attributed to the lines that changed them
+    state = dbg.state_at(V1_RECORDING, 8)
+    assert [value.file_line.rsplit(":", 1)[1] for value in state.values.values()] == ["7"]
+
+
+def test_v1_index(v1_streamed):
+    rec_index = recording.load_index(v1_streamed)
+    assert len(rec_index.blocks) > 1
+    assert rec_index.change_steps("x") == [4, 6, 8, 29]
+    assert rec_index.change_steps("lst") == [10, 12, 14, 16]
@@ -0,0 +1,39 @@
+from vardbg.suppressor import Suppressor
+
+KEY = ("code", 1)
+
+
+def checked_executions(suppressor, count):
+    return [n for n in range(1, count + 1) if suppressor.should_snapshot(KEY)]
+
+
+def test_quiet_lines_are_suppressed_and_rechecked():
+    suppressor = Suppressor(3, 4)
+    assert checked_executions(suppressor, 20) == [1, 2, 3, 7, 11, 15, 19]
+    assert suppressor.quiet_counts[KEY] == 20
+
+
+def test_executions_are_counted_once():
+    suppressor = Suppressor(2, 3)
+    for _ in range(5):
+        if suppressor.should_snapshot(KEY):
+            suppressor.record(KEY, False)
+
+    # Recording a snapshot without changes doesn't count the execution again
+    assert suppressor.quiet_counts[KEY] == 5
+
+
+def test_will_check_predicts_snapshots():
+    suppressor = Suppressor(3, 4)
+    for _ in range(20):
+        will_check = suppressor.will_check(KEY)
+        assert suppressor.should_snapshot(KEY) == will_check
+
+
+def test_changed_lines_are_never_suppressed():
+    suppressor = Suppressor(2, 100)
+    checked_executions(suppressor, 10)
+    suppressor.record(KEY, True)
+
+    assert checked_executions(suppressor, 10) == list(range(1, 11))
+    assert not suppressor.will_check(KEY)
@@ -0,0 +1,281 @@
+import asyncio
+import sys
+import threading
+import time
+
+from vardbg import Debugger, index, recording, tracer
+from vardbg.output.json_writer import ADD_VARIABLE, CHANGE_VARIABLE, EXECUTE_FRAME, NEW_FRAME, REMOVE_VARIABLE
+
+
+def trace(tmp_path, func, **options):
+    path = tmp_path / "recording.jsonl"
+    with Debugger(json_out_path=str(path), quiet=True, **options) as dbg:
+        dbg.run(func)
+
+    return list(recording.read_events(path, {}))
+
+
+def frames(events):
+    return [event for event in events if event["event"] == NEW_FRAME]
+
+
+async def double(n):
+    x = n
+    await asyncio.sleep(0)
+    return x * 2
+
+
+async def gather_doubles():
+    return await asyncio.gather(asyncio.create_task(double(1), name="one"), asyncio.create_task(double(2), name="two"))
+
+
+def run_tasks():
+    return asyncio.run(gather_doubles())
+
+
+def test_task_names(tmp_path):
+    tasks = {}
+    for event in frames(trace(tmp_path, run_tasks)):
+        tasks.setdefault(event["frame_info"].function, set()).add(event["task"])
+
+    assert tasks["run_tasks"] == {None}
+    assert tasks["double"] == {"one", "two"}
+    assert len(tasks["gather_doubles"]) == 1 and None not in tasks["gather_doubles"]
+
+
+def count_down(n):
+    while n > 0:
+        tens = n * 10
+        yield tens
+        n -= 1
+
+
+def consume_generators():
+    total = 0
+    for value in count_down(3):
+        total += value
+
+    # Generators that are closed or have exceptions thrown into them while suspended
+    closed = count_down(5)
+    next(closed)
+    closed.close()
+
+    thrown = count_down(5)
+    next(thrown)
+    try:
+        thrown.throw(ValueError)
+    except ValueError:
+        pass
+
+    return total
+
+
+def test_generator_locals(tmp_path):
+    changes = []
+    for event in trace(tmp_path, consume_generators):
+        if event["event"] == ADD_VARIABLE and index.event_function(event) == "count_down":
+            changes.append((ADD_VARIABLE, event["var_name"], event["value"]))
+        elif event["event"] == CHANGE_VARIABLE and index.event_function(event) == "count_down":
+            changes.append((CHANGE_VARIABLE, event["var_name"], event["value_after"]))
+        elif event["event"] == REMOVE_VARIABLE and index.event_function(event) == "count_down":
+            changes.append((REMOVE_VARIABLE, event["var_name"], event["value"]))
+
+    # Locals are kept across yields, so resuming a generator only reports the changes made since it was suspended
+    assert changes == [
+        (ADD_VARIABLE, "n", 3),
+        (ADD_VARIABLE, "tens", 30),
+        (CHANGE_VARIABLE, "n", 2),
+        (CHANGE_VARIABLE, "tens", 20),
+        (CHANGE_VARIABLE, "n", 1),
+        (CHANGE_VARIABLE, "tens", 10),
+        (CHANGE_VARIABLE, "n", 0),
+        # The closed generator
+        (ADD_VARIABLE, "n", 5),
+        (ADD_VARIABLE, "tens", 50),
+        # The generator that an exception was thrown into
+        (ADD_VARIABLE, "n", 5),
+        (ADD_VARIABLE, "tens", 50),
+    ]
+
+
+def late_change():
+    total = 0
+    for i in range(12):
+        total = max(total, i - 8)
+
+    return total
+
+
+def test_suppressed_line_changes_on_its_own_line(tmp_path):
+    line = late_change.__code__.co_firstlineno + 3
+    changes = []
+    for event in trace(tmp_path, late_change, suppress_after=3, recheck_interval=100):
+        if event["event"] == NEW_FRAME:
+            frame_info = event["frame_info"]
+        elif event["event"] == CHANGE_VARIABLE and event["var_name"] == "total":
+            changes.append((frame_info.line, event["value_after"]))
+
+    assert changes == [(line, 1), (line, 2), (line, 3)]
+
+
+def late_append():
+    lst = []
+    for i in range(12):
+        lst += [i] * (i > 6)
+
+    return lst
+
+
+def test_suppressed_line_mutations_are_rechecked(tmp_path):
+    line = late_append.__code__.co_firstlineno + 3
+    changes = []
+    for event in trace(tmp_path, late_append, suppress_after=3, recheck_interval=2):
+        if event["event"] == NEW_FRAME:
+            frame_info = event["frame_info"]
+        elif event["event"] in (ADD_VARIABLE, CHANGE_VARIABLE) and event["var_name"].startswith("lst["):
+            changes.append(frame_info.line)
+
+    # Changes made in place between rechecks are found by the next snapshot, but the recheck only diffs the line
+    # itself, so it's never suppressed again afterwards
+    assert changes[-4:] == [line] * 4
+
+
+def frame_getter(path, module):
+    """Returns a function that returns its own frame, which appears to belong to the given file and module"""
+
+    namespace = {"__name__": module, "sys": sys}
+    exec(compile("def get_frame():\n    return sys._getframe()\n", str(path), "exec"), namespace)
+    return namespace["get_frame"]
+
+
+def frame_in(path, module):
+    return frame_getter(path, module)()
+
+
+SITE_PATH = next(iter(tracer.SITE_DIRS)) / "pkg" / "mod.py"
+
+
+def test_match_any():
+    assert tracer._match_any(("app.*",), "app.main", "/src/app/main.py")
+    assert tracer._match_any(("*/vendor/*",), "lib", "/src/vendor/lib.py")
+    assert not tracer._match_any(("app.*", "*/vendor/*"), "lib", "/src/lib.py")
+    assert not tracer._match_any((), "app.main", "/src/app/main.py")
+
+
+def test_exclude_beats_include():
+    dbg = Debugger(quiet=True, include=["app.*"], exclude=["app.secret", "*/generated/*"])
+    assert dbg._get_verdict(frame_in("/src/app/main.py", "app.main"))
+    assert not dbg._get_verdict(frame_in("/src/app/secret.py", "app.secret"))
+    assert not dbg._get_verdict(frame_in("/src/generated/app.py", "app.models"))
+
+
+def test_library_code_is_skipped_unless_included():
+    assert Debugger(quiet=True)._get_verdict(frame_in("/src/main.py", "main"))
+    assert not Debugger(quiet=True)._get_verdict(frame_in(SITE_PATH, "pkg.mod"))
+    assert not Debugger(quiet=True)._get_verdict(frame_in(tracer.STDLIB_DIR / "json" / "x.py", "json.x"))
+
+    assert Debugger(quiet=True, include=["pkg.*"])._get_verdict(frame_in(SITE_PATH, "pkg.mod"))
+    assert Debugger(quiet=True, include=["*/pkg/*"])._get_verdict(frame_in(SITE_PATH, "pkg.mod"))
+
+
+get_helper_frame = frame_getter("/src/helpers.py", "helpers")
+
+
+def call_excluded():
+    frame = get_helper_frame()
+    return frame.f_code.co_name
+
+
+def test_excluded_calls_are_part_of_the_calling_line(tmp_path):
+    events = trace(tmp_path, call_excluded, exclude=["helpers"], profiler_output=True)
+    assert {event["frame_info"].function for event in frames(events)} == {"call_excluded"}
+
+    # The excluded call is executed and timed as part of the line that makes it
+    line = call_excluded.__code__.co_firstlineno + 1
+    assert line in {event["frame_info"].line for event in events if event["event"] == EXECUTE_FRAME}
+
+
+def sleep_briefly():
+    time.sleep(0.02)
+
+
+def call_sleep():
+    sleep_briefly()
+
+
+def exec_times(events):
+    return {
+        (event["frame_info"].function, event["frame_info"].line): event["exec_time"]
+        for event in events
+        if event["event"] == EXECUTE_FRAME
+    }
+
+
+def test_max_depth(tmp_path):
+    events = trace(tmp_path, call_sleep, max_depth=0, profiler_output=True)
+    assert {event["frame_info"].function for event in frames(events)} == {"call_sleep"}
+
+    # Time spent in frames below the maximum depth is attributed to the line that calls them
+    line = call_sleep.__code__.co_firstlineno + 1
+    assert exec_times(events)["call_sleep", line] >= 20_000_000
+
+
+def test_calls_only(tmp_path):
+    events = trace(tmp_path, call_sleep, calls_only=True, profiler_output=True)
+
+    # Frames are only recorded for calls and returns, which are reported on the first line of each function
+    first_lines = {
+        ("call_sleep", call_sleep.__code__.co_firstlineno),
+        ("sleep_briefly", sleep_briefly.__code__.co_firstlineno),
+    }
+    assert {(event["frame_info"].function, event["frame_info"].line) for event in frames(events)} == first_lines
+
+    # Each function is profiled as a whole, including the functions that it calls
+    assert all(exec_times(events)[key] >= 20_000_000 for key in first_lines)
+
+
+def sum_range():
+    total = 0
+    for i in range(10):
+        total += i
+
+    return total
+
+
+def test_sample_every(tmp_path):
+    values = []
+    for event in trace(tmp_path, sum_range, sample_every=3):
+        if event["event"] == ADD_VARIABLE and event["var_name"] == "total":
+            values.append(event["value"])
+        elif event["event"] == CHANGE_VARIABLE and event["var_name"] == "total":
+            values.append(event["value_after"])
+
+    # Snapshots are taken before the 1st, 4th, 7th, and 10th execution of the loop body and when the function returns
+    assert values == [0, 3, 15, 36, 45]
+
+
+def print_count(name):
+    for i in range(3):
+        print(f"{name}{i}")
+
+
+def run_threads():
+    threads = [threading.Thread(target=print_count, args=(name,)) for name in "ab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_threads(tmp_path):
+    outputs = {}
+    threads = {}
+    for event in frames(trace(tmp_path, run_threads)):
+        outputs[event["thread"]] = outputs.get(event["thread"], "") + event.get("new_output", "")
+        threads.setdefault(event["frame_info"].function, set()).add(event["thread"])
+
+    # Each thread gets its own ID, and its output is recorded with its own frames
+    assert threads["run_threads"] == {0}
+    assert len(threads["print_count"]) == 2 and 0 not in threads["print_count"]
+    assert outputs[0] == ""
+    assert sorted(outputs[thread] for thread in threads["print_count"]) == ["a0\na1\na2\n", "b0\nb1\nb2\n"]
@@ -0,0 +1,118 @@
+import io
+
+import pytest
+from conftest import FORMATS, STREAMED_FORMATS, record
+
+from vardbg import binary, recording
+from vardbg.output.json_writer import UPDATE_VALUES
+
+# Sizes of lists around the boundaries of chunks
+SIZES = (0, 1, 15, 16, 17, 32, 33, 100)
+
+
+def containers(n):
+    lst = list(range(n))
+    tup = tuple(lst)
+    nested = [lst, tup]
+    lst.append(-1)
+    lst[n // 2] = -2
+
+
+def repeat():
+    a = list(range(40))
+    b = list(range(40))
+    a[20] = -1
+    c = list(range(40))
+
+
+def var_values(path):
+    # Values of all variables in the order that they were recorded
+    return [
+        (event["var"].name, type(value.value), value.value)
+        for event in recording.read_events(path, {})
+        if event["event"] == UPDATE_VALUES
+        for value in event["values"]
+    ]
+
+
+def encoded_values(*values):
+    encoder = binary.BinaryEncoder(io.BytesIO())
+    counts = []
+    for value in values:
+        encoder.write_event({"step": 1, "event": "test", "value": value})
+        counts.append(len(encoder.values))
+
+    return counts
+
+
+def encode_value(value):
+    file = io.BytesIO()
+    binary.BinaryEncoder(file).write_event({"step": 1, "event": "test", "value": value})
+    return file.getvalue()
+
+
+def value_definitions(path):
+    with recording.open_recording(path) as f:
+        return sum(1 for line in f if line.startswith('{"define": "value"'))
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_chunked_containers(tmp_path, n):
+    paths = [record(tmp_path / f"containers{suffix}", containers, n) for suffix in FORMATS]
+    expected = var_values(paths[0])
+
+    lst = list(range(n)) + [-1]
+    lst[n // 2] = -2
+    assert (list, lst) in [(value_type, value) for name, value_type, value in expected if name == "lst"]
+    assert ("tup", tuple, tuple(range(n))) in expected
+    assert ("nested", list, [list(range(n)), tuple(range(n))]) in expected
+
+    for path in paths[1:]:
+        assert var_values(path) == expected
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_binary_chunks(n):
+    for value in (list(range(n)), tuple(range(n)), [list(range(n))] * 2):
+        decoded = binary.read_records(io.BytesIO(encode_value(value)))
+        ((_, event),) = list(decoded)
+        assert type(event["value"]) is type(value)
+        assert event["value"] == value
+
+
+def test_binary_deduplication():
+    lst = list(range(40))
+    changed = list(lst)
+    changed[20] = -1
+
+    first, repeated, copied, one_changed, small = encoded_values(lst, lst, list(lst), changed, [1, 2])
+    # Chunks of 16 items are stored once, and the list of them is small enough to be written in place
+    assert first == 3
+    assert repeated == copied == first
+    assert one_changed == first + 1
+    assert small == one_changed
+
+
+def test_json_lines_deduplication(tmp_path):
+    path = record(tmp_path / "repeat.jsonl", repeat)
+    # The chunks of a and their list, plus a changed chunk and a new list of chunks
+    assert value_definitions(path) == 4 + 2
+    assert var_values(path) == var_values(record(tmp_path / "repeat.json", repeat))
+
+
+def test_values_are_defined_per_block(recordings):
+    # Blocks can be read on their own, so they define the values that they use again
+    for suffix in STREAMED_FORMATS:
+        path = recordings[suffix]
+        rec_index = recording.load_index(path)
+        expected = {event["step"]: event for event in recording.read_events(path, {})}
+
+        for block in range(len(rec_index.blocks)):
+            _, events = recording.read_block(path, rec_index, block)
+            for event in events:
+                for field in ("value", "value_before", "value_after"):
+                    assert event.get(field) == expected[event["step"]].get(field)
+                if event["event"] == UPDATE_VALUES:
+                    assert [value.value for value in event["values"]] == [
+                        value.value for value in expected[event["step"]]["values"]
+                    ]
@@ -0,0 +1,13 @@
+from .backend import Backend
+from .monitoring_backend import MonitoringBackend
+from .settrace_backend import SettraceBackend
+
+# Map of backend names (as exposed in the CLI) to their classes
+BACKENDS = {"settrace": SettraceBackend, "monitoring": MonitoringBackend}
+
+
+def get_backend(name):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown tracing backend '{name}'")
+
+    return BACKENDS[name]
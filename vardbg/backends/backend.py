@@ -0,0 +1,17 @@
+import abc
+
+
+class Backend(abc.ABC):
+    """Mechanism used to receive execution events from the interpreter"""
+
+    def __init__(self, tracer):
+        # Tracer that events are fed to
+        self.tracer = tracer
+
+    @abc.abstractmethod
+    def start(self):
+        pass
+
+    @abc.abstractmethod
+    def stop(self):
+        pass
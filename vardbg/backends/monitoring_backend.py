@@ -0,0 +1,139 @@
+import sys
+
+from .. import internal, timing
+from .backend import Backend
+
+TOOL_NAME = "vardbg"
+
+
+def _get_frame():
+    # Frame that triggered the event: skip this helper and the callback itself
+    return sys._getframe(2)
+
+
+class MonitoringBackend(Backend):
+    """
+    Backend built on sys.monitoring (PEP 669), available on Python 3.12 and newer.
+
+    Only PY_START/PY_RESUME are enabled globally. Code that should be traced gets line and return events
+    enabled locally, so the interpreter never calls back into the lines of other code. Rejected code isn't disabled
+    with DISABLE because disabled locations can only be re-enabled with restart_events(), which would re-enable the
+    locations that other tools disabled too.
+    """
+
+    def __init__(self, tracer):
+        if not hasattr(sys, "monitoring"):
+            raise RuntimeError("The sys.monitoring tracing backend requires Python 3.12 or newer")
+
+        super().__init__(tracer)
+
+        # Tool ID reserved for debuggers by PEP 669
+        self.tool_id = sys.monitoring.DEBUGGER_ID
+        # Code objects with local events enabled
+        self.traced_codes = set()
+        # Code objects that shouldn't be traced, which are ignored without looking at their frames
+        self.rejected_codes = set()
+
+    def _local_events(self):
+        events = sys.monitoring.events
+        local_events = events.PY_RETURN | events.PY_YIELD
+
+        # Line events are never needed in calls-only mode
+        if not self.tracer.calls_only:
+            local_events |= events.LINE
+
+        return local_events
+
+    def _callbacks(self):
+        events = sys.monitoring.events
+        return {
+            events.PY_START: self.start_callback,
+            events.PY_RESUME: self.start_callback,
+            events.PY_THROW: self.throw_callback,
+            events.LINE: self.line_callback,
+            events.PY_RETURN: self.return_callback,
+            events.PY_YIELD: self.yield_callback,
+            events.PY_UNWIND: self.unwind_callback,
+        }
+
+    def start(self):
+        mon = sys.monitoring
+        events = mon.events
+
+        mon.use_tool_id(self.tool_id, TOOL_NAME)
+        for event, callback in self._callbacks().items():
+            mon.register_callback(self.tool_id, event, callback)
+
+        mon.set_events(self.tool_id, events.PY_START | events.PY_RESUME | events.PY_THROW | events.PY_UNWIND)
+
+    def stop(self):
+        mon = sys.monitoring
+
+        mon.set_events(self.tool_id, 0)
+        for code in self.traced_codes:
+            mon.set_local_events(self.tool_id, code, 0)
+        self.traced_codes.clear()
+        self.rejected_codes.clear()
+
+        for event in self._callbacks():
+            mon.register_callback(self.tool_id, event, None)
+        mon.free_tool_id(self.tool_id)
+
+    def start_callback(self, code, offset):
+        # Get time as early as possible
+        call_time = timing.profiler_time()
+
+        if code in self.rejected_codes:
+            return
+
+        frame = _get_frame()
+        if code not in self.traced_codes:
+            if not self.tracer.should_trace(frame):
+                self.rejected_codes.add(code)
+                return
+
+            self.traced_codes.add(code)
+            sys.monitoring.set_local_events(self.tool_id, code, self._local_events())
+
+        self._enter(frame, call_time)
+
+    def throw_callback(self, code, offset, exception):
+        # Non-local event, so it can't be disabled; ignore it unless the code is being traced
+        if code in self.traced_codes:
+            self._enter(_get_frame(), timing.profiler_time())
+
+    def line_callback(self, code, line_number):
+        call_time = timing.profiler_time()
+        if not self.tracer.get_thread_state().skipped_depth:
+            self.tracer.trace_event(_get_frame(), "line", call_time)
+
+    def return_callback(self, code, offset, retval):
+        call_time = timing.profiler_time()
+        self._exit(_get_frame(), "return", call_time)
+
+    def yield_callback(self, code, offset, retval):
+        call_time = timing.profiler_time()
+        self._exit(_get_frame(), "yield", call_time)
+
+    def unwind_callback(self, code, offset, exception):
+        # Frames exiting with an exception are returns as far as scopes are concerned
+        if code in self.traced_codes:
+            self._exit(_get_frame(), "return", timing.profiler_time())
+
+    def _enter(self, frame, call_time):
+        # Local events can't be disabled per frame, so frames that are too deep are skipped along with all of
+        # their events until they return
+        state = self.tracer.get_thread_state()
+        if state.skipped_depth or self.tracer.depth_exceeded(state):
+            state.skipped_depth += 1
+        else:
+            self.tracer.trace_event(frame, "call", call_time)
+
+    def _exit(self, frame, event, call_time):
+        state = self.tracer.get_thread_state()
+        if state.skipped_depth:
+            state.skipped_depth -= 1
+        else:
+            self.tracer.trace_event(frame, event, call_time)
+
+    internal.add_funcs(start, stop)
@@ -0,0 +1,20 @@
+import sys
+import threading
+
+from .. import internal
+from .backend import Backend
+
+
+class SettraceBackend(Backend):
+    """Classic backend that invokes a global trace function for every event"""
+
+    def start(self):
+        # Also trace threads started by the debugged program
+        threading.settrace(self.tracer.trace_callback)
+        sys.settrace(self.tracer.trace_callback)
+
+    def stop(self):
+        sys.settrace(None)
+        threading.settrace(None)
+
+    internal.add_funcs(start, stop)
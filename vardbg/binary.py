@@ -0,0 +1,665 @@
+import hashlib
+import struct
+
+import jsonpickle
+
+from . import data
+
+# Bytes that binary recordings start with
+MAGIC = b"VARDBG\x00"
+# Size of the chunks that recordings are read in
+CHUNK_SIZE = 1 << 20
+# Strings in event fields up to this length are interned in the string table, since they're likely to repeat
+INTERN_MAX_LEN = 64
+# Containers that are encoded in at least this many bytes are stored once per block in the value table
+STORE_MIN_SIZE = 16
+# Lists and tuples longer than this are split into chunks that are stored separately, so that values which only
+# differ in a few elements share most of their chunks
+CHUNK_ITEMS = 16
+
+# Record types: definitions of interned objects, which are numbered in order, as well as events and metadata
+REC_STRING = 0
+REC_FRAME = 1
+REC_VARIABLE = 2
+REC_EVENT = 3
+REC_METADATA = 4
+# Start of a block, after which all objects are defined again and deltas start over so that reading can start there
+REC_BLOCK = 5
+# State of the program at the start of a block, which follows the block record along with its definitions
+REC_KEYFRAME = 6
+# Stored value, identified by its index in the value table
+REC_VALUE = 7
+
+# Value tags
+T_NONE = 0
+T_FALSE = 1
+T_TRUE = 2
+T_INT = 3
+T_FLOAT = 4
+T_COMPLEX = 5
+T_STR = 6
+T_BYTES = 7
+T_LIST = 8
+T_TUPLE = 9
+T_SET = 10
+T_FROZENSET = 11
+T_DICT = 12
+T_RANGE = 13
+T_NAME = 14  # Interned string
+T_FRAME = 15
+T_VARIABLE = 16
+T_VAR_VALUE = 17
+T_VAR_VALUES = 18
+T_OBJECT = 19  # Anything else, encoded with jsonpickle
+T_STORED = 20  # Reference to a stored value
+T_CHUNKED = 21  # List or tuple made up of stored chunks
+T_VAR_HISTORY = 22
+
+# Event fields that are encoded as deltas from the previous event, in the order of their flag bits
+DELTA_FIELDS = ("step", "time", "process")
+
+_DOUBLE = struct.Struct("<d")
+_COMPLEX = struct.Struct("<dd")
+
+_SEQUENCE_TAGS = {list: T_LIST, tuple: T_TUPLE, set: T_SET, frozenset: T_FROZENSET}
+
+
+def _write_uint(buf, num):
+    # LEB128 varint
+    while num >= 0x80:
+        buf.append((num & 0x7F) | 0x80)
+        num >>= 7
+
+    buf.append(num)
+
+
+def _write_int(buf, num):
+    # Zigzag encoding keeps small negative numbers short
+    _write_uint(buf, num << 1 if num >= 0 else ((-num) << 1) - 1)
+
+
+class _CyclicValue(Exception):
+    pass
+
+
+class _Truncated(Exception):
+    pass
+
+
+class BinaryEncoder:
+    """
+    Writes events and metadata to a binary recording. Strings, frames, and variables are defined once in a record of
+    their own and then referenced by their index, and builtin values are encoded with a tag byte and varints.
+    Containers are stored the same way in a table of values keyed by the hash of their encoding, so values that repeat
+    (or long lists that only differ in a few chunks) are only written once per block.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self._reset()
+
+        # IDs of the containers that are currently being encoded, used to detect self-references
+        self.containers = set()
+
+        self.value_writers = {
+            type(None): self._write_none,
+            bool: self._write_bool,
+            int: self._write_int,
+            float: self._write_float,
+            complex: self._write_complex,
+            str: self._write_str,
+            bytes: self._write_bytes,
+            list: self._write_container,
+            tuple: self._write_container,
+            set: self._write_container,
+            frozenset: self._write_container,
+            dict: self._write_container,
+            range: self._write_range,
+            data.FrameInfo: self._write_frame,
+            data.Variable: self._write_variable,
+            data.VarValue: self._write_var_value,
+            data.VarValues: self._write_var_values,
+            data.VarHistory: self._write_var_history,
+        }
+
+        self.file.write(MAGIC)
+
+    def _reset(self):
+        # Maps of interned objects to their indices
+        self.strings = {}
+        self.frames = {}
+        self.variables = {}
+        # Map of hashes of the encodings of stored values to their indices
+        self.values = {}
+
+        # Fields of the last event, which the next one is encoded relative to
+        self.last_fields = {field: 0 for field in DELTA_FIELDS}
+
+    def _write_record(self, rec_type, buf):
+        self.file.write(bytes((rec_type,)))
+        self.file.write(buf)
+
+    def _string_ref(self, string):
+        ref = self.strings.get(string)
+        if ref is None:
+            ref = len(self.strings)
+            self.strings[string] = ref
+
+            buf = bytearray()
+            encoded = string.encode("utf-8", "surrogatepass")
+            _write_uint(buf, len(encoded))
+            buf += encoded
+            self._write_record(REC_STRING, buf)
+
+        return ref
+
+    def _frame_ref(self, frame_info):
+        ref = self.frames.get(frame_info)
+        if ref is None:
+            ref = len(self.frames)
+            self.frames[frame_info] = ref
+
+            # file_line is derived from the file and line when reading
+            buf = bytearray()
+            _write_uint(buf, self._string_ref(frame_info.function))
+            _write_uint(buf, self._string_ref(frame_info.file))
+            _write_uint(buf, frame_info.line)
+            _write_uint(buf, self._string_ref(frame_info.comment))
+            self._write_record(REC_FRAME, buf)
+
+        return ref
+
+    def _variable_ref(self, var):
+        ref = self.variables.get(var)
+        if ref is None:
+            ref = len(self.variables)
+            self.variables[var] = ref
+
+            buf = bytearray()
+            _write_uint(buf, self._string_ref(var.name))
+            _write_uint(buf, self._string_ref(var._file))
+            _write_uint(buf, self._string_ref(var.file_line))
+            _write_uint(buf, self._string_ref(var.function))
+            self._write_record(REC_VARIABLE, buf)
+
+        return ref
+
+    def _value_ref(self, encoded):
+        # Values are identified by their encoding, so equal values are only stored once
+        key = hashlib.blake2b(encoded, digest_size=16).digest()
+        ref = self.values.get(key)
+        if ref is None:
+            ref = len(self.values)
+            self.values[key] = ref
+
+            buf = bytearray()
+            _write_uint(buf, len(encoded))
+            buf += encoded
+            self._write_record(REC_VALUE, buf)
+
+        return ref
+
+    def _write_none(self, buf, value):
+        buf.append(T_NONE)
+
+    def _write_bool(self, buf, value):
+        buf.append(T_TRUE if value else T_FALSE)
+
+    def _write_int(self, buf, value):
+        buf.append(T_INT)
+        _write_int(buf, value)
+
+    def _write_float(self, buf, value):
+        buf.append(T_FLOAT)
+        buf += _DOUBLE.pack(value)
+
+    def _write_complex(self, buf, value):
+        buf.append(T_COMPLEX)
+        buf += _COMPLEX.pack(value.real, value.imag)
+
+    def _write_str(self, buf, value):
+        buf.append(T_STR)
+        encoded = value.encode("utf-8", "surrogatepass")
+        _write_uint(buf, len(encoded))
+        buf += encoded
+
+    def _write_bytes(self, buf, value):
+        buf.append(T_BYTES)
+        _write_uint(buf, len(value))
+        buf += value
+
+    def _enter(self, value):
+        # Containers that contain themselves can't be encoded as plain nested values
+        if id(value) in self.containers:
+            raise _CyclicValue
+        self.containers.add(id(value))
+
+    def _write_sequence(self, buf, value):
+        self._enter(value)
+        buf.append(_SEQUENCE_TAGS[type(value)])
+        _write_uint(buf, len(value))
+        for item in value:
+            self._write_value(buf, item)
+        self.containers.discard(id(value))
+
+    def _write_dict(self, buf, value):
+        self._enter(value)
+        buf.append(T_DICT)
+        _write_uint(buf, len(value))
+        for key, item in value.items():
+            self._write_value(buf, key)
+            self._write_value(buf, item)
+        self.containers.discard(id(value))
+
+    def _write_chunked(self, buf, value):
+        self._enter(value)
+        buf.append(T_CHUNKED)
+        buf.append(_SEQUENCE_TAGS[type(value)])
+        _write_uint(buf, (len(value) + CHUNK_ITEMS - 1) // CHUNK_ITEMS)
+        for start in range(0, len(value), CHUNK_ITEMS):
+            chunk = bytearray()
+            self._write_sequence(chunk, list(value[start : start + CHUNK_ITEMS]))
+            _write_uint(buf, self._value_ref(chunk))
+        self.containers.discard(id(value))
+
+    def _write_container(self, buf, value):
+        encoded = bytearray()
+        if type(value) in (list, tuple) and len(value) > CHUNK_ITEMS:
+            self._write_chunked(encoded, value)
+        elif type(value) is dict:
+            self._write_dict(encoded, value)
+        else:
+            self._write_sequence(encoded, value)
+
+        # Small containers take less space than references to them
+        if len(encoded) < STORE_MIN_SIZE:
+            buf += encoded
+        else:
+            buf.append(T_STORED)
+            _write_uint(buf, self._value_ref(encoded))
+
+    def _write_range(self, buf, value):
+        buf.append(T_RANGE)
+        _write_int(buf, value.start)
+        _write_int(buf, value.stop)
+        _write_int(buf, value.step)
+
+    def _write_frame(self, buf, value):
+        buf.append(T_FRAME)
+        _write_uint(buf, self._frame_ref(value))
+
+    def _write_variable(self, buf, value):
+        buf.append(T_VARIABLE)
+        _write_uint(buf, self._variable_ref(value))
+
+    def _write_var_value(self, buf, value):
+        buf.append(T_VAR_VALUE)
+        self._write_value(buf, value.value)
+        self._write_label(buf, value.file_line)
+
+    def _write_var_values(self, buf, value):
+        buf.append(T_VAR_VALUES)
+        buf.append(T_TRUE if value.ignored else T_FALSE)
+        self._write_label(buf, value.deleted_line)
+        _write_uint(buf, len(value))
+        for item in value:
+            self._write_value(buf, item)
+
+    def _write_var_history(self, buf, value):
+        buf.append(T_VAR_HISTORY)
+        # Variables are interned regardless of the line that defined them, which histories have to keep
+        self._write_object(buf, value.var)
+        self._write_value(buf, value.var_history)
+        self._write_value(buf, value.other_history)
+
+    def _write_object(self, buf, value):
+        buf.append(T_OBJECT)
+        encoded = jsonpickle.dumps(value).encode("utf-8")
+        _write_uint(buf, len(encoded))
+        buf += encoded
+
+    def _write_value(self, buf, value):
+        writer = self.value_writers.get(type(value))
+        if writer is None:
+            self._write_object(buf, value)
+        else:
+            writer(buf, value)
+
+    def _write_label(self, buf, value):
+        # Short strings such as names, actions, and locations are interned
+        if type(value) is str and len(value) <= INTERN_MAX_LEN:
+            buf.append(T_NAME)
+            _write_uint(buf, self._string_ref(value))
+        else:
+            self._write_value(buf, value)
+
+    def write_field(self, buf, value):
+        """Encodes a top-level value, falling back to jsonpickle for values that contain themselves"""
+
+        start = len(buf)
+        try:
+            self._write_label(buf, value)
+        except _CyclicValue:
+            self.containers.clear()
+            del buf[start:]
+            self._write_object(buf, value)
+
+    def write_event(self, event):
+        buf = bytearray()
+        _write_uint(buf, self._string_ref(event["event"]))
+
+        # Flags of the delta-encoded fields that this event has, since events from older versions lack some of them
+        flags = 0
+        for bit, field in enumerate(DELTA_FIELDS):
+            if field in event:
+                flags |= 1 << bit
+        _write_uint(buf, flags)
+
+        for field in DELTA_FIELDS:
+            if field in event:
+                _write_int(buf, event[field] - self.last_fields[field])
+                self.last_fields[field] = event[field]
+
+        fields = [(key, value) for key, value in event.items() if key != "event" and key not in DELTA_FIELDS]
+        _write_uint(buf, len(fields))
+        for key, value in fields:
+            _write_uint(buf, self._string_ref(key))
+            self.write_field(buf, value)
+
+        self._write_record(REC_EVENT, buf)
+
+    def write_metadata(self, metadata):
+        buf = bytearray()
+        self.write_field(buf, metadata)
+        self._write_record(REC_METADATA, buf)
+
+    def start_block(self, keyframe):
+        self._reset()
+        self._write_record(REC_BLOCK, b"")
+
+        buf = bytearray()
+        self.write_field(buf, keyframe)
+        self._write_record(REC_KEYFRAME, buf)
+
+
+class _Decoder:
+    def __init__(self, offset):
+        self.buf = b""
+        self.pos = 0
+        # Offset of the buffer in the file, and of the last record that was read
+        self.offset = offset
+        self.record_offset = offset
+
+        self._reset()
+
+        self.value_readers = {
+            T_NONE: lambda: None,
+            T_FALSE: lambda: False,
+            T_TRUE: lambda: True,
+            T_INT: self._read_int,
+            T_FLOAT: lambda: _DOUBLE.unpack(self._take(8))[0],
+            T_COMPLEX: lambda: complex(*_COMPLEX.unpack(self._take(16))),
+            T_STR: lambda: self._take(self._read_uint()).decode("utf-8", "surrogatepass"),
+            T_BYTES: lambda: self._take(self._read_uint()),
+            T_LIST: self._read_items,
+            T_TUPLE: lambda: tuple(self._read_items()),
+            T_SET: lambda: set(self._read_items()),
+            T_FROZENSET: lambda: frozenset(self._read_items()),
+            T_DICT: self._read_dict,
+            T_RANGE: lambda: range(self._read_int(), self._read_int(), self._read_int()),
+            T_NAME: lambda: self.strings[self._read_uint()],
+            T_FRAME: lambda: self.frames[self._read_uint()],
+            T_VARIABLE: lambda: self.variables[self._read_uint()],
+            T_VAR_VALUE: self._read_var_value,
+            T_VAR_VALUES: self._read_var_values,
+            T_OBJECT: lambda: jsonpickle.loads(self._take(self._read_uint()).decode("utf-8")),
+            T_STORED: lambda: self._get_stored(self._read_uint()),
+            T_CHUNKED: self._read_chunked,
+            T_VAR_HISTORY: self._read_var_history,
+        }
+
+    def _reset(self):
+        # Interned objects in the order of their definitions
+        self.strings = []
+        self.frames = []
+        self.variables = []
+        # Encodings of stored values, which are only decoded once they're used, and the decoded values
+        self.stored = []
+        self.stored_values = {}
+
+        self.last_fields = {field: 0 for field in DELTA_FIELDS}
+
+    def feed(self, chunk):
+        self.offset += self.pos
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+
+    def _take(self, size):
+        end = self.pos + size
+        if end > len(self.buf):
+            raise _Truncated
+
+        chunk = self.buf[self.pos : end]
+        self.pos = end
+        return chunk
+
+    def _read_byte(self):
+        try:
+            byte = self.buf[self.pos]
+        except IndexError:
+            raise _Truncated
+
+        self.pos += 1
+        return byte
+
+    def _read_uint(self):
+        # Most numbers fit in one byte
+        byte = self._read_byte()
+        if byte < 0x80:
+            return byte
+
+        num = byte & 0x7F
+        shift = 7
+        while True:
+            byte = self._read_byte()
+            num |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return num
+            shift += 7
+
+    def _read_int(self):
+        num = self._read_uint()
+        return -((num + 1) >> 1) if num & 1 else num >> 1
+
+    def _read_items(self):
+        return [self.read_value() for _ in range(self._read_uint())]
+
+    def _read_dict(self):
+        result = {}
+        for _ in range(self._read_uint()):
+            key = self.read_value()
+            result[key] = self.read_value()
+
+        return result
+
+    def _read_var_value(self):
+        value = data.VarValue.__new__(data.VarValue)
+        value.value = self.read_value()
+        value.file_line = self.read_value()
+        return value
+
+    def _read_var_values(self):
+        values = data.VarValues(ignored=self.read_value())
+        values.deleted_line = self.read_value()
+        values.extend(self._read_items())
+        return values
+
+    def _get_stored(self, ref):
+        if ref in self.stored_values:
+            return self.stored_values[ref]
+
+        # Decode the stored value in place of the buffer
+        buf, pos = self.buf, self.pos
+        self.buf, self.pos = self.stored[ref], 0
+        try:
+            value = self.read_value()
+        finally:
+            self.buf, self.pos = buf, pos
+
+        self.stored_values[ref] = value
+        return value
+
+    def _read_chunked(self):
+        tag = self._read_byte()
+        items = []
+        for _ in range(self._read_uint()):
+            items.extend(self._get_stored(self._read_uint()))
+
+        return tuple(items) if tag == T_TUPLE else items
+
+    def _read_var_history(self):
+        history = data.VarHistory.__new__(data.VarHistory)
+        history.__setstate__(
+            {"var": self.read_value(), "var_history": self.read_value(), "other_history": self.read_value()}
+        )
+        return history
+
+    def read_value(self):
+        return self.value_readers[self._read_byte()]()
+
+    def _read_string(self):
+        return self.strings[self._read_uint()]
+
+    def _read_event(self):
+        event = {}
+        evt_name = self._read_string()
+
+        flags = self._read_uint()
+        last_fields = dict(self.last_fields)
+        for bit, field in enumerate(DELTA_FIELDS):
+            if flags & (1 << bit):
+                last_fields[field] += self._read_int()
+                event[field] = last_fields[field]
+
+        event["event"] = evt_name
+        for _ in range(self._read_uint()):
+            key = self._read_string()
+            event[key] = self.read_value()
+
+        # Only commit the deltas once the whole event has been read
+        self.last_fields = last_fields
+        return event
+
+    def read_record(self):
+        """Returns the type and contents of the next block, keyframe, event, or metadata record, or raises _Truncated"""
+
+        start = self.pos
+        try:
+            while True:
+                rec_type = self._read_byte()
+
+                # Definitions are stored in the tables and not returned
+                if rec_type == REC_STRING:
+                    self.strings.append(self._take(self._read_uint()).decode("utf-8", "surrogatepass"))
+                elif rec_type == REC_FRAME:
+                    function = self._read_string()
+                    file = self._read_string()
+                    line = self._read_uint()
+                    comment = self._read_string()
+
+                    frame_info = data.FrameInfo.__new__(data.FrameInfo)
+                    frame_info.__setstate__(
+                        {
+                            "function": function,
+                            "file": file,
+                            "line": line,
+                            "file_line": f"{file}:{line}",
+                            "comment": comment,
+                        }
+                    )
+                    self.frames.append(frame_info)
+                elif rec_type == REC_VARIABLE:
+                    var = data.Variable.__new__(data.Variable)
+                    var.__setstate__(
+                        {
+                            "name": self._read_string(),
+                            "_file": self._read_string(),
+                            "file_line": self._read_string(),
+                            "function": self._read_string(),
+                        }
+                    )
+                    self.variables.append(var)
+                elif rec_type == REC_VALUE:
+                    self.stored.append(self._take(self._read_uint()))
+                elif rec_type == REC_BLOCK:
+                    self._reset()
+                    self.record_offset = self.offset + start
+                    return rec_type, None
+                elif rec_type == REC_EVENT:
+                    return rec_type, self._read_event()
+                elif rec_type in (REC_METADATA, REC_KEYFRAME):
+                    return rec_type, self.read_value()
+                else:
+                    raise ValueError(f"Unrecognized binary record type {rec_type}")
+
+                # Complete definitions don't have to be read again
+                start = self.pos
+        except _Truncated:
+            self.pos = start
+            raise
+
+
+def is_binary_file(file):
+    """Returns whether the given file, opened in binary mode at its start, is a binary recording"""
+
+    return file.read(len(MAGIC)) == MAGIC
+
+
+def read_records(file, start=0, on_block=None):
+    """
+    Yields (is_event, contents) tuples of the events and metadata in the given binary recording, which must be
+    opened in binary mode. Reading starts at the given offset, which must be the start of a block, and on_block is
+    called with the offset and keyframe (None if it doesn't have one) of every block that's read. Recordings that
+    were cut off end at their last complete record.
+    """
+
+    if not is_binary_file(file):
+        raise ValueError("Not a binary vardbg recording")
+
+    if start:
+        file.seek(start)
+    decoder = _Decoder(file.tell())
+
+    # Offset of the last block record, until its keyframe has been read
+    block_offset = None
+
+    eof = False
+    while True:
+        try:
+            rec_type, contents = decoder.read_record()
+        except _Truncated:
+            if eof:
+                return
+
+            try:
+                # Only read what's available so that the end of compressed streams that were cut off isn't lost
+                chunk = file.read1(CHUNK_SIZE)
+            except EOFError:
+                # Compressed streams that were cut off end abruptly
+                chunk = b""
+
+            eof = not chunk
+            decoder.feed(chunk)
+            continue
+
+        if rec_type == REC_BLOCK:
+            block_offset = decoder.record_offset
+            continue
+
+        if block_offset is not None:
+            if on_block is not None:
+                on_block(block_offset, contents if rec_type == REC_KEYFRAME else None)
+            block_offset = None
+
+        if rec_type != REC_KEYFRAME:
+            yield rec_type == REC_EVENT, contents
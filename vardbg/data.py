@@ -1,9 +1,14 @@
+import abc
+import io
 import os.path
 import re
+import tokenize
 from pathlib import Path
 
 _relative_path_cache = {}
 
+DIRECTIVE_PREFIX = "# vardbg: "
+
 
 def _get_path(orig_path, relative):
     if relative:
@@ -22,9 +27,75 @@ def _get_path(orig_path, relative):
         return orig_path
 
 
-class Variable:
+def _parse_directives(source):
+    # Only real comments count as directives, so string literals that happen to contain the prefix are ignored
+    directives = {}
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.COMMENT and token.string.startswith(DIRECTIVE_PREFIX):
+                directive = token.string[len(DIRECTIVE_PREFIX) :]
+                if directive:
+                    directives[token.start[0]] = directive
+    except (tokenize.TokenError, SyntaxError):
+        # Fall back to matching lines for source that can't be tokenized
+        for line_num, line in enumerate(source.splitlines(), start=1):
+            match = re.match(r"^.+# vardbg: (.+)$", line)
+            if match is not None:
+                directives[line_num] = match.group(1)
+
+    return directives
+
+
+def get_directives(path, directive_cache):
+    """Returns a map of line numbers to the vardbg directives on them, parsing the file only once"""
+
+    if path in directive_cache:
+        return directive_cache[path]
+
+    directives = _parse_directives(Path(path).read_text().replace("\r", ""))
+    directive_cache[path] = directives
+    return directives
+
+
+class _Record(abc.ABC):
+    """Base of slotted records that are identified by the tuple of attributes returned by to_tuple()"""
+
+    __slots__ = ()
+
+    @abc.abstractmethod
+    def to_tuple(self):
+        pass
+
+    def __getstate__(self):
+        # Hashes of strings differ between processes, so they're never serialized
+        return {name: getattr(self, name) for name in self.__slots__ if name != "_hash"}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+        self._hash = hash(self.to_tuple())
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            # Recordings made before hashes were precomputed restore their attributes directly
+            self._hash = hash(self.to_tuple())
+            return self._hash
+
+    def __eq__(self, other):
+        return self is other or (hash(self) == hash(other) and self.to_tuple() == other.to_tuple())
+
+    def __ne__(self, other):
+        return not (self == other)
+
+
+class Variable(_Record):
     """Holds information about a variable"""
 
+    __slots__ = ("name", "_file", "file_line", "function", "_hash")
+
     def __init__(self, name, frame_info):
         # Basic variable info
         self.name = name
@@ -34,19 +105,17 @@ class Variable:
         self.file_line = frame_info.file_line
         self.function = frame_info.function
 
+        # Variables are looked up in the history map on every change, so the hash is only computed once
+        self._hash = hash(self.to_tuple())
+
     def to_tuple(self):
         # This produces an identifying tuple for hashing and equality comparison.
         # We ignore value, type, and line here because they can change
         return self.name, self._file, self.function
 
-    def __hash__(self):
-        return hash(self.to_tuple())
-
-    def __eq__(self, other):
-        return self.to_tuple() == other.to_tuple()
-
-    def __ne__(self, other):
-        return not (self == other)
+    def function_key(self):
+        # Identifies the function that this variable belongs to
+        return self._file, self.function
 
 
 class VarValues(list):
@@ -59,62 +128,90 @@ class VarValues(list):
 class VarValue:
     """Holds information about a variable value"""
 
+    __slots__ = ("value", "file_line")
+
     def __init__(self, value, frame_info):
         self.value = value
         self.file_line = frame_info.file_line
 
+    def __getstate__(self):
+        return {"value": self.value, "file_line": self.file_line}
+
+    def __setstate__(self, state):
+        self.value = state["value"]
+        self.file_line = state["file_line"]
+
     @staticmethod
     def value_getter(val):
         return val.value
 
 
 class VarHistory:
-    """Holds information about a variable's history and its context"""
+    """Holds information about a variable's history and its context, which is only collected when it's used"""
 
-    def __init__(self, var, full_history):
+    def __init__(self, var, function_vars):
         self.var = var
-        self.var_history = full_history[var] if var in full_history else ()
-        other_history = {v: h for v, h in full_history.items() if v != var and v.function == var.function}
-        self.other_history = list(other_history.items())
+        # Map of the variables in the same function to their values
+        self._function_vars = function_vars
+
+        self._var_history = None
+        self._other_history = None
+
+    @property
+    def var_history(self):
+        if self._var_history is None:
+            self._var_history = self._function_vars.get(self.var, ())
+
+        return self._var_history
+
+    @var_history.setter
+    def var_history(self, value):
+        self._var_history = value
+
+    @property
+    def other_history(self):
+        if self._other_history is None:
+            self._other_history = [(v, h) for v, h in self._function_vars.items() if v != self.var]
+
+        return self._other_history
 
+    @other_history.setter
+    def other_history(self, value):
+        self._other_history = value
 
-class FrameInfo:
+    def __getstate__(self):
+        # Recordings contain the collected history rather than the map that it's collected from
+        return {"var": self.var, "var_history": self.var_history, "other_history": self.other_history}
+
+    def __setstate__(self, state):
+        self.var = state["var"]
+        self.var_history = state["var_history"]
+        self.other_history = state["other_history"]
+
+
+class FrameInfo(_Record):
     """Holds basic information about a stack frame"""
 
-    def __init__(self, frame, *, relative=True, file_cache=None):
+    __slots__ = ("function", "file", "line", "file_line", "comment", "_hash")
+
+    def __init__(self, frame, *, relative=True, directive_cache=None):
         self.function = frame.f_code.co_name
         self.file = _get_path(frame.f_code.co_filename, relative)
         self.line = frame.f_lineno
 
         self.file_line = f"{self.file}:{self.line}"
 
-        # Extract vardbg comment from line
-        line = self._get_line(file_cache)
-        match = re.match(r"^.+# vardbg: (.+)$", line)
-        self.comment = "" if match is None else match.group(1)
+        # Look up the vardbg directive on this line
+        if directive_cache is None:
+            directive_cache = {}
+        self.comment = get_directives(self.file, directive_cache).get(self.line, "")
 
-    def _get_line(self, file_cache):
-        # Read lines from cache if possible, otherwise read from file and save to cache
-        if file_cache and self.file in file_cache:
-            lines = file_cache[self.file]
-        else:
-            lines = Path(self.file).read_text().replace("\r", "").splitlines()
-            file_cache[self.file] = lines
-
-        return lines[self.line - 1]
+        # Frames are used as keys of the profiler's map, so the hash is only computed once
+        self._hash = hash(self.to_tuple())
 
     def to_tuple(self):
         # Produce an identifying tuple for hashing and equality comparison
         return self.file, self.line, self.function
 
-    def __hash__(self):
-        return hash(self.to_tuple())
-
-    def __eq__(self, other):
-        return self.to_tuple() == other.to_tuple()
-
-    def __ne__(self, other):
-        return not (self == other)
-
     def __lt__(self, other):
         return self.line < other.line
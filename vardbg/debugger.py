@@ -1,10 +1,25 @@
-from . import output
+import tempfile
+
+from . import backends, output, recording, tracer
 from .diff_processor import DiffProcessor
 from .profiler import Profiler
 from .replayer import Replayer
+from .sampler import Sampler
+from .suppressor import Suppressor
 from .tracer import Tracer
 
 
+def recording_writer(path, shard_dir=None):
+    """Returns a writer for a session recording in the format given by the extension of the path"""
+
+    if recording.is_binary(path):
+        return output.BinaryWriter(path, shard_dir=shard_dir)
+    elif recording.is_json_lines(path):
+        return output.JsonLinesWriter(path, shard_dir=shard_dir)
+    else:
+        return output.JsonWriter(path, shard_dir=shard_dir)
+
+
 class Debugger(DiffProcessor, Profiler, Replayer, Tracer):
     def __init__(
         self,
@@ -15,6 +30,16 @@ class Debugger(DiffProcessor, Profiler, Replayer, Tracer):
         video_config=None,
         profiler_output=False,
         quiet=False,
+        backend="settrace",
+        include=(),
+        exclude=(),
+        max_depth=None,
+        calls_only=False,
+        sample_every=None,
+        sample_rate=None,
+        suppress_after=None,
+        recheck_interval=100,
+        trace_processes=False,
     ):
         # Arguments to pass to snippet (handled in run())
         self.args = args
@@ -25,12 +50,62 @@ class Debugger(DiffProcessor, Profiler, Replayer, Tracer):
         # Whether to show profiler output
         self.profiler_output = profiler_output
 
+        # Glob patterns of module names or file paths to trace even if they're library code, and to never trace
+        self.include_patterns = tuple(include)
+        self.exclude_patterns = tuple(exclude)
+
+        # Maximum depth of frames to trace relative to the function being debugged (None for unlimited)
+        self.max_depth = max_depth
+
+        # Whether to only trace function calls and returns instead of every line
+        self.calls_only = calls_only
+        self.traced_events = tracer.CALL_EVENTS if calls_only else tracer.ALLOWED_EVENTS
+
+        # Sampler that decides which lines to snapshot (None to snapshot all lines)
+        if sample_every is None and sample_rate is None:
+            self.sampler = None
+        else:
+            self.sampler = Sampler(every=sample_every, rate=sample_rate)
+
+        # Suppressor that skips snapshots after lines that never change variables (None to disable)
+        if suppress_after is None:
+            self.suppressor = None
+        else:
+            self.suppressor = Suppressor(suppress_after, recheck_interval)
+
+        # Mechanism used to receive execution events
+        self.backend = backends.get_backend(backend)(self)
+
+        # Tracing options to pass on to debuggers in child processes
+        self.options = {
+            "relative_paths": relative_paths,
+            "profiler_output": profiler_output,
+            "backend": backend,
+            "include": self.include_patterns,
+            "exclude": self.exclude_patterns,
+            "max_depth": max_depth,
+            "calls_only": calls_only,
+            "sample_every": sample_every,
+            "sample_rate": sample_rate,
+            "suppress_after": suppress_after,
+            "recheck_interval": recheck_interval,
+        }
+
+        # Directory that child processes write their recording shards to (None to leave them untraced)
+        if trace_processes:
+            if json_out_path is None:
+                raise ValueError("Tracing child processes requires a JSON recording to merge their shards into")
+
+            self.shard_dir = tempfile.mkdtemp(prefix="vardbg-")
+        else:
+            self.shard_dir = None
+
         # Output writers
         writers = []
         if not quiet:
             writers.append(output.ConsoleWriter())
         if json_out_path is not None:
-            writers.append(output.JsonWriter(json_out_path))
+            writers.append(recording_writer(json_out_path, shard_dir=self.shard_dir))
         if video_out_path is not None:
             writers.append(output.VideoWriter(video_out_path, video_config, profiler_output))
         self.out = output.OutputDelegate(*writers)
@@ -53,6 +128,20 @@ def debug(func, *args, **kwargs):
         dbg.run(func)
 
 
-def replay(json_path, *args, **kwargs):
+def replay(json_path, *args, from_step=None, to_step=None, function=None, variable=None, **kwargs):
     with Debugger(*args, **kwargs) as dbg:
-        dbg.replay(json_path)
+        dbg.replay(json_path, from_step, to_step, function, variable)
+
+
+def convert(in_path, out_path):
+    """Converts a session recording to the format given by the extension of the output path"""
+
+    metadata = {}
+    writer = recording_writer(out_path)
+    for event in recording.read_events(in_path, metadata):
+        writer.append_event(event)
+
+    # Events from older versions are converted as-is, and the replayer recognizes them by their contents
+    metadata.pop("version", None)
+    writer.data.update(metadata)
+    writer.close()
@@ -0,0 +1,140 @@
+import collections
+import collections.abc
+
+from . import snapshot
+
+ADD = "add"
+CHANGE = "change"
+REMOVE = "remove"
+
+# Compact record of a change to one local variable.
+#   action: ADD, CHANGE, or REMOVE
+#   var: name of the variable, or None for additions and removals of entire variables
+#   path: tuple of keys leading from the variable to the changed node
+#   items: for additions and removals, a list of (key, value) pairs added to or removed from the container at
+#          path (sets use None as the key); for changes, a (before, after) pair for the value at path
+Change = collections.namedtuple("Change", ("action", "var", "path", "items"))
+
+# Container kinds that are diffed element-wise
+_MAPPING = 1
+_SEQUENCE = 2
+_SET = 3
+
+_KIND_CACHE = {dict: _MAPPING, list: _SEQUENCE, tuple: _SEQUENCE, set: _SET, frozenset: _SET}
+
+
+def _kind(value):
+    value_type = type(value)
+    if value_type in _KIND_CACHE:
+        return _KIND_CACHE[value_type]
+
+    # Slow path for container subclasses and other implementations
+    if isinstance(value, collections.abc.Mapping):
+        kind = _MAPPING
+    elif isinstance(value, (collections.abc.MutableSequence, tuple)):
+        kind = _SEQUENCE
+    elif isinstance(value, collections.abc.Set):
+        kind = _SET
+    else:
+        kind = None
+
+    _KIND_CACHE[value_type] = kind
+    return kind
+
+
+def _diff_sequence(var, path, before, after, ancestors):
+    len_before = len(before)
+    len_after = len(after)
+    common_len = min(len_before, len_after)
+
+    # Skip the common prefix and, if the lengths are equal, the common suffix
+    start = 0
+    while start < common_len and (before[start] is after[start] or snapshot.is_equal(before[start], after[start])):
+        start += 1
+
+    end = common_len
+    if len_before == len_after:
+        while end > start and (before[end - 1] is after[end - 1] or snapshot.is_equal(before[end - 1], after[end - 1])):
+            end -= 1
+
+    for idx in range(start, end):
+        yield from _diff_value(var, path + (idx,), before[idx], after[idx], ancestors)
+
+    if len_after > common_len:
+        yield Change(ADD, var, path, [(idx, after[idx]) for idx in range(common_len, len_after)])
+    if len_before > common_len:
+        yield Change(REMOVE, var, path, [(idx, before[idx]) for idx in reversed(range(common_len, len_before))])
+
+
+def _diff_mapping(var, path, before, after, ancestors):
+    for key, value in before.items():
+        if key in after:
+            yield from _diff_value(var, path + (key,), value, after[key], ancestors)
+
+    added = [(key, value) for key, value in after.items() if key not in before]
+    if added:
+        yield Change(ADD, var, path, added)
+
+    removed = [(key, value) for key, value in before.items() if key not in after]
+    if removed:
+        yield Change(REMOVE, var, path, removed)
+
+
+def _diff_set(var, path, before, after):
+    added = after - before
+    if added:
+        yield Change(ADD, var, path, [(None, added)])
+
+    removed = before - after
+    if removed:
+        yield Change(REMOVE, var, path, [(None, removed)])
+
+
+def _diff_value(var, path, before, after, ancestors):
+    # Identical objects are never diffed further
+    if before is after:
+        return
+
+    kind = _kind(before)
+    if kind is None or type(before) is not type(after):
+        # Scalars and type changes are reported as a change of the entire value
+        if not snapshot.is_equal(before, after):
+            yield Change(CHANGE, var, path, (before, after))
+        return
+
+    # Equal containers are checked in one pass, which is much faster than walking them element by element
+    if len(before) == len(after) and snapshot.is_equal(before, after):
+        return
+
+    # Containers that contain themselves are only walked once, when they're first reached
+    key = id(before), id(after)
+    if key in ancestors:
+        return
+
+    ancestors.add(key)
+    if kind == _SEQUENCE:
+        yield from _diff_sequence(var, path, before, after, ancestors)
+    elif kind == _MAPPING:
+        yield from _diff_mapping(var, path, before, after, ancestors)
+    else:
+        yield from _diff_set(var, path, before, after)
+    ancestors.discard(key)
+
+
+def diff_locals(prev_locals, new_locals):
+    """
+    Diffs two snapshots of a frame's locals and yields Change records. Changes to existing variables are
+    yielded first, followed by added and removed variables.
+    """
+
+    for name, value in prev_locals.items():
+        if name in new_locals:
+            yield from _diff_value(name, (), value, new_locals[name], set())
+
+    added = [(name, value) for name, value in new_locals.items() if name not in prev_locals]
+    if added:
+        yield Change(ADD, None, (), added)
+
+    removed = [(name, value) for name, value in prev_locals.items() if name not in new_locals]
+    if removed:
+        yield Change(REMOVE, None, (), removed)
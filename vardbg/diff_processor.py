@@ -2,9 +2,7 @@ import abc
 import collections.abc
 from typing import TYPE_CHECKING
 
-import dictdiffer
-
-from . import data, render
+from . import data, diff, output, render
 
 if TYPE_CHECKING:
     from .debugger import Debugger
@@ -14,120 +12,169 @@ class DiffProcessor(abc.ABC):
     def __init__(self: "Debugger"):
         # Full variable + values map
         self.vars = {}
-
-        # File contents cache
-        self.file_cache = {}
+        # Map of (file, function) pairs to the variables in them and their values, which are shared with vars
+        self.function_vars = {}
 
         # Propagate initialization to other mixins
         super().__init__()
 
     def _get_history(self, wrapper):
-        return data.VarHistory(wrapper, self.vars)
+        if output.HISTORY not in self.out.consumes:
+            return None
+
+        return data.VarHistory(wrapper, self.function_vars.get(wrapper.function_key(), {}))
+
+    def _set_values(self, wrapper, values):
+        self.vars[wrapper] = values
 
-    def process_add(self: "Debugger", chg_name, chg, frame_info, new_locals):
+        key = wrapper.function_key()
+        if key in self.function_vars:
+            self.function_vars[key][wrapper] = values
+        else:
+            self.function_vars[key] = {wrapper: values}
+
+    def _write_values(self, wrapper):
+        if output.VALUES in self.out.consumes:
+            self.out.write_var_values(wrapper, self.vars[wrapper])
+
+    def process_add(self: "Debugger", chg, frame_info, new_locals):
         # If we have a changed variable, elements were added to a list/set/dict
-        if chg_name:
+        if chg.var is not None:
             # Get a reference to the container to check its type
-            container = new_locals[chg_name]
+            container = new_locals[chg.var]
+            for key in chg.path:
+                container = container[key]
             # Construct variable wrapper
-            wrapper = data.Variable(chg_name, frame_info)
+            wrapper = data.Variable(chg.var, frame_info)
 
             if not self.vars[wrapper].ignored:
-                # chg is a list of tuples with keys (index, key, etc.) and values
-                for key, val in chg:
+                # Items are tuples with keys (index, key, etc.) and values
+                for key, val in chg.items:
                     if isinstance(container, collections.abc.Set):
                         # Move value out of set if there's only 1
-                        if len(val) == 1:
-                            val = val.pop()
+                        plural = len(val) != 1
+                        if not plural:
+                            val = next(iter(val))
 
                         # Show it as an extension for sets
                         self.out.write_add(
-                            chg_name,
+                            render.key_path(chg.var, chg.path),
                             val,
+                            wrapper,
                             self._get_history(wrapper),
                             action="extended",
-                            plural=isinstance(val, collections.abc.Set),
+                            plural=plural,
                         )
                     else:
                         # Render it as var[key] for lists, dicts, etc.
                         self.out.write_add(
-                            render.key_var(chg_name, key), val, self._get_history(wrapper), action="added", plural=False
+                            render.key_path(chg.var, chg.path + (key,)),
+                            val,
+                            wrapper,
+                            self._get_history(wrapper),
+                            action="added",
+                            plural=False,
                         )
 
                 # Record new value
-                self.vars[wrapper].append(data.VarValue(container, frame_info))
+                self.vars[wrapper].append(data.VarValue(new_locals[chg.var], frame_info))
+                self._write_values(wrapper)
 
         # Otherwise, it's a new variable
         else:
-            # chg is a list of tuples with variable names and values
-            for name, val in chg:
+            # Items are tuples with variable names and values
+            for name, val in chg.items:
                 wrapper = data.Variable(name, frame_info)
                 ignored = frame_info.comment == "ignore"
                 if ignored:
-                    self.vars[wrapper] = data.VarValues(ignored=True)
+                    self._set_values(wrapper, data.VarValues(ignored=True))
                 else:
-                    self.out.write_add(name, val, self._get_history(wrapper), action="added", plural=False)
-                    self.vars[wrapper] = data.VarValues(data.VarValue(val, frame_info))
+                    self.out.write_add(name, val, wrapper, self._get_history(wrapper), action="added", plural=False)
+                    self._set_values(wrapper, data.VarValues(data.VarValue(val, frame_info)))
 
-    def process_change(self: "Debugger", chg_name, chg, frame_info, new_locals):
-        before, after = chg
+                self._write_values(wrapper)
 
-        # If the changed variable is given as a list, a list/set/dict element was changed
-        if isinstance(chg_name, list):
-            # chg_name is a tuple with the variable name and key
-            var_name, key = chg_name
-            # Render it as var_name[key]
-            chg_name = f"{var_name}[{repr(key)}]"
+    def process_change(self: "Debugger", chg, frame_info, new_locals):
+        before, after = chg.items
 
+        # If we have a path, a list/set/dict element was changed
+        if chg.path:
             # Full changed value
-            full_after = new_locals[var_name]
+            full_after = new_locals[chg.var]
         else:
-            var_name = chg_name
             full_after = after
 
-        wrapper = data.Variable(var_name, frame_info)
+        wrapper = data.Variable(chg.var, frame_info)
         if not self.vars[wrapper].ignored:
-            self.out.write_change(chg_name, before, after, self._get_history(wrapper), action="changed")
+            self.out.write_change(
+                render.key_path(chg.var, chg.path),
+                before,
+                after,
+                wrapper,
+                self._get_history(wrapper),
+                action="changed",
+            )
             self.vars[wrapper].append(data.VarValue(full_after, frame_info))
+            self._write_values(wrapper)
 
-    def process_remove(self: "Debugger", chg_name, chg, frame_info, new_locals):
+    def process_remove(self: "Debugger", chg, frame_info, new_locals):
         # If we have a changed variable, elements were removed from a list/set/dict
-        if chg_name:
+        if chg.var is not None:
             # Construct variable wrapper
-            wrapper = data.Variable(chg_name, frame_info)
+            wrapper = data.Variable(chg.var, frame_info)
 
             if not self.vars[wrapper].ignored:
-                for key, val in chg:
-                    self.out.write_remove(
-                        render.key_var(chg_name, key), val, self._get_history(wrapper), action="removed"
-                    )
+                for key, val in chg.items:
+                    if key is None:
+                        # Set elements don't have keys, so show it as a reduction like extensions
+                        plural = len(val) != 1
+                        if not plural:
+                            val = next(iter(val))
+
+                        self.out.write_remove(
+                            render.key_path(chg.var, chg.path),
+                            val,
+                            wrapper,
+                            self._get_history(wrapper),
+                            action="reduced",
+                        )
+                    else:
+                        self.out.write_remove(
+                            render.key_path(chg.var, chg.path + (key,)),
+                            val,
+                            wrapper,
+                            self._get_history(wrapper),
+                            action="removed",
+                        )
 
                 # Get new container contents and log value
-                container = new_locals[chg_name]
-                self.vars[wrapper].append(data.VarValue(container, frame_info))
+                self.vars[wrapper].append(data.VarValue(new_locals[chg.var], frame_info))
+                self._write_values(wrapper)
 
         # Otherwise, a variable was deleted
         else:
-            # chg is a list of tuples with variable names and values
-            for name, val in chg:
+            # Items are tuples with variable names and values
+            for name, val in chg.items:
                 # Construct variable wrapper
                 wrapper = data.Variable(name, frame_info)
 
                 if not self.vars[wrapper].ignored:
-                    self.out.write_remove(name, val, self._get_history(wrapper), action="deleted")
+                    self.out.write_remove(name, val, wrapper, self._get_history(wrapper), action="deleted")
                     self.vars[wrapper].deleted_line = frame_info.file_line
+                    self._write_values(wrapper)
 
-    def process_locals_diff(self: "Debugger", diff, frame_info, new_locals):
-        for action, chg_var, chg in diff:
-            if action == dictdiffer.ADD:
-                self.process_add(chg_var, chg, frame_info, new_locals)
-            elif action == dictdiffer.CHANGE:
-                self.process_change(chg_var, chg, frame_info, new_locals)
-            elif action == dictdiffer.REMOVE:
-                self.process_remove(chg_var, chg, frame_info, new_locals)
+    def process_locals_diff(self: "Debugger", changes, frame_info, new_locals):
+        for chg in changes:
+            if chg.action == diff.ADD:
+                self.process_add(chg, frame_info, new_locals)
+            elif chg.action == diff.CHANGE:
+                self.process_change(chg, frame_info, new_locals)
+            elif chg.action == diff.REMOVE:
+                self.process_remove(chg, frame_info, new_locals)
 
     def finalize_history(self: "Debugger"):
         # Delete ignored variables (implementation detail) from history map
         to_delete = [var for var, values in self.vars.items() if values.ignored]
         for var in to_delete:
             del self.vars[var]
+            del self.function_vars[var.function_key()][var]
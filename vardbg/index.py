@@ -0,0 +1,267 @@
+import ast
+import bisect
+import copy
+import json
+import os
+
+from . import data
+
+# Minimum number of events in each block of a streamed recording, which is the granularity of seeking
+BLOCK_EVENTS = 4096
+# Extension added to the path of a recording to get the path of its index
+INDEX_SUFFIX = ".idx"
+# Version of the index format, which is rebuilt when it changes; version 1 indices don't have changes of variables
+INDEX_VERSION = 2
+
+
+def event_var(event):
+    """Returns the Variable that the given event is about, or None if there isn't one"""
+
+    # Version 1 recordings store the variable in the history
+    if "var" in event:
+        return event["var"]
+    elif "history" in event:
+        return event["history"].var
+    else:
+        return None
+
+
+def event_function(event):
+    """Returns the name of the function that the given event happened in, or None if it's not known"""
+
+    if "frame_info" in event:
+        return event["frame_info"].function
+
+    var = event_var(event)
+    return None if var is None else var.function
+
+
+def event_variable(event):
+    """Returns the name of the variable that the given event is about, or None if there isn't one"""
+
+    var = event_var(event)
+    return None if var is None else var.name
+
+
+def _element_path(var_name):
+    # Version 1 events render the keys of changed elements after the name of their variable, e.g. "lst[0]"
+    node = ast.parse(var_name, mode="eval").body
+    path = []
+    while isinstance(node, ast.Subscript):
+        key = node.slice
+        # Subscripts are wrapped in Index nodes before Python 3.9
+        if isinstance(key, getattr(ast, "Index", ())):
+            key = key.value
+
+        path.append(ast.literal_eval(key))
+        node = node.value
+
+    return path[::-1]
+
+
+def _apply_element_change(container, event):
+    # Returns a copy of the given container with the change of one of its elements in a version 1 event applied
+    if isinstance(container, (set, frozenset)):
+        # Sets are extended with, and have removed, single elements or sets of them
+        elements = event["value"] if isinstance(event["value"], (set, frozenset)) else {event["value"]}
+        return container - elements if event["action"] == "removed" else container | elements
+
+    try:
+        path = _element_path(event["var_name"])
+    except (SyntaxError, ValueError):
+        # Keys whose representations can't be parsed back
+        return container
+
+    # Containers along the path are copied so that the previous value isn't changed
+    new_container = parent = copy.copy(container)
+    for key in path[:-1]:
+        parent[key] = copy.copy(parent[key])
+        parent = parent[key]
+
+    key = path[-1]
+    if event["action"] == "removed":
+        del parent[key]
+    elif "value_after" in event:
+        parent[key] = event["value_after"]
+    elif isinstance(parent, list) and key >= len(parent):
+        parent.append(event["value"])
+    else:
+        parent[key] = event["value"]
+
+    return new_container
+
+
+def _history_change(event, values):
+    # Version 1 recordings store the history of the variable in every event, but it's copied before the event's value
+    # is added to it, so the new value is taken from the event itself
+    history = event["history"]
+    var = history.var
+    if event["action"] == "deleted":
+        return var, None
+
+    if event["var_name"] == var.name and event["action"] != "extended":
+        new_value = event["value_after"] if "value_after" in event else event["value"]
+    else:
+        # Changes of elements are applied to the current value of the variable, which is only in the history for the
+        # first event of each snapshot
+        prev = values.get(var) if values is not None else None
+        if prev is None and history.var_history:
+            prev = history.var_history[-1]
+        if prev is None:
+            return None
+
+        try:
+            new_value = _apply_element_change(prev.value, event)
+        except (KeyError, IndexError, TypeError):
+            new_value = prev.value
+
+    # Variables in version 1 events are created with the frame that changed them, which is all that VarValue needs
+    return var, data.VarValue(new_value, var)
+
+
+def value_change(event, values=None):
+    """
+    Returns the variable whose value the given event changes and its new VarValue (None if it was deleted), or None if
+    it doesn't change any variable. Changes of container elements in version 1 recordings are applied to the values
+    in the given map of variables to their current VarValues, if there is one.
+    """
+
+    if "values" in event:
+        # Ignored variables don't have any values
+        if event["ignored"]:
+            return None
+        elif event["deleted_line"] is not None:
+            return event["var"], None
+        elif event["values"]:
+            return event["var"], event["values"][-1]
+    elif "history" in event:
+        return _history_change(event, values)
+
+    return None
+
+
+def _find_block(first_steps, step):
+    return max(bisect.bisect_right(first_steps, step) - 1, 0)
+
+
+def index_path(path):
+    return str(path) + INDEX_SUFFIX
+
+
+class RecordingIndex:
+    """
+    Maps steps, times, and functions to the blocks of a streamed recording that contain them, and variables to the
+    steps that changed them. Blocks start at the given byte offsets in the (uncompressed) recording, and reading can
+    start at any of them.
+    """
+
+    def __init__(self, version, blocks=(), functions=None, changes=None, last_step=None):
+        # Format version of the recording
+        self.version = version
+        # List of (offset, first step, first time) tuples
+        self.blocks = list(blocks)
+        # Map of function names to sets of the numbers of the blocks they appear in
+        self.functions = {name: set(blocks) for name, blocks in (functions or {}).items()}
+        # Map of variable names to maps of the functions they're in to the sorted steps that changed them
+        self.changes = changes or {}
+        # Step of the last event, after which only the trailer follows
+        self.last_step = last_step
+
+        # Number of events in the last block
+        self.block_events = 0
+
+    def is_full(self):
+        return self.block_events >= BLOCK_EVENTS
+
+    def start_block(self, offset, event):
+        self.blocks.append((offset, event["step"], event["time"]))
+        self.block_events = 0
+
+    def add_event(self, event):
+        block = len(self.blocks) - 1
+        self.block_events += 1
+        self.last_step = event["step"]
+
+        function = event_function(event)
+        if function is not None:
+            self.functions.setdefault(function, set()).add(block)
+
+        change = value_change(event)
+        if change is not None:
+            var = change[0]
+            self.changes.setdefault(var.name, {}).setdefault(var.function, []).append(event["step"])
+
+    def block_end_step(self, block):
+        """Returns the first step after the given block, or None if it's the last one"""
+
+        if block + 1 < len(self.blocks):
+            return self.blocks[block + 1][1]
+
+        return None
+
+    def _first_steps(self):
+        return [first_step for _, first_step, _ in self.blocks]
+
+    def find_block(self, step):
+        """Returns the number of the block that contains the given step, or the first block for earlier steps"""
+
+        return _find_block(self._first_steps(), step)
+
+    def change_steps(self, variable, function=None):
+        """Returns the sorted steps that changed the given variable, in the given function or any of them"""
+
+        functions = self.changes.get(variable, {})
+        if function is not None:
+            return functions.get(function, [])
+
+        return sorted(step for steps in functions.values() for step in steps)
+
+    def find_blocks(self, from_step=None, to_step=None, function=None, variable=None):
+        """Returns the sorted numbers of the blocks that can contain events matching all of the given filters"""
+
+        blocks = set(range(len(self.blocks)))
+        if function is not None:
+            blocks &= self.functions.get(function, set())
+        if variable is not None:
+            # Events about a variable are in the same block as the change that follows them
+            first_steps = self._first_steps()
+            blocks &= {_find_block(first_steps, step) for step in self.change_steps(variable, function)}
+
+        def in_range(block):
+            end_step = self.block_end_step(block)
+            if from_step is not None and end_step is not None and end_step <= from_step:
+                return False
+
+            return to_step is None or self.blocks[block][1] <= to_step
+
+        return sorted(block for block in blocks if in_range(block))
+
+    def save(self, path):
+        data = {
+            "index_version": INDEX_VERSION,
+            "version": self.version,
+            # The size of the recording is used to detect indices that are out of date
+            "size": os.path.getsize(path),
+            "blocks": self.blocks,
+            "functions": {name: sorted(blocks) for name, blocks in self.functions.items()},
+            "changes": self.changes,
+            "last_step": self.last_step,
+        }
+
+        with open(index_path(path), "w") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path):
+        """Loads the index of the given recording, returning None if it doesn't have one that's up-to-date"""
+
+        try:
+            with open(index_path(path)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("index_version") != INDEX_VERSION or data["size"] != os.path.getsize(path):
+            return None
+
+        return cls(data["version"], map(tuple, data["blocks"]), data["functions"], data["changes"], data["last_step"])
@@ -1,9 +1,11 @@
 import importlib.util
+import sys
 from pathlib import Path
 
 import click
 
-from . import debugger
+from . import ansi, backends, debugger, recording, render
+from .query import RecordingQuery
 
 DESC = "A simple Python debugger and profiler that can generate animated visualizations of program flow."
 
@@ -17,6 +19,43 @@ VIDEO_RUN_HELP = (
 VIDEO_CONFIG_HELP = "TOML video config overlay to load."
 
 QUIET_DESC = "Silence console output."
+INCLUDE_HELP = (
+    "Glob pattern of module names or file paths to trace even if they belong to the standard library or "
+    "site-packages. Can be specified multiple times."
+)
+EXCLUDE_HELP = "Glob pattern of module names or file paths to never trace. Can be specified multiple times."
+MAX_DEPTH_HELP = (
+    "Maximum depth of calls to trace relative to the debugged function, which is at depth 0. Time spent in deeper "
+    "calls is attributed to the calling line."
+)
+CALLS_ONLY_HELP = (
+    "Only trace function calls and returns, showing arguments, return-time values, and per-function execution "
+    "times instead of every line. This is much faster."
+)
+SAMPLE_EVERY_HELP = (
+    "Only snapshot variables on every Nth execution of each line. Other executions are still counted and timed."
+)
+SAMPLE_RATE_HELP = "Snapshot variables at most N times per second. Other lines are still counted and timed."
+SUPPRESS_AFTER_HELP = (
+    "Stop snapshotting variables after lines that have executed N times without changing any variables. "
+    "Such lines are still counted and timed."
+)
+RECHECK_INTERVAL_HELP = "Verify suppressed lines with a full snapshot once every N executions."
+TRACE_PROCESSES_HELP = (
+    "Also trace child processes started with multiprocessing or ProcessPoolExecutor. Each child records a shard that "
+    "is merged into the JSON session recording, so this requires --output."
+)
+OUTPUT_HELP = (
+    "Write a JSON session recording. Recordings with the .jsonl extension are streamed to disk while running, ones "
+    "with the .vardbg extension are streamed in a compact binary format, and the .gz and .xz extensions compress them."
+)
+QUERY_HELP = (
+    "Show the steps that changed the value of the given variable or Python expression (e.g. 'arr[3]') in the given "
+    "session recording without replaying it. Streamed recordings are indexed by the changes of each variable, which "
+    "is built if it's missing, so only the parts with changes to the variables in the expression are read."
+)
+WHERE_HELP = "Show the steps at which the expression (e.g. 'lo > hi') is true after a change to its variables instead."
+BACKEND_HELP = "Tracing backend to use. The monitoring backend is much faster, but requires Python 3.12 or newer."
 
 
 def err(message):
@@ -52,7 +91,7 @@ def cli():
 @click.argument("file")
 @click.argument("function", required=False, default="main")
 @click.option("-a", "--arguments", multiple=True, metavar="ARGS", help="Arguments to pass to the program.")
-@click.option("-o", "--output", metavar="PATH", help="Write a JSON session recording.")
+@click.option("-o", "--output", metavar="PATH", help=OUTPUT_HELP)
 @click.option("-v", "--video", metavar="PATH", help=VIDEO_RUN_HELP)
 @click.option("-c", "--video-config", metavar="PATH", help=VIDEO_CONFIG_HELP)
 @click.option(
@@ -60,13 +99,56 @@ def cli():
 )
 @click.option("-P", "--enable-profiler", default=False, is_flag=True, help="Enable profiler output.")
 @click.option("-q", "--quiet", default=False, is_flag=True, help=QUIET_DESC)
-def run(file, function, arguments, output, video, video_config, absolute_paths, enable_profiler, quiet):
+@click.option("-b", "--backend", default="settrace", type=click.Choice(list(backends.BACKENDS)), help=BACKEND_HELP)
+@click.option("-i", "--include", multiple=True, metavar="PATTERN", help=INCLUDE_HELP)
+@click.option("-x", "--exclude", multiple=True, metavar="PATTERN", help=EXCLUDE_HELP)
+@click.option("-d", "--max-depth", type=click.IntRange(min=0), metavar="N", help=MAX_DEPTH_HELP)
+@click.option("-C", "--calls-only", default=False, is_flag=True, help=CALLS_ONLY_HELP)
+@click.option("-s", "--sample-every", type=click.IntRange(min=1), metavar="N", help=SAMPLE_EVERY_HELP)
+@click.option("-S", "--sample-rate", type=click.IntRange(min=1), metavar="N", help=SAMPLE_RATE_HELP)
+@click.option("-u", "--suppress-after", type=click.IntRange(min=1), metavar="N", help=SUPPRESS_AFTER_HELP)
+@click.option(
+    "-r", "--recheck-interval", type=click.IntRange(min=1), default=100, metavar="N", help=RECHECK_INTERVAL_HELP
+)
+@click.option("-m", "--trace-processes", default=False, is_flag=True, help=TRACE_PROCESSES_HELP)
+def run(
+    file,
+    function,
+    arguments,
+    output,
+    video,
+    video_config,
+    absolute_paths,
+    enable_profiler,
+    quiet,
+    backend,
+    include,
+    exclude,
+    max_depth,
+    calls_only,
+    sample_every,
+    sample_rate,
+    suppress_after,
+    recheck_interval,
+    trace_processes,
+):
+    if trace_processes and output is None:
+        err("Tracing child processes requires a JSON session recording (--output)")
+    if backend == "monitoring" and not hasattr(sys, "monitoring"):
+        err("The monitoring backend requires Python 3.12 or newer")
+
     # Load file as module
     mod_name = Path(file).stem
     spec = importlib.util.spec_from_file_location(mod_name, file)
     if spec is None:
         err(f"Module '{file}' not found")
     mod = importlib.util.module_from_spec(spec)
+
+    # Make the module importable like a script so that its functions can be pickled into child processes
+    if trace_processes:
+        sys.path.insert(0, str(Path(file).parent.resolve()))
+        sys.modules.setdefault(mod_name, mod)
+
     spec.loader.exec_module(mod)
 
     # Get the function here regardless of which path we took above
@@ -88,6 +170,16 @@ def run(file, function, arguments, output, video, video_config, absolute_paths,
         video_config=video_config,
         profiler_output=enable_profiler,
         quiet=quiet,
+        backend=backend,
+        include=include,
+        exclude=exclude,
+        max_depth=max_depth,
+        calls_only=calls_only,
+        sample_every=sample_every,
+        sample_rate=sample_rate,
+        suppress_after=suppress_after,
+        recheck_interval=recheck_interval,
+        trace_processes=trace_processes,
     )
 
 
@@ -97,8 +189,82 @@ def run(file, function, arguments, output, video, video_config, absolute_paths,
 @click.option("-c", "--video-config", metavar="PATH", help=VIDEO_CONFIG_HELP)
 @click.option("-P", "--enable-profiler", default=False, is_flag=True, help="Enable profiler output.")
 @click.option("-q", "--quiet", default=False, is_flag=True, help=QUIET_DESC)
-def replay(file, video, video_config, enable_profiler, quiet):
-    debugger.replay(file, video_out_path=video, video_config=video_config, profiler_output=enable_profiler, quiet=quiet)
+@click.option("--from-step", type=click.IntRange(min=1), metavar="N", help="Only replay steps starting at N.")
+@click.option("--to-step", type=click.IntRange(min=1), metavar="N", help="Only replay steps up to and including N.")
+@click.option("--function", metavar="NAME", help="Only replay lines and changes in the given function.")
+@click.option("--variable", metavar="NAME", help="Only replay changes to the given variable.")
+def replay(file, video, video_config, enable_profiler, quiet, from_step, to_step, function, variable):
+    debugger.replay(
+        file,
+        video_out_path=video,
+        video_config=video_config,
+        profiler_output=enable_profiler,
+        quiet=quiet,
+        from_step=from_step,
+        to_step=to_step,
+        function=function,
+        variable=variable,
+    )
+
+
+@cli.command(
+    help="Build the index of the given streamed session recording, which makes filtered replays read only the parts "
+    "that they need. Indices are built while recording, so this is only necessary if the index is missing or out of "
+    "date, e.g. because the program crashed."
+)
+@click.argument("file")
+def index(file):
+    try:
+        rec_index = recording.build_index(file)
+    except ValueError as e:
+        err(str(e))
+
+    click.echo(f"Indexed {len(rec_index.blocks)} blocks")
+
+
+@cli.command(
+    help="Convert the given session recording to another format (JSON, JSON Lines, or binary) based on the extension "
+    "of the output file."
+)
+@click.argument("file")
+@click.argument("output")
+def convert(file, output):
+    debugger.convert(file, output)
+
+
+@cli.command(help=QUERY_HELP)
+@click.argument("file")
+@click.argument("expression")
+@click.option("--function", metavar="NAME", help="Only consider variables in the given function.")
+@click.option("--first", "mode", flag_value="first", help="Only show the first change.")
+@click.option("--last", "mode", flag_value="last", help="Only show the last change.")
+@click.option("-w", "--where", "mode", flag_value="where", help=WHERE_HELP)
+def query(file, expression, function, mode):
+    rec_query = RecordingQuery(file)
+
+    try:
+        if mode == "where":
+            changes = rec_query.find(expression, function)
+        elif mode == "first":
+            changes = [rec_query.first_change(expression, function)]
+        elif mode == "last":
+            changes = [rec_query.last_change(expression, function)]
+        else:
+            changes = rec_query.timeline(expression, function)
+    except SyntaxError as e:
+        err(f"Invalid expression: {e.msg}")
+
+    for change in changes:
+        if change is None:
+            continue
+
+        if mode == "where":
+            # Matches have the values of all the variables in the expression
+            values = ", ".join(f"{ansi.bold(name)} = {render.val(value)}" for name, value in change.value.items())
+        else:
+            values = f"{ansi.bold(expression)} = {render.val(change.value)}"
+
+        click.echo(f"step {change.step} | {change.file_line or '?'} ({change.var.function}) | {values}")
 
 
 def main():
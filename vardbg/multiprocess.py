@@ -0,0 +1,101 @@
+import multiprocessing.process
+import multiprocessing.spawn
+import os
+import signal
+import sys
+from pathlib import Path
+
+from . import internal, recording
+
+# Originals of the multiprocessing functions that are patched while child processes are traced
+_orig_bootstrap = multiprocessing.process.BaseProcess._bootstrap
+_orig_get_preparation_data = multiprocessing.spawn.get_preparation_data
+
+# Configuration for debuggers in child processes (None when child processes aren't traced)
+_child_config = None
+# Debugger that is active in this process, which forked children inherit and have to stop
+_active_debugger = None
+
+
+class ChildConfig:
+    """Holds everything needed to start a debugger in a child process that writes a recording shard"""
+
+    def __init__(self, debugger_cls, options, shard_dir):
+        self.debugger_cls = debugger_cls
+        self.options = options
+        self.shard_dir = shard_dir
+
+    def shard_path(self):
+        return str(Path(self.shard_dir) / f"{os.getpid()}{recording.JSON_LINES_SUFFIX}")
+
+    def __setstate__(self, state):
+        # Spawned children unpickle this as part of their preparation data, which happens before the process
+        # object is bootstrapped, so we can enable tracing in time
+        self.__dict__.update(state)
+        _patch(self)
+
+
+def _exit_on_sigterm(signum, frame):
+    sys.exit(128 + signum)
+
+
+def _traced_bootstrap(process, *args, **kwargs):
+    # Forked children inherit the parent's debugger and tracing state, which belongs to the parent's session
+    if _active_debugger is not None:
+        _active_debugger.backend.stop()
+        sys.stdout = sys.__stdout__
+
+    # Pools terminate their workers, so exit gracefully to get a chance to write the shard
+    if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+    config = _child_config
+    dbg = config.debugger_cls(json_out_path=config.shard_path(), quiet=True, **config.options)
+    try:
+        # Propagate tracing to grandchildren, which write their shards to the same directory
+        dbg.shard_dir = config.shard_dir
+        return dbg.run(_orig_bootstrap, process, *args, **kwargs)
+    finally:
+        # Finish writing the shard even if we're asked to terminate in the meantime
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        dbg.close()
+
+
+def _get_preparation_data(name):
+    data = _orig_get_preparation_data(name)
+    # Smuggle the config into spawned children; multiprocessing ignores keys that it doesn't know
+    data["vardbg_child_config"] = _child_config
+    return data
+
+
+def _patch(config):
+    global _child_config
+
+    _child_config = config
+    multiprocessing.process.BaseProcess._bootstrap = _traced_bootstrap
+    multiprocessing.spawn.get_preparation_data = _get_preparation_data
+
+
+def enable(dbg):
+    """
+    Traces child processes started with multiprocessing (including ProcessPoolExecutor) while the given debugger
+    is running. Each child writes a recording shard to the debugger's shard directory.
+    Note that forkserver children are only traced if the server is started while tracing is enabled.
+    """
+
+    global _active_debugger
+
+    _active_debugger = dbg
+    _patch(ChildConfig(type(dbg), dbg.options, dbg.shard_dir))
+
+
+def disable():
+    global _child_config, _active_debugger
+
+    _child_config = None
+    _active_debugger = None
+    multiprocessing.process.BaseProcess._bootstrap = _orig_bootstrap
+    multiprocessing.spawn.get_preparation_data = _orig_get_preparation_data
+
+
+internal.add_funcs(_exit_on_sigterm, _traced_bootstrap, _get_preparation_data, enable, disable, _patch)
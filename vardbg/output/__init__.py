@@ -1,5 +1,7 @@
+from .binary_writer import BinaryWriter
 from .console_writer import ConsoleWriter
+from .json_lines_writer import JsonLinesWriter
 from .json_writer import JsonWriter
 from .output_delegate import OutputDelegate
 from .video_writer import VideoWriter
-from .writer import Writer
+from .writer import ALL_PARTS, EXEC_TIMES, HISTORY, OUTPUT, VALUES, Writer
@@ -0,0 +1,33 @@
+from ..binary import BinaryEncoder
+from ..recording import BINARY_SUFFIX
+from .json_lines_writer import JsonLinesWriter
+
+
+class BinaryWriter(JsonLinesWriter):
+    """
+    Streams events to a compact binary recording. Strings, frames, and variables are interned in tables that are
+    built up as the recording is written, and builtin values are encoded directly rather than with jsonpickle.
+    """
+
+    suffix = BINARY_SUFFIX
+    file_mode = "wb"
+
+    def open_stream(self, path):
+        file = super().open_stream(path)
+        self.encoder = BinaryEncoder(file)
+        return file
+
+    def write_line(self, obj):
+        # Only the header and the trailer are written as lines
+        self.encoder.write_metadata(obj)
+
+    def encode_event(self, event):
+        self.encoder.write_event(event)
+
+    def write_trailer(self):
+        # The encoder stores values by itself
+        self.encoder.write_metadata(self.data)
+
+    def start_block(self, event):
+        self.index.start_block(self.file.tell(), event)
+        self.encoder.start_block(self.state.to_keyframe())
@@ -4,31 +4,36 @@ import statistics
 import click
 
 from .. import ansi, data, render
-from .writer import Writer
+from .writer import EXEC_TIMES, OUTPUT, Writer
 
 
 class ConsoleWriter(Writer):
+    # Only the changes themselves are printed, so variable history isn't needed
+    consumes = frozenset((OUTPUT, EXEC_TIMES))
+
     def __init__(self, file=None):
         # Output file
         self.file = file or click.get_text_stream("stdout")
         # Current line output prefix
         self.cur_line = ""
-        # Last stdout output length
-        self.stdout_last_len = 0
 
     def print(self, *args, **kwargs):
         click.echo(*args, **kwargs, file=self.file)
 
-    def write_cur_frame(self, frame_info, output):
+    def write_cur_frame(self, frame_info, new_output, thread_id, task):
         # Construct friendly filename + line number + function string
         file_line = "%s:%-2d" % (frame_info.file, frame_info.line)
-        self.cur_line = f"{file_line} ({frame_info.function})"
-
-        # Print new stdout output
-        new_output = output[self.stdout_last_len :]
+        context = frame_info.function
+        if thread_id:
+            # Only show thread IDs once there's more than the main thread
+            context += f", thread {thread_id}"
+        if task is not None:
+            context += f", task {task}"
+        self.cur_line = f"{file_line} ({context})"
+
+        # Print new stdout output of this thread
         if new_output:
             self.file.write(new_output)
-        self.stdout_last_len = len(output)
 
     def write_frame_exec(self, frame_info, exec_time, exec_times):
         nr_times = len(exec_times)
@@ -41,18 +46,22 @@ class ConsoleWriter(Writer):
     def _write_action(self, var, color_func, action, suffix):
         self.print(f"{self.cur_line} | {ansi.bold(var)} {color_func(action)} {suffix}")
 
-    def write_add(self, var, val, history, *, action, plural):
+    def write_add(self, var, val, variable, history, *, action, plural):
         _plural = "s" if plural else ""
         self._write_action(var, ansi.green, action, f"with value{_plural} {render.val(val)}")
 
-    def write_change(self, var, val_before, val_after, history, *, action):
+    def write_change(self, var, val_before, val_after, variable, history, *, action):
         self._write_action(
             var, ansi.blue, action, f"from {render.val(val_before)} to {render.val(val_after)}",
         )
 
-    def write_remove(self, var, val, history, *, action):
+    def write_remove(self, var, val, variable, history, *, action):
         self._write_action(var, ansi.red, action, f"(value: {render.val(val)})")
 
+    def write_var_values(self, var, values):
+        # Values are summarized at the end instead
+        pass
+
     def write_variable_summary(self, var_history):
         self.print()
         self.print("Variables seen:")
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import shutil
+from pathlib import Path
+
+import jsonpickle
+
+from .. import data
+from ..index import RecordingIndex
+from ..recording import (
+    FORMAT_VERSION,
+    JSON_LINES_SUFFIX,
+    REFERENCED_FIELDS,
+    SHARD_GLOB,
+    STORED_VALUE_TAG,
+    STORED_VALUES,
+    VALUE_FIELDS,
+    open_recording,
+    read_events,
+)
+from ..state import State
+from ..timing import wall_time
+from .json_writer import NEW_FRAME, JsonWriter, ValueTimes, combine_summaries, merge_events, shard_process
+
+# Maximum time between flushes of the recording to disk in ns, which bounds how much a crash can lose
+FLUSH_INTERVAL = 1_000_000_000
+# Containers in the values of variables with at least this many items are stored once per block in the value table
+STORE_MIN_ITEMS = 4
+# Lists and tuples longer than this are split into chunks that are stored separately, so that values which only
+# differ in a few elements share most of their chunks
+CHUNK_ITEMS = 16
+# Types of values that are stored in the value table
+STORED_TYPES = (list, tuple, dict, set, frozenset)
+# Types that jsonpickle writes as they are, so lines that only contain them can be encoded by json directly
+PLAIN_TYPES = {bool, float, int, str, type(None)}
+
+
+class JsonLinesWriter(JsonWriter):
+    """
+    Streams events to a JSON Lines recording as they happen, so memory usage doesn't grow with the length of the
+    session. The first line is a header with the format version, followed by one line per event and a trailer
+    with the summaries. Frames and variables are defined on a line of their own before the first event that
+    uses them, and events refer to them by index. Containers in the values of variables are defined the same way,
+    keyed by the hash of their JSON, so values that repeat (or long lists that only differ in a few chunks) are only
+    written once per block.
+
+    Events are grouped into blocks that can be read independently, and the offsets of the blocks are saved in an
+    index next to the recording. Each block starts with a keyframe of the state of the program at that point.
+    """
+
+    # Extension of our own shard when tracing child processes, and the mode to open recordings with
+    suffix = JSON_LINES_SUFFIX
+    file_mode = "w"
+
+    def __init__(self, output_path, shard_dir=None):
+        super().__init__(output_path, shard_dir=shard_dir)
+
+        # Only the summaries for the trailer are kept in memory
+        self.data = {}
+        # Highest thread ID seen, used to assign IDs to the threads of child processes
+        self.max_thread_id = 0
+        # Maps of referenced objects to their indices for each field
+        self.tables = {field: {} for field in REFERENCED_FIELDS}
+        # Map of hashes of the definitions of stored values to their indices
+        self.stored_values = {}
+        # Index of the blocks written so far
+        self.index = RecordingIndex(FORMAT_VERSION)
+        # State of the program after the last event, which is written as a keyframe at the start of each block
+        self.state = State()
+        # Pickler reused for all lines, since creating one for each of them takes longer than most lines
+        self.pickler = jsonpickle.Pickler()
+
+        # With child processes, our own events are written as another shard and merged with theirs in the end
+        if shard_dir is None:
+            self.stream_path = output_path
+        else:
+            self.stream_path = Path(shard_dir) / f"main{self.suffix}"
+
+        self.file = self.open_stream(self.stream_path)
+        self.last_flush_time = wall_time()
+        self.write_line({"version": FORMAT_VERSION})
+
+    def open_stream(self, path):
+        return open_recording(path, self.file_mode)
+
+    def write_line(self, obj):
+        # Most events only hold references and numbers once they're encoded, which don't need to be flattened
+        if PLAIN_TYPES.issuperset(map(type, obj.values())):
+            self.file.write(json.dumps(obj))
+        else:
+            self.file.write(json.dumps(self.pickler.flatten(obj)))
+        self.file.write("\n")
+
+    def get_ref(self, field, obj, time):
+        table = self.tables[field]
+        ref = table.get(obj)
+        if ref is None:
+            ref = len(table)
+            table[obj] = ref
+            # Definitions have the time and process of their first event to be merged along with it
+            self.write_line({"define": field, "id": ref, "time": time, "process": self.process_id, "value": obj})
+
+        return ref
+
+    def get_value_ref(self, value, time):
+        if type(value) in (list, tuple) and len(value) > CHUNK_ITEMS:
+            chunks = [
+                self.get_value_ref(list(value[start : start + CHUNK_ITEMS]), time)
+                for start in range(0, len(value), CHUNK_ITEMS)
+            ]
+            definition = {"chunks": chunks, "tuple": type(value) is tuple}
+        elif type(value) is list and PLAIN_TYPES.issuperset(map(type, value)):
+            # Like events, lists of plain values (e.g. most chunks) are written as they are
+            definition = {"value": value}
+        else:
+            definition = {"value": self.pickler.flatten(value)}
+
+        # Values are identified by their definition, so equal values are only stored once
+        key = hashlib.blake2b(json.dumps(definition).encode("utf-8"), digest_size=16).digest()
+        ref = self.stored_values.get(key)
+        if ref is None:
+            ref = len(self.stored_values)
+            self.stored_values[key] = ref
+
+            # Values are only used by the events that follow them, so unlike other definitions they aren't merged
+            line = {"define": STORED_VALUES, "id": ref}
+            line.update(definition)
+            self.file.write(json.dumps(line))
+            self.file.write("\n")
+
+        return ref
+
+    def store_value(self, value, time):
+        # Small containers take less space than references to them
+        if type(value) not in STORED_TYPES or len(value) < STORE_MIN_ITEMS:
+            return value
+
+        return {STORED_VALUE_TAG: self.get_value_ref(value, time)}
+
+    def store_var_value(self, value, time):
+        # Values are shared with the debugger, so they're copied rather than modified
+        stored = data.VarValue.__new__(data.VarValue)
+        stored.value = self.store_value(value.value, time)
+        stored.file_line = value.file_line
+        return stored
+
+    def store_var_values(self, values, time):
+        stored = [self.store_var_value(value, time) for value in values]
+        # Histories of variables that were never assigned are empty tuples in version 1 recordings
+        if not isinstance(values, data.VarValues):
+            return type(values)(stored)
+
+        stored = data.VarValues(*stored, ignored=values.ignored)
+        stored.deleted_line = values.deleted_line
+        return stored
+
+    def encode_event(self, event):
+        time = event["time"]
+        for field in REFERENCED_FIELDS:
+            if field in event:
+                event[field] = self.get_ref(field, event[field], time)
+
+        for field in VALUE_FIELDS:
+            if field in event:
+                event[field] = self.store_value(event[field], time)
+
+        if "values" in event:
+            event["values"] = [self.store_var_value(value, time) for value in event["values"]]
+        if "history" in event:
+            # Version 1 recordings that are being converted store the history in every event
+            history = event["history"]
+            stored = data.VarHistory.__new__(data.VarHistory)
+            stored.__setstate__(
+                {
+                    "var": history.var,
+                    "var_history": self.store_var_values(history.var_history, time),
+                    "other_history": [
+                        (var, self.store_var_values(values, time)) for var, values in history.other_history
+                    ],
+                }
+            )
+            event["history"] = stored
+
+        self.write_line(event)
+
+    def write_trailer(self):
+        # Summaries refer to the values stored in the last block
+        trailer = dict(self.data)
+        if "var_history" in trailer:
+            time = wall_time()
+            trailer["var_history"] = [
+                (var, self.store_var_values(values, time)) for var, values in trailer["var_history"]
+            ]
+
+        self.write_line(trailer)
+
+    def start_block(self, event):
+        self.index.start_block(self.file.tell(), event)
+        # Objects are defined again in every block so that reading can start at any of them
+        self.tables = {field: {} for field in REFERENCED_FIELDS}
+        self.stored_values = {}
+        self.write_line({"block": len(self.index.blocks) - 1, "keyframe": self.state.to_keyframe()})
+
+    def append_event(self, event):
+        # Blocks start at frames so that the changes made by each line are in the same block as the line itself
+        if not self.index.blocks or (event["event"] == NEW_FRAME and self.index.is_full()):
+            self.start_block(event)
+
+        self.state.apply(event)
+        self.index.add_event(event)
+        self.encode_event(event)
+
+        # Flush periodically so that recordings of crashed programs are only missing the last few events
+        if event["time"] - self.last_flush_time >= FLUSH_INTERVAL:
+            self.file.flush()
+            self.last_flush_time = event["time"]
+
+    def write_cur_frame(self, frame_info, new_output, thread_id, task):
+        self.max_thread_id = max(self.max_thread_id, thread_id)
+        super().write_cur_frame(frame_info, new_output, thread_id, task)
+
+    def remap_thread(self, event, thread_ids):
+        # Give the threads of each child process IDs that don't collide with the ones from other processes
+        if event["process"] != self.process_id:
+            key = event["process"], event["thread"]
+            if key not in thread_ids:
+                thread_ids[key] = self.max_thread_id + 1 + len(thread_ids)
+
+            event["thread"] = thread_ids[key]
+
+    def merge_shards(self):
+        # Our own events come first so that our threads keep their IDs
+        shard_paths = sorted(path for path in Path(self.shard_dir).glob(SHARD_GLOB) if path != self.stream_path)
+        paths = [self.stream_path] + shard_paths
+        shards = [{} for _ in paths]
+        streams = [read_events(path, shard) for path, shard in zip(paths, shards)]
+        thread_ids = {}
+        value_times = ValueTimes()
+
+        # The merged recording is written like any other, so it gets blocks and an index of its own
+        merged = type(self)(self.output_path)
+
+        for step, event in enumerate(merge_events(streams), start=1):
+            self.remap_thread(event, thread_ids)
+            event["step"] = step
+            value_times.add_event(event)
+            merged.append_event(event)
+
+        # Trailers have been read once all events were merged
+        for shard in shards:
+            shard.pop("version", None)
+
+        processes = [self.process_id] + [shard_process(path) for path in shard_paths]
+        combine_summaries(list(zip(processes, shards)), value_times)
+        merged.data.update(shards[0])
+        merged.close()
+
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+
+    def close(self):
+        self.write_trailer()
+        self.file.close()
+
+        if self.shard_dir is None:
+            self.index.save(self.output_path)
+        else:
+            self.merge_shards()
@@ -1,9 +1,14 @@
-import copy
+import heapq
+import os
+import shutil
+from pathlib import Path
 
 import jsonpickle
 
+from .. import data
+from ..recording import FORMAT_VERSION, SHARD_GLOB, open_recording, read_json_lines
 from ..timing import wall_time
-from .writer import Writer
+from .writer import EXEC_TIMES, OUTPUT, VALUES, Writer
 
 NEW_FRAME = "new_frame"
 EXECUTE_FRAME = "exec_frame"
@@ -11,62 +16,241 @@ EXECUTE_FRAME = "exec_frame"
 ADD_VARIABLE = "add_var"
 CHANGE_VARIABLE = "change_var"
 REMOVE_VARIABLE = "remove_var"
+UPDATE_VALUES = "var_values"
+
+
+def shard_process(path):
+    # Child processes name their recording shards after their process IDs
+    return int(Path(path).stem)
+
+
+def _frame_groups(events):
+    # Events that follow a frame were caused by its line, so they're kept together with it
+    group = []
+    for event in events:
+        if event["event"] == NEW_FRAME and group:
+            yield group
+            group = []
+
+        group.append(event)
+
+    if group:
+        yield group
+
+
+def merge_events(streams):
+    """
+    Interleaves the events of several processes by time while preserving the order of events within each process.
+    Frames are ordered by their time and followed by all of their events, so events of other processes never end up
+    between a frame and the changes made by its line.
+    """
+
+    for group in heapq.merge(*map(_frame_groups, streams), key=lambda group: group[0]["time"]):
+        yield from group
+
+
+class ValueTimes:
+    """Keeps track of when the values of variables were recorded in each process to combine their histories by time"""
+
+    def __init__(self):
+        # Map of (process, variable) pairs to the times of the values that each variable has had
+        self.times = {}
+
+    def add_event(self, event):
+        if event["event"] != UPDATE_VALUES:
+            return
+
+        key = event["process"], event["var"]
+        if event["new"] or key not in self.times:
+            self.times[key] = []
+
+        self.times[key].extend(event["time"] for _ in event["values"])
+
+    def get(self, process, var, count):
+        times = self.times.get((process, var), [])[-count:] if count else []
+        # Values that weren't recorded in events are treated as the earliest ones
+        return [0] * (count - len(times)) + times
+
+
+def _combine_values(parts):
+    # Parts are (VarValues, times) pairs of the processes that have the variable
+    values = parts[0][0]
+    if len(parts) == 1:
+        return values
+
+    combined = data.VarValues(ignored=values.ignored)
+    combined.deleted_line = values.deleted_line
+    timed_values = (zip(times, values) for values, times in parts)
+    combined.extend(value for _, value in heapq.merge(*timed_values, key=lambda timed_value: timed_value[0]))
+    return combined
+
+
+def combine_summaries(summaries, value_times):
+    """
+    Combines the summaries of several processes, which are given as (process, summary) pairs, into the first one.
+    The same variables and lines can be executed in several processes, so their histories are interleaved by time.
+    """
+
+    combined = summaries[0][1]
+
+    if "frame_exec_times" in combined:
+        exec_times = dict(combined["frame_exec_times"])
+        for _, summary in summaries[1:]:
+            for frame_info, times in summary.get("frame_exec_times", ()):
+                exec_times.setdefault(frame_info, []).extend(times)
+
+        combined["frame_exec_times"] = list(exec_times.items())
+
+    if "var_history" in combined:
+        histories = {}
+        for process, summary in summaries:
+            for var, values in summary.get("var_history", ()):
+                histories.setdefault(var, []).append((values, value_times.get(process, var, len(values))))
+
+        combined["var_history"] = [(var, _combine_values(parts)) for var, parts in histories.items()]
 
 
 class JsonWriter(Writer):
-    def __init__(self, output_path):
+    # Variable histories are reconstructed from value updates during replay, so they're never recorded
+    consumes = frozenset((OUTPUT, EXEC_TIMES, VALUES))
+
+    def __init__(self, output_path, shard_dir=None):
         self.output_path = output_path
+        # Directory with recording shards of child processes to merge into this recording (None if not tracing them)
+        self.shard_dir = shard_dir
 
-        self.data = {"events": []}
+        self.data = {"version": FORMAT_VERSION, "events": []}
         self._step = 0
+        # Process that all events belong to
+        self.process_id = os.getpid()
+        # Thread of the current frame, which all following events belong to
+        self.thread_id = 0
+        # Map of variables to the first equal Variable object, which is reused in all events so it's only stored once
+        self.variables = {}
+        # Map of variables to their VarValues object and the number of its values that have been recorded
+        self.recorded_values = {}
 
     def step(self):
         self._step += 1
         return self._step
 
-    def write_event(self, evt_name, **kwargs):
-        event = {"step": self.step(), "time": wall_time(), "event": evt_name}
+    def new_event(self, evt_name, **kwargs):
+        event = {
+            "step": self.step(),
+            "time": wall_time(),
+            "process": self.process_id,
+            "thread": self.thread_id,
+            "event": evt_name,
+        }
         event.update(kwargs)
+        return event
 
+    def append_event(self, event):
         self.data["events"].append(event)
 
-    def write_cur_frame(self, frame_info, output):
-        self.write_event(NEW_FRAME, frame_info=frame_info, output=output)
+    def write_event(self, evt_name, **kwargs):
+        self.append_event(self.new_event(evt_name, **kwargs))
+
+    def write_cur_frame(self, frame_info, new_output, thread_id, task):
+        self.thread_id = thread_id
+
+        if new_output:
+            # Only the new output is stored, which is appended to the thread's output during replay
+            self.write_event(NEW_FRAME, frame_info=frame_info, task=task, new_output=new_output)
+        else:
+            self.write_event(NEW_FRAME, frame_info=frame_info, task=task)
 
     def write_frame_exec(self, frame_info, exec_time, exec_times):
-        # exec_times needs to be copied to preserve the *current* state
-        self.write_event(EXECUTE_FRAME, frame_info=frame_info, exec_time=exec_time, exec_times=exec_times.copy())
+        # Previous execution times are reconstructed from earlier events during replay
+        self.write_event(EXECUTE_FRAME, frame_info=frame_info, exec_time=exec_time)
 
-    def write_add(self, var, val, history, *, action, plural):
+    def _intern_var(self, var):
+        return self.variables.setdefault(var, var)
+
+    def write_add(self, var, val, variable, history, *, action, plural):
         self.write_event(
-            ADD_VARIABLE, var_name=var, value=val, history=copy.deepcopy(history), action=action, plural=plural,
+            ADD_VARIABLE, var_name=var, value=val, var=self._intern_var(variable), action=action, plural=plural,
         )
 
-    def write_change(self, var, val_before, val_after, history, *, action):
+    def write_change(self, var, val_before, val_after, variable, history, *, action):
         self.write_event(
             CHANGE_VARIABLE,
             var_name=var,
             value_before=val_before,
             value_after=val_after,
-            history=copy.deepcopy(history),
+            var=self._intern_var(variable),
             action=action,
         )
 
-    def write_remove(self, var, val, history, *, action):
-        self.write_event(REMOVE_VARIABLE, var_name=var, value=val, history=copy.deepcopy(history), action=action)
+    def write_remove(self, var, val, variable, history, *, action):
+        self.write_event(REMOVE_VARIABLE, var_name=var, value=val, var=self._intern_var(variable), action=action)
+
+    def write_var_values(self, var, values):
+        var = self._intern_var(var)
+
+        # Only store values that haven't been recorded yet, unless the variable got a new set of values
+        recorded = self.recorded_values.get(var)
+        new = recorded is None or recorded[0] is not values
+        start = 0 if new else recorded[1]
+        self.recorded_values[var] = values, len(values)
+
+        self.write_event(
+            UPDATE_VALUES,
+            var=var,
+            new=new,
+            ignored=values.ignored,
+            values=values[start:],
+            deleted_line=values.deleted_line,
+        )
 
     def write_variable_summary(self, var_history):
         self.data["var_history"] = list(var_history.items())
 
     def write_profiler_summary(self, frame_exec_times):
-        # frame_exec_times is skipped because it can be readily reconstructed during replay
-        pass
+        # Execution events can't be used to reconstruct this during replay when lines are sampled
+        self.data["frame_exec_times"] = list(frame_exec_times.items())
 
     def write_time_summary(self, exec_start_time, exec_stop_time):
         self.data["exec_start_time"] = exec_start_time
         self.data["exec_stop_time"] = exec_stop_time
 
+    def merge_shards(self):
+        shards = []
+        processes = []
+        for path in sorted(Path(self.shard_dir).glob(SHARD_GLOB)):
+            # Children that were killed can leave incomplete shards behind, which end at their last complete event
+            shard = {}
+            shard["events"] = list(read_json_lines(path, shard))
+            shards.append(shard)
+            processes.append(shard_process(path))
+
+        shutil.rmtree(self.shard_dir, ignore_errors=True)
+
+        # Give the threads of each child process IDs that don't collide with the ones from other processes
+        thread_ids = {}
+        next_thread_id = 1 + max((event["thread"] for event in self.data["events"]), default=0)
+        for shard in shards:
+            for event in shard["events"]:
+                key = event["process"], event["thread"]
+                if key not in thread_ids:
+                    thread_ids[key] = next_thread_id
+                    next_thread_id += 1
+
+                event["thread"] = thread_ids[key]
+
+        streams = [self.data["events"]] + [shard["events"] for shard in shards]
+        self.data["events"] = list(merge_events(streams))
+        value_times = ValueTimes()
+        for step, event in enumerate(self.data["events"], start=1):
+            event["step"] = step
+            value_times.add_event(event)
+
+        combine_summaries([(self.process_id, self.data)] + list(zip(processes, shards)), value_times)
+
     def close(self):
+        if self.shard_dir is not None:
+            self.merge_shards()
+
         # Write all the collected data out together
-        with open(self.output_path, "w+") as f:
+        with open_recording(self.output_path, "w") as f:
             f.write(jsonpickle.dumps(self.data))
@@ -1,16 +1,22 @@
-from .writer import Writer
+from .writer import EXEC_TIMES, VALUES, Writer
 
 
 class OutputDelegate(Writer):
     def __init__(self, *writers):
         self.writers = writers
+        # Parts that at least one writer uses
+        self.consumes = frozenset().union(*(writer.consumes for writer in writers))
+        # Writers that show profiler events
+        self.exec_writers = [writer for writer in writers if EXEC_TIMES in writer.consumes]
+        # Writers that keep track of variable values
+        self.values_writers = [writer for writer in writers if VALUES in writer.consumes]
 
     def write_cur_frame(self, *args, **kwargs):
         for writer in self.writers:
             writer.write_cur_frame(*args, **kwargs)
 
     def write_frame_exec(self, *args, **kwargs):
-        for writer in self.writers:
+        for writer in self.exec_writers:
             writer.write_frame_exec(*args, **kwargs)
 
     def write_add(self, *args, **kwargs):
@@ -25,6 +31,10 @@ class OutputDelegate(Writer):
         for writer in self.writers:
             writer.write_remove(*args, **kwargs)
 
+    def write_var_values(self, *args, **kwargs):
+        for writer in self.values_writers:
+            writer.write_var_values(*args, **kwargs)
+
     def write_variable_summary(self, *args, **kwargs):
         for writer in self.writers:
             writer.write_variable_summary(*args, **kwargs)
@@ -8,7 +8,7 @@ import pygments
 from pygments.lexers.python import PythonLexer
 
 from ... import render
-from ..writer import Writer
+from ..writer import EXEC_TIMES, HISTORY, OUTPUT, Writer
 from .renderer import FrameRenderer
 
 VarState = collections.namedtuple("VarState", ("name", "color", "action", "value", "ref", "text", "other_history"))
@@ -34,6 +34,29 @@ def wrap_text(text, cols, rows=None):
     return wrapped_lines
 
 
+class WrappedOutput:
+    """Output of one thread that is wrapped incrementally, only keeping the lines that can be shown"""
+
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        # Wrapped lines that are complete
+        self.lines = []
+        # Last line, which can still be extended
+        self.tail = ""
+
+    def append(self, text):
+        parts = (self.tail + text).replace("\r", "").split("\n")
+        for line in parts[:-1]:
+            self.lines += wrap_text(line, self.cols)
+
+        self.tail = parts[-1]
+        del self.lines[: -self.rows]
+
+    def get_lines(self):
+        return self.lines + wrap_text(self.tail, self.cols)
+
+
 def split_lexed_lines(lst):
     lines = []
     line = []
@@ -54,6 +77,8 @@ def split_lexed_lines(lst):
 
 
 class VideoWriter(Writer):
+    consumes = frozenset((HISTORY, OUTPUT, EXEC_TIMES))
+
     def __init__(self, path, config_path, show_profile):
         # File contents
         self.file_cache = {}
@@ -63,6 +88,8 @@ class VideoWriter(Writer):
         self.last_var = None
         # Frame renderer
         self.render = FrameRenderer(path, config_path, show_profile)
+        # Wrapped output of each thread
+        self.outputs = {}
 
     def get_file_lines(self, path):
         if path in self.file_cache:
@@ -73,12 +100,19 @@ class VideoWriter(Writer):
         self.file_cache[path] = lines
         return lines
 
-    def write_cur_frame(self, frame_info, output):
+    def write_cur_frame(self, frame_info, new_output, thread_id, task):
         self.frame_info = frame_info
         self.render.finish_frame(self.last_var)
         self.render.start_frame()
         self.render.draw_code(self.get_file_lines(frame_info.file), frame_info.line)
-        self.render.draw_output(wrap_text(output, self.render.out_cols))
+
+        output = self.outputs.get(thread_id)
+        if output is None:
+            output = WrappedOutput(self.render.out_cols, self.render.out_rows)
+            self.outputs[thread_id] = output
+
+        output.append(new_output)
+        self.render.draw_output(output.get_lines())
 
     def write_frame_exec(self, frame_info, exec_time, exec_times):
         nr_times = len(exec_times)
@@ -123,17 +157,21 @@ class VideoWriter(Writer):
         # Save state; this is drawn when the frame is finished
         self.last_var = VarState(name, self.render.get_color(color), action, val, ref, text, history.other_history)
 
-    def write_add(self, var, val, history, *, action="added", plural):
+    def write_add(self, var, val, variable, history, *, action="added", plural):
         self._write_action(var, val, self.render.GREEN, action, {"Value": repr(val)}, history)
 
-    def write_change(self, var, val_before, val_after, history, *, action="changed"):
+    def write_change(self, var, val_before, val_after, variable, history, *, action="changed"):
         self._write_action(
             var, val_after, self.render.BLUE, action, {"From": repr(val_before), "To": repr(val_after)}, history,
         )
 
-    def write_remove(self, var, val, history, *, action="removed"):
+    def write_remove(self, var, val, variable, history, *, action="removed"):
         self._write_action(var, val, self.render.RED, action, {"Last value": repr(val)}, history)
 
+    def write_var_values(self, var, values):
+        # History is drawn from the VarHistory of each change
+        pass
+
     def write_variable_summary(self, var_history):
         # Videos don't have summaries
         pass
@@ -1,9 +1,20 @@
 import abc
 
+# Parts of the event payloads that writers can consume; the debugger skips computing parts that no writer uses
+HISTORY = "history"  # VarHistory objects passed to write_add, write_change, and write_remove
+OUTPUT = "output"  # stdout output passed to write_cur_frame
+EXEC_TIMES = "exec_times"  # profiler events passed to write_frame_exec
+VALUES = "values"  # updates of the values that each variable has had, passed to write_var_values
+ALL_PARTS = frozenset((HISTORY, OUTPUT, EXEC_TIMES, VALUES))
+
 
 class Writer(abc.ABC):
+    # Payload parts used by this writer; history is None and output is empty for writers that don't use them.
+    # Variable events also get the Variable itself, which is always available
+    consumes = ALL_PARTS
+
     @abc.abstractmethod
-    def write_cur_frame(self, frame_info, output):
+    def write_cur_frame(self, frame_info, new_output, thread_id, task):
         pass
 
     @abc.abstractmethod
@@ -11,15 +22,20 @@ class Writer(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def write_add(self, var, val, history, *, action, plural):
+    def write_add(self, var, val, variable, history, *, action, plural):
+        pass
+
+    @abc.abstractmethod
+    def write_change(self, var, val_before, val_after, variable, history, *, action):
         pass
 
     @abc.abstractmethod
-    def write_change(self, var, val_before, val_after, history, *, action):
+    def write_remove(self, var, val, variable, history, *, action):
         pass
 
     @abc.abstractmethod
-    def write_remove(self, var, val, history, *, action):
+    def write_var_values(self, var, values):
+        # Called after the VarValues of a variable were created or changed
         pass
 
     @abc.abstractmethod
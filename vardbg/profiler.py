@@ -14,8 +14,8 @@ class Profiler(abc.ABC):
     def __init__(self: "Debugger"):
         # Map of FrameInfo objects and a list of their execution times in ns
         self.frame_exec_times = sortedcontainers.SortedDict()
-        # When the last frame started executing
-        self.prev_frame_start_time = None
+        # Map of thread IDs to when the last frame in each thread started executing
+        self.frame_start_times = {}
 
         # Overall start and stop times
         self.exec_start_time = None
@@ -24,11 +24,15 @@ class Profiler(abc.ABC):
         # Propagate initialization to other mixins
         super().__init__()
 
-    def profile_start_frame(self: "Debugger"):
-        self.prev_frame_start_time = profiler_time()
+    def profile_start_frame(self: "Debugger", thread_id):
+        self.frame_start_times[thread_id] = profiler_time()
 
-    def profile_complete_frame(self: "Debugger", prev_frame_info, end_time):
-        exec_time = end_time - self.prev_frame_start_time
+    def profile_complete_frame(self: "Debugger", prev_frame_info, end_time, thread_id, start_time=None):
+        # Default to the start time of the last frame in this thread
+        if start_time is None:
+            start_time = self.frame_start_times[thread_id]
+
+        exec_time = end_time - start_time
 
         if prev_frame_info in self.frame_exec_times:
             self.frame_exec_times[prev_frame_info].append(exec_time)
@@ -36,7 +40,7 @@ class Profiler(abc.ABC):
             self.frame_exec_times[prev_frame_info] = [exec_time]
 
     def profile_print_frame(self: "Debugger", prev_frame_info):
-        if self.profiler_output:
+        if self.profiler_output and self.out.exec_writers:
             exec_times = self.frame_exec_times[prev_frame_info]
             self.out.write_frame_exec(prev_frame_info, exec_times[-1], exec_times)
 
@@ -0,0 +1,169 @@
+import ast
+import builtins
+import collections
+
+from . import recording
+from .index import value_change
+
+# Change of the value of a variable or expression, and where it happened (None if unknown)
+Change = collections.namedtuple("Change", ("step", "var", "file_line", "value"))
+
+
+class _Undefined:
+    def __repr__(self):
+        return "<undefined>"
+
+
+# Value of expressions that use variables which aren't defined, or that raise an exception
+UNDEFINED = _Undefined()
+
+
+def _compile(expr):
+    tree = ast.parse(expr.strip(), mode="eval")
+    names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+    return compile(tree, "<query>", "eval"), names, isinstance(tree.body, ast.Name)
+
+
+def _same(a, b):
+    # Values like NumPy arrays can't be compared directly
+    try:
+        return a is b or (type(a) is type(b) and bool(a == b))
+    except Exception:
+        return False
+
+
+def _is_true(value):
+    try:
+        return value is not UNDEFINED and bool(value)
+    except Exception:
+        return False
+
+
+class RecordingQuery:
+    """
+    Answers questions about the values of variables in a recording without replaying it. Streamed recordings are
+    indexed by the steps that changed each variable, and the index is built if it's missing, so only the blocks with
+    changes to the variables in question are read. Other recordings are read in full.
+
+    Expressions are Python expressions such as "arr[3]" or "lo > hi", which are evaluated with the values of the
+    variables in the function of each change to any of them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = recording.load_index(path)
+
+    def _read_changes(self, names, function=None, from_step=None):
+        # Yields (step, variable, VarValue or None if it was deleted, file_line) tuples for changes to the given names
+        if self.index is None:
+            events = recording.read_events(self.path, {})
+        else:
+            blocks = set()
+            for name in names:
+                blocks.update(self.index.find_blocks(from_step=from_step, function=function, variable=name))
+
+            # Summaries aren't needed, so the trailer is only read if it follows a block with changes
+            events = recording.read_blocks(self.path, {}, self.index, sorted(blocks), trailer=False)
+
+        # Current values of all variables, which changes of container elements in version 1 recordings are applied to
+        values = {}
+        for event in events:
+            change = value_change(event, values)
+            if change is None:
+                continue
+
+            var, value = change
+            if value is None:
+                values.pop(var, None)
+            else:
+                values[var] = value
+
+            if var.name not in names or function not in (None, var.function):
+                continue
+            if from_step is not None and event["step"] < from_step:
+                continue
+
+            file_line = event.get("deleted_line") if value is None else value.file_line
+            yield event["step"], var, value, file_line
+
+    def _evaluate(self, expr, function=None, from_step=None):
+        # Yields the value of the expression after every change to its variables
+        code, names, _ = _compile(expr)
+        # Map of (file, function) pairs to the current values of the variables in them
+        scopes = {}
+
+        for step, var, value, file_line in self._read_changes(names, function, from_step):
+            scope = scopes.setdefault(var.function_key(), {})
+            if value is None:
+                scope.pop(var.name, None)
+            else:
+                scope[var.name] = value.value
+
+            try:
+                result = eval(code, {"__builtins__": builtins}, dict(scope))
+            except Exception:
+                result = UNDEFINED
+
+            yield Change(step, var, file_line, result), scope
+
+    def changes(self, variable, function=None):
+        """Returns the sorted steps that changed the given variable, in the given function or any of them"""
+
+        if self.index is not None:
+            return self.index.change_steps(variable, function)
+
+        return [step for step, _, _, _ in self._read_changes({variable}, function)]
+
+    def _timeline(self, expr, function=None, from_step=None):
+        _, _, is_name = _compile(expr)
+        # Last value of the expression in each function
+        last_values = {}
+
+        for change, _ in self._evaluate(expr, function, from_step):
+            key = change.var.function_key()
+            # Every change of a variable is reported, even if the value is equal to one it had before
+            if is_name or not _same(last_values.get(key, UNDEFINED), change.value):
+                yield change
+
+            last_values[key] = change.value
+
+    def timeline(self, expr, function=None):
+        """Returns a list of Changes with the steps that changed the value of the given expression and the new values"""
+
+        return list(self._timeline(expr, function))
+
+    def first_change(self, expr, function=None):
+        """Returns the first Change of the value of the given expression, or None if it never changed"""
+
+        return next(self._timeline(expr, function), None)
+
+    def last_change(self, expr, function=None):
+        """Returns the last Change of the value of the given expression, or None if it never changed"""
+
+        from_step = None
+        _, names, is_name = _compile(expr)
+        if is_name and self.index is not None:
+            # Values of plain variables don't depend on earlier changes, so only the last one has to be read
+            steps = self.changes(next(iter(names)), function)
+            if not steps:
+                return None
+            from_step = steps[-1]
+
+        last = None
+        for last in self._timeline(expr, function, from_step):
+            pass
+
+        return last
+
+    def find(self, predicate, function=None):
+        """
+        Returns a list of Changes with the steps at which the given expression is true after a change to its variables,
+        with maps of the variables to their values at that point as the values
+        """
+
+        matches = []
+        for change, scope in self._evaluate(predicate, function):
+            if _is_true(change.value):
+                matches.append(change._replace(value=dict(scope)))
+
+        return matches
@@ -0,0 +1,471 @@
+import gzip
+import json
+import lzma
+import re
+from pathlib import Path
+
+import jsonpickle
+
+from . import binary, index
+
+# Version of the recording format; version 1 recordings store full copies of the history in every event, and version 3
+# streamed recordings store containers once per block in a table of values
+FORMAT_VERSION = 3
+
+# Extensions of recordings that are streamed as JSON Lines rather than written as one JSON document
+JSON_LINES_SUFFIX = ".jsonl"
+# Extension of compact binary recordings, which are streamed as well
+BINARY_SUFFIX = ".vardbg"
+# Pattern of the recording shards written by child processes, which are always streamed
+SHARD_GLOB = "*" + JSON_LINES_SUFFIX
+# Event fields whose objects are defined once in JSON Lines recordings and then referenced by their index
+REFERENCED_FIELDS = ("frame_info", "var")
+# Event fields with values of variables, which are stored in the value table if they're containers
+VALUE_FIELDS = ("value", "value_before", "value_after")
+# Name of the value table in definitions, and key of the objects that refer to values in it
+STORED_VALUES = "value"
+STORED_VALUE_TAG = "vardbg/value"
+# Functions that open compressed recordings by extension
+COMPRESSED_OPENERS = {".gz": gzip.open, ".xz": lzma.open, ".lzma": lzma.open}
+# Number of characters of JSON documents to read at once, which is increased for values that don't fit
+CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r"\s*")
+
+
+def _split_path(path):
+    # Returns the opener for the compression of the given path (None if uncompressed) and the path without it
+    path = Path(path)
+    opener = COMPRESSED_OPENERS.get(path.suffix.lower())
+    if opener is not None:
+        path = path.with_suffix("")
+
+    return opener, path
+
+
+def open_recording(path, mode="r"):
+    """
+    Opens the given recording as text (or binary if the mode contains "b"), compressing or decompressing it if it has
+    a compression extension
+    """
+
+    opener, _ = _split_path(path)
+    if opener is None:
+        return open(path, mode)
+    elif "b" in mode:
+        return opener(path, mode)
+    else:
+        return opener(path, mode + "t")
+
+
+def is_json_lines(path):
+    """Returns whether the given recording is streamed as JSON Lines, based on its extension"""
+
+    _, path = _split_path(path)
+    return path.suffix.lower() == JSON_LINES_SUFFIX
+
+
+def is_binary(path):
+    """Returns whether the given recording is in the binary format, based on its extension"""
+
+    _, path = _split_path(path)
+    return path.suffix.lower() == BINARY_SUFFIX
+
+
+def check_version(data):
+    version = data.get("version", 1)
+    if version > FORMAT_VERSION:
+        raise ValueError(f"Unsupported recording format version {version}")
+
+
+class _StoredValues:
+    """Values stored in a block of a JSON Lines recording, which are only restored once they're used"""
+
+    def __init__(self):
+        self.definitions = {}
+        self.values = {}
+
+    def define(self, definition):
+        self.definitions[definition["id"]] = definition
+
+    def get(self, ref):
+        if ref in self.values:
+            return self.values[ref]
+
+        definition = self.definitions.pop(ref)
+        if "chunks" in definition:
+            items = []
+            for chunk in definition["chunks"]:
+                items.extend(self.get(chunk))
+
+            value = tuple(items) if definition["tuple"] else items
+        else:
+            value = jsonpickle.Unpickler().restore(definition["value"])
+
+        self.values[ref] = value
+        return value
+
+    def resolve(self, value):
+        if type(value) is dict and STORED_VALUE_TAG in value:
+            return self.get(value[STORED_VALUE_TAG])
+
+        return value
+
+    def resolve_var_values(self, values):
+        for value in values:
+            value.value = self.resolve(value.value)
+
+    def resolve_event(self, event):
+        for field in VALUE_FIELDS:
+            if field in event:
+                event[field] = self.resolve(event[field])
+
+        if "values" in event:
+            self.resolve_var_values(event["values"])
+        if "history" in event:
+            history = event["history"]
+            self.resolve_var_values(history.var_history)
+            for _, values in history.other_history:
+                self.resolve_var_values(values)
+
+    def resolve_metadata(self, metadata):
+        for _, values in metadata.get("var_history", ()):
+            self.resolve_var_values(values)
+
+
+def read_json_lines(path, metadata, start=0, on_block=None):
+    """
+    Yields the events of a JSON Lines recording one at a time. The header with the format version and the trailer
+    with the summaries are added to the given metadata dict as they're read.
+    Reading starts at the given offset, which must be the start of a block, and on_block is called with the offset and
+    keyframe (None if it doesn't have one) of every block that's read. Recordings that were cut off (e.g. because the
+    program crashed) end at their last complete line.
+    """
+
+    # Objects and values that events refer to by index
+    tables = {field: {} for field in REFERENCED_FIELDS}
+    stored = _StoredValues()
+
+    # Offsets are counted in bytes, so lines are only decoded by the JSON parser
+    with open_recording(path, "rb") as f:
+        f.seek(start)
+        offset = start
+
+        try:
+            for line in f:
+                line_offset = offset
+                offset += len(line)
+
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    break
+
+                if "event" in obj:
+                    event = jsonpickle.Unpickler().restore(obj)
+                    for field in REFERENCED_FIELDS:
+                        if field in event:
+                            event[field] = tables[field][event[field]]
+
+                    stored.resolve_event(event)
+                    yield event
+                elif "define" in obj:
+                    if obj["define"] == STORED_VALUES:
+                        stored.define(obj)
+                    else:
+                        tables[obj["define"]][obj["id"]] = jsonpickle.Unpickler().restore(obj["value"])
+                elif "block" in obj:
+                    # Objects and values are defined again in every block
+                    tables = {field: {} for field in REFERENCED_FIELDS}
+                    stored = _StoredValues()
+                    if on_block is not None:
+                        # Keyframes are only restored when they're used
+                        keyframe = obj.get("keyframe")
+                        if keyframe is not None:
+                            keyframe = jsonpickle.Unpickler().restore(keyframe)
+
+                        on_block(line_offset, keyframe)
+                else:
+                    data = jsonpickle.Unpickler().restore(obj)
+                    stored.resolve_metadata(data)
+                    metadata.update(data)
+                    check_version(metadata)
+        except EOFError:
+            # Compressed streams that were cut off end abruptly
+            pass
+
+
+def read_binary(path, metadata, start=0, on_block=None):
+    """
+    Yields the events of a binary recording one at a time, like read_json_lines. Recordings that were cut off end at
+    their last complete event.
+    """
+
+    with open_recording(path, "rb") as f:
+        for is_event, contents in binary.read_records(f, start, on_block):
+            if is_event:
+                yield contents
+            else:
+                metadata.update(contents)
+                check_version(metadata)
+
+
+def _read_stream(path, metadata, start=0, on_block=None):
+    if is_binary(path):
+        return read_binary(path, metadata, start, on_block)
+    else:
+        return read_json_lines(path, metadata, start, on_block)
+
+
+class _DocumentScanner:
+    """Parses the values in a JSON document one at a time while reading it in chunks"""
+
+    def __init__(self, file):
+        self.file = file
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self):
+        # Read at least as much as we already have, so values that span many chunks are only parsed a few times
+        chunk = self.file.read(max(CHUNK_SIZE, len(self.buf) - self.pos))
+        if not chunk:
+            return False
+
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON recording")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' in JSON recording")
+
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+
+            # Numbers at the end of the buffer might continue in the next chunk
+            if end == len(self.buf) and self._fill():
+                continue
+
+            self.pos = end
+            return value
+
+    def items(self, end_char):
+        # Yields once for every item of the array or object whose opening bracket was just consumed
+        if self.peek() == end_char:
+            self.pos += 1
+            return
+
+        while True:
+            yield
+            if self.peek() == end_char:
+                self.pos += 1
+                return
+            self.expect(",")
+
+
+class _PartialUnpickler(jsonpickle.Unpickler):
+    """Restores parts of a JSON document one at a time, keeping the objects that later parts can refer to"""
+
+    def restore_part(self, obj):
+        value = self.restore(obj, reset=False)
+        # Parts are complete by themselves, so references to objects that were still being restored can be resolved
+        self._swap_proxies()
+        return value
+
+
+def read_json_document(path, metadata):
+    """
+    Yields the events of a JSON document recording one at a time, like read_json_lines. Only the events that are
+    being replayed are parsed, but the objects restored from earlier events are kept because later ones can refer to
+    them. Frames are interned since older versions of vardbg stored copies of them in every event.
+    """
+
+    frames = {}
+
+    with open_recording(path) as f:
+        scanner = _DocumentScanner(f)
+        unpickler = _PartialUnpickler()
+
+        # Objects are numbered in the order that they're restored, starting with the document itself
+        scanner.expect("{")
+        unpickler.restore_part({})
+
+        for _ in scanner.items("}"):
+            key = scanner.value()
+            scanner.expect(":")
+
+            if key == "events":
+                scanner.expect("[")
+                unpickler.restore_part([])
+
+                for _ in scanner.items("]"):
+                    event = unpickler.restore_part(scanner.value())
+                    if "frame_info" in event:
+                        event["frame_info"] = frames.setdefault(event["frame_info"], event["frame_info"])
+
+                    yield event
+            else:
+                metadata[key] = unpickler.restore_part(scanner.value())
+                check_version(metadata)
+
+
+def is_streamed(path):
+    """Returns whether the given recording is streamed (as JSON Lines or in the binary format) and can be indexed"""
+
+    return is_json_lines(path) or is_binary(path)
+
+
+def build_index(path):
+    """Builds the index of the blocks of the given streamed recording, saves it next to it, and returns it"""
+
+    if not is_streamed(path):
+        raise ValueError("Only streamed recordings can be indexed")
+
+    metadata = {}
+    offsets = []
+    rec_index = None
+
+    for event in _read_stream(path, metadata, on_block=lambda offset, keyframe: offsets.append(offset)):
+        if rec_index is None:
+            rec_index = index.RecordingIndex(metadata.get("version", 1))
+
+        # Recordings from older versions don't have blocks
+        if not offsets:
+            break
+
+        if len(offsets) > len(rec_index.blocks):
+            rec_index.start_block(offsets[-1], event)
+        rec_index.add_event(event)
+
+    if rec_index is None or not rec_index.blocks:
+        raise ValueError("Recording has no blocks to index, but converting it to a streamed recording adds them")
+
+    rec_index.save(path)
+    return rec_index
+
+
+def load_index(path):
+    """
+    Returns the index of the given recording, building it if it's missing or out of date, or None if the recording
+    can't be indexed
+    """
+
+    if not is_streamed(path):
+        return None
+
+    rec_index = index.RecordingIndex.load(path)
+    if rec_index is None:
+        try:
+            rec_index = build_index(path)
+        except ValueError:
+            # Recordings from older versions don't have blocks
+            return None
+
+    return rec_index
+
+
+def read_blocks(path, metadata, rec_index, blocks, trailer=True):
+    """
+    Yields the events in the given sorted blocks of an indexed recording, and adds the header and trailer to the given
+    metadata dict. The trailer is only read separately if it's wanted.
+    """
+
+    # Contiguous runs of blocks are read at once
+    runs = []
+    for block in blocks:
+        if runs and runs[-1][1] == block - 1:
+            runs[-1][1] = block
+        else:
+            runs.append([block, block])
+
+    metadata["version"] = rec_index.version
+    for first_block, last_block in runs:
+        end_step = rec_index.block_end_step(last_block)
+        events = _read_stream(path, metadata, start=rec_index.blocks[first_block][0])
+
+        try:
+            for event in events:
+                if end_step is not None and event["step"] >= end_step:
+                    break
+
+                yield event
+                # Only the trailer follows the last event
+                if not trailer and event["step"] == rec_index.last_step:
+                    break
+        finally:
+            events.close()
+
+    # The trailer with the summaries follows the last block
+    if trailer and (not runs or runs[-1][1] != len(rec_index.blocks) - 1):
+        for _ in _read_stream(path, metadata, start=rec_index.blocks[-1][0]):
+            pass
+
+
+def read_block(path, rec_index, block):
+    """
+    Returns the keyframe at the start of the given block of an indexed recording (None if it doesn't have one) and a
+    list of the events in the block
+    """
+
+    keyframes = []
+    events = []
+    end_step = rec_index.block_end_step(block)
+    stream = _read_stream(
+        path, {}, start=rec_index.blocks[block][0], on_block=lambda offset, keyframe: keyframes.append(keyframe)
+    )
+
+    try:
+        for event in stream:
+            if end_step is not None and event["step"] >= end_step:
+                break
+
+            events.append(event)
+            # Only the trailer follows the last event
+            if event["step"] == rec_index.last_step:
+                break
+    finally:
+        stream.close()
+
+    return keyframes[0], events
+
+
+def read_events(path, metadata, from_step=None, to_step=None, function=None, variable=None):
+    """
+    Yields the events of a recording in any format one at a time, and adds everything else in it to the given
+    metadata dict.
+
+    If any filters are given and the recording has an up-to-date index, only the blocks of the recording that can
+    contain events matching all of them are read. This only narrows down the events, so they must still be filtered
+    by the caller.
+    """
+
+    filtered = any(value is not None for value in (from_step, to_step, function, variable))
+    if filtered and is_streamed(path):
+        rec_index = index.RecordingIndex.load(path)
+        if rec_index is not None and rec_index.blocks:
+            blocks = rec_index.find_blocks(from_step, to_step, function, variable)
+            yield from read_blocks(path, metadata, rec_index, blocks)
+            return
+
+    if is_streamed(path):
+        yield from _read_stream(path, metadata)
+    else:
+        yield from read_json_document(path, metadata)
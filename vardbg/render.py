@@ -1,8 +1,8 @@
 from . import ansi
 
 
-def key_var(var, key):
-    return f"{var}[{repr(key)}]"
+def key_path(var, path):
+    return var + "".join(f"[{repr(key)}]" for key in path)
 
 
 def val(value):
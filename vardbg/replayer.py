@@ -1,60 +1,230 @@
 import abc
 from typing import TYPE_CHECKING
 
-import jsonpickle
-
-from .output.json_writer import ADD_VARIABLE, CHANGE_VARIABLE, EXECUTE_FRAME, NEW_FRAME, REMOVE_VARIABLE
+from . import data, index, recording
+from .output.json_writer import ADD_VARIABLE, CHANGE_VARIABLE, EXECUTE_FRAME, NEW_FRAME, REMOVE_VARIABLE, UPDATE_VALUES
+from .state import State
 
 if TYPE_CHECKING:
     from .debugger import Debugger
 
 
+def _get_new_output(event, output_lens):
+    # Recordings from older versions store the full output of the thread in every frame
+    if "output" in event:
+        thread_id = event.get("thread", 0)
+        output = event["output"]
+        last_len = output_lens.get(thread_id, 0)
+        output_lens[thread_id] = len(output)
+        return output[last_len:]
+
+    return event.get("new_output", "")
+
+
+def filter_events(events, from_step=None, to_step=None, function=None, variable=None):
+    """
+    Yields the events in the given range of steps that happened in the given function and concern the given variable.
+    Each event is preceded by the frame that it belongs to, even if the frame itself doesn't match.
+    """
+
+    # Last frame of each thread, and whether it has been yielded yet
+    frames = {}
+
+    for event in events:
+        # Later events are still read because the summaries come after them
+        key = event.get("process"), event.get("thread", 0)
+        in_range = (from_step is None or event["step"] >= from_step) and (to_step is None or event["step"] <= to_step)
+
+        if event["event"] == NEW_FRAME:
+            # Frames are yielded along with their changes when filtering by variable
+            matches = in_range and variable is None and function in (None, event["frame_info"].function)
+            frames[key] = [event, matches]
+            if matches:
+                yield event
+
+            continue
+
+        if not in_range:
+            continue
+        if function is not None and index.event_function(event) != function:
+            continue
+        if variable is not None and index.event_variable(event) != variable:
+            continue
+
+        frame = frames.get(key)
+        if frame is not None and not frame[1]:
+            frame[1] = True
+            yield frame[0]
+
+        yield event
+
+
+def _prepend_output(events, outputs):
+    # Output printed before the first replayed step is shown along with the first replayed frame of each thread
+    for event in events:
+        if event["event"] == NEW_FRAME:
+            output = outputs.pop((event.get("process"), event.get("thread", 0)), None)
+            # Recordings from older versions store the full output of the thread in every frame
+            if output is not None and "output" not in event:
+                event = dict(event, new_output=output + event.get("new_output", ""))
+
+        yield event
+
+
+def _apply_events(state, events, step):
+    # Events after the given step are left unread
+    for event in events:
+        if event["step"] > step:
+            break
+
+        state.apply(event)
+
+    return state
+
+
 class Replayer(abc.ABC):
+    def __init__(self: "Debugger"):
+        # Path and index of the recording that states were last materialized from, and the last block read from it
+        self.state_recording = None
+        self.state_block = None
+
+        # Propagate initialization to other mixins
+        super().__init__()
+
+    def _get_event_history(self: "Debugger", event):
+        # Version 1 recordings store the history in every event, otherwise it's reconstructed from value updates
+        if "history" in event:
+            return event["history"]
+
+        return self._get_history(event["var"])
+
+    def _replay_values(self: "Debugger", event):
+        var = event["var"]
+        # Values recorded before the first replayed step are missing when only part of a recording is replayed
+        if event["new"] or var not in self.vars:
+            values = data.VarValues(ignored=event["ignored"])
+            self._set_values(var, values)
+        else:
+            values = self.vars[var]
+
+        values.extend(event["values"])
+        values.deleted_line = event["deleted_line"]
 
     def replay_events(self: "Debugger", events):
+        # Length of each thread's output so far, only used for older recordings
+        output_lens = {}
+
         for event in events:
             evt_type = event["event"]
 
             if evt_type == NEW_FRAME:
-                self.out.write_cur_frame(event["frame_info"], event["output"])
+                # Recordings from older versions don't have thread IDs or tasks
+                new_output = _get_new_output(event, output_lens)
+                self.out.write_cur_frame(event["frame_info"], new_output, event.get("thread", 0), event.get("task"))
             elif evt_type == EXECUTE_FRAME:
                 frame_info = event["frame_info"]
                 exec_time = event["exec_time"]
 
-                self.out.write_frame_exec(frame_info, exec_time, event["exec_times"])
-
                 # Replay changes to frame_exec_times
                 if frame_info in self.frame_exec_times:
                     self.frame_exec_times[frame_info].append(exec_time)
                 else:
                     self.frame_exec_times[frame_info] = [exec_time]
+
+                # Version 1 recordings store a copy of all execution times so far
+                exec_times = event.get("exec_times", self.frame_exec_times[frame_info])
+                self.out.write_frame_exec(frame_info, exec_time, exec_times)
             elif evt_type == ADD_VARIABLE:
                 self.out.write_add(
-                    event["var_name"], event["value"], event["history"], action=event["action"], plural=event["plural"],
+                    event["var_name"],
+                    event["value"],
+                    index.event_var(event),
+                    self._get_event_history(event),
+                    action=event["action"],
+                    plural=event["plural"],
                 )
             elif evt_type == CHANGE_VARIABLE:
                 self.out.write_change(
                     event["var_name"],
                     event["value_before"],
                     event["value_after"],
-                    event["history"],
+                    index.event_var(event),
+                    self._get_event_history(event),
                     action=event["action"],
                 )
             elif evt_type == REMOVE_VARIABLE:
-                self.out.write_remove(event["var_name"], event["value"], event["history"], action=event["action"])
+                self.out.write_remove(
+                    event["var_name"],
+                    event["value"],
+                    index.event_var(event),
+                    self._get_event_history(event),
+                    action=event["action"],
+                )
+            elif evt_type == UPDATE_VALUES:
+                self._replay_values(event)
             else:
                 raise ValueError(f"Unrecognized JSON event '{evt_type}'")
 
     def replay_summary(self: "Debugger", data):
-        self.vars.update(data["var_history"])
+        # Drop the ignored variables reconstructed from value updates, like the original run did
+        self.finalize_history()
+        # Streamed recordings of programs that crashed don't have summaries
+        self.vars.update(data.get("var_history", ()))
+        if "frame_exec_times" in data:
+            # Exact execution times take precedence over the ones reconstructed from events
+            self.frame_exec_times.clear()
+            self.frame_exec_times.update(data["frame_exec_times"])
+
         self.out.write_variable_summary(self.vars)
         if self.profiler_output:
             self.out.write_profiler_summary(self.frame_exec_times)
-        self.out.write_time_summary(data["exec_start_time"], data["exec_stop_time"])
+        if "exec_start_time" in data:
+            self.out.write_time_summary(data["exec_start_time"], data["exec_stop_time"])
 
-    def replay(self: "Debugger", json_path):
-        with open(json_path, "r") as f:
-            data = jsonpickle.loads(f.read())
+    def replay(self: "Debugger", json_path, from_step=None, to_step=None, function=None, variable=None):
+        # Events of streamed recordings are replayed as they're read, and the trailer with the summaries is read
+        # along with the last one
+        data = {}
+        events = recording.read_events(json_path, data, from_step, to_step, function, variable)
+        if any(value is not None for value in (from_step, to_step, function, variable)):
+            events = filter_events(events, from_step, to_step, function, variable)
+        if from_step is not None and from_step > 1:
+            events = _prepend_output(events, self.state_at(json_path, from_step - 1).outputs)
 
-        self.replay_events(data["events"])
+        self.replay_events(events)
         self.replay_summary(data)
+
+    def _get_state_index(self: "Debugger", json_path):
+        if self.state_recording is None or self.state_recording[0] != json_path:
+            self.state_recording = json_path, recording.load_index(json_path)
+            self.state_block = None
+
+        return self.state_recording[1]
+
+    def state_at(self: "Debugger", json_path, step):
+        """
+        Returns the State of the given recording after the event with the given step. Streamed recordings are read
+        from the keyframe at the start of the block that contains the step, so this takes time proportional to the
+        size of blocks rather than the number of the step, and the last block that was read is kept for stepping
+        around in it.
+        """
+
+        rec_index = self._get_state_index(json_path)
+        if rec_index is not None:
+            block = rec_index.find_block(step)
+            if self.state_block is None or self.state_block[0] != block:
+                self.state_block = (block,) + recording.read_block(json_path, rec_index, block)
+
+            _, keyframe, events = self.state_block
+            # Recordings from older versions have blocks without keyframes
+            if keyframe is not None:
+                state = State.from_keyframe(rec_index.blocks[block][1] - 1, keyframe)
+                return _apply_events(state, events, step)
+
+        # JSON documents have to be read from the start
+        return _apply_events(State(), recording.read_events(json_path, {}), step)
+
+    def step_backward(self: "Debugger", json_path, state, steps=1):
+        """Returns the State of the given recording the given number of steps before the given state"""
+
+        return self.state_at(json_path, max(state.step - steps, 0))
@@ -0,0 +1,31 @@
+class Sampler:
+    """Decides which line events get full snapshots when sampling is enabled"""
+
+    def __init__(self, every=None, rate=None):
+        # Sample every Nth execution of each line
+        self.every = every
+        # Minimum time between samples in ns, derived from the maximum number of samples per second
+        self.min_interval = None if rate is None else 1_000_000_000 // rate
+
+        # Map of (code object, line number) to the number of times the line has been executed
+        self.line_counts = {}
+        # When the last sample was taken
+        self.last_sample_time = None
+
+    def sample(self, code, line, time):
+        if self.every is not None:
+            key = (code, line)
+            count = self.line_counts.get(key, 0)
+            self.line_counts[key] = count + 1
+
+            # The first execution of every line is always sampled
+            if count % self.every != 0:
+                return False
+
+        if self.min_interval is not None:
+            if self.last_sample_time is not None and time - self.last_sample_time < self.min_interval:
+                return False
+
+            self.last_sample_time = time
+
+        return True
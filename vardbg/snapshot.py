@@ -0,0 +1,346 @@
+import _thread
+import copy
+import io
+import itertools
+import multiprocessing.connection
+import operator
+import pickle
+import socket
+import types
+import weakref
+
+# Immutable builtin types that can be compared reliably with ==
+SCALAR_TYPES = {bool, bytes, complex, float, int, str, range, type(None)}
+# Builtin container types whose == compares all of their contents
+CONTAINER_TYPES = {dict, frozenset, list, set, tuple}
+
+
+def _element_types(value):
+    # map() and set() loop in C, which is much faster than walking the elements in Python
+    if type(value) is dict:
+        return set(map(type, value)).union(map(type, value.values()))
+
+    return set(map(type, value))
+
+
+def _nested(value):
+    # Elements of a container that are containers themselves
+    items = itertools.chain(value, value.values()) if type(value) is dict else value
+    return [item for item in items if type(item) in CONTAINER_TYPES]
+
+
+def is_comparable(value, _seen=None):
+    """
+    Returns whether the given value consists only of builtin scalars and containers, which means that
+    comparing it to a copy with is_equal reliably detects all changes made to it.
+    """
+
+    value_type = type(value)
+    if value_type in SCALAR_TYPES:
+        return True
+    if value_type not in CONTAINER_TYPES:
+        return False
+
+    # Most containers only hold scalars, so they don't need to be walked
+    element_types = _element_types(value)
+    if element_types <= SCALAR_TYPES:
+        return True
+    if not element_types <= SCALAR_TYPES | CONTAINER_TYPES:
+        return False
+
+    # Self-referencing containers can't be compared without infinite recursion
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return False
+    _seen.add(id(value))
+
+    return all(is_comparable(item, _seen) for item in _nested(value))
+
+
+def _typed(value):
+    # Hashable value that only compares equal to another one if the types of all scalars and containers in them match
+    value_type = type(value)
+    if value_type is tuple:
+        return tuple, tuple(map(_typed, value))
+    elif value_type is frozenset:
+        return frozenset, frozenset(map(_typed, value))
+    else:
+        return value_type, value
+
+
+def _hashables_match(value, other):
+    # Elements of equal sets and keys of equal dicts can be in any order, so they're compared as sets of typed values
+    # (iterating over dicts only yields their keys)
+    types = set(map(type, value))
+    if types != set(map(type, other)):
+        return False
+
+    # Scalars of a single type can't differ in type
+    if len(types) <= 1 and types <= SCALAR_TYPES:
+        return True
+
+    return set(map(_typed, value)) == set(map(_typed, other))
+
+
+def _types_match(value, other):
+    # Equal containers are walked depth-first. Elements that are shared with the other container (e.g. all of the
+    # elements of a shallow copy) are skipped, so only elements that were replaced with equal ones are checked.
+    pending = [(value, other)]
+    while pending:
+        container, other_container = pending.pop()
+        container_type = type(container)
+
+        # Elements of sets and keys of dicts can be in any order, so they're checked separately
+        if container_type is set or container_type is frozenset:
+            if not _hashables_match(container, other_container):
+                return False
+
+            continue
+        elif container_type is dict:
+            if not _hashables_match(container, other_container):
+                return False
+
+            # Values of a single scalar type can't differ in type (this is checked in C, which is much faster)
+            value_types = set(map(type, container.values()))
+            if len(value_types) == 1 and value_types <= SCALAR_TYPES:
+                if value_types == set(map(type, other_container.values())):
+                    continue
+
+            # Values are looked up by key because the order of equal dicts can differ
+            pairs = ((item, other_container[key]) for key, item in container.items())
+        else:
+            pairs = zip(container, other_container)
+
+        for item, other_item in pairs:
+            if item is other_item:
+                continue
+
+            item_type = type(item)
+            if item_type is not type(other_item):
+                return False
+            if item_type in CONTAINER_TYPES:
+                pending.append((item, other_item))
+
+    return True
+
+
+def is_equal(value, other):
+    """
+    Compares the given values with ==, but also requires the types of the builtin scalars and containers in them to
+    match, so changes like 1 to True or 1 to 1.0 aren't missed. Values that can't be compared are unequal.
+    """
+
+    if value is other:
+        return True
+    if type(value) is not type(other):
+        return False
+
+    # Builtin container comparisons are implemented in C and bail out on the first difference
+    try:
+        if not value == other:
+            return False
+    except Exception:
+        return False
+
+    return type(value) not in CONTAINER_TYPES or _types_match(value, other)
+
+
+class Uncopyable:
+    """Stands in for a value that couldn't be copied, preserving its representation"""
+
+    # Only available while tracing because it can't be serialized either
+    value = None
+
+    def __init__(self, value):
+        self.value = value
+        try:
+            self.text = repr(value)
+        except Exception:
+            self.text = object.__repr__(value)
+
+    def __getstate__(self):
+        return {"text": self.text}
+
+    def __repr__(self):
+        return self.text
+
+    def __eq__(self, other):
+        return isinstance(other, Uncopyable) and self.text == other.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+
+def _probe_changed(value, prev):
+    if len(value) != len(prev):
+        return True
+
+    # Scalars at the ends and in the middle of sequences
+    if (type(value) is list or type(value) is tuple) and value:
+        for idx in (0, len(value) // 2, -1):
+            item, prev_item = value[idx], prev[idx]
+            if item is not prev_item and type(item) in SCALAR_TYPES and not is_equal(item, prev_item):
+                return True
+
+    return False
+
+
+def _is_unchanged(value, prev, comparable):
+    # Atomic and immutable values are shared with the snapshot rather than copied
+    if value is prev:
+        return True
+
+    # Changes within uncopyable values can't be detected since we don't have anything to compare them to
+    if type(prev) is Uncopyable:
+        return value is prev.value
+
+    if not comparable or type(value) is not type(prev):
+        return False
+
+    # Most changes to containers are caught by cheap probes before comparing all of their contents
+    if type(value) in CONTAINER_TYPES and _probe_changed(value, prev):
+        return False
+
+    return is_equal(value, prev)
+
+
+# Types that deepcopy() shares instead of copying
+_ATOMIC_TYPES = (type, types.FunctionType, types.BuiltinFunctionType, types.CodeType, property, weakref.ref)
+
+
+class _DryRunPickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        # Classes, functions, and a few others are copied by reference, so they don't need to be importable
+        if isinstance(obj, _ATOMIC_TYPES):
+            return id(obj)
+
+        return None
+
+
+# Types whose copies would share operating system resources such as file descriptors with the originals and release
+# them when they're destroyed. Some of them can be pickled, so they aren't caught by the dry run.
+_RESOURCE_TYPES = (io.IOBase, socket.socket, _thread.LockType, _thread.RLock, multiprocessing.connection.Connection)
+# Dry run verdicts by type, so that each type is only pickled once
+_copyable_types = {}
+
+
+def _dry_run(value):
+    # Copying is based on the pickle protocol, so a dry run reveals whether it would fail. Failing during the copy
+    # itself is dangerous because the partial copies can release resources that they share with the original objects
+    # when they're destroyed, e.g. closing the file descriptors of multiprocessing connections.
+    try:
+        _DryRunPickler(io.BytesIO()).dump(value)
+        return True
+    except Exception:
+        return False
+
+
+def _is_copyable(value, _seen=None):
+    value_type = type(value)
+    if value_type in SCALAR_TYPES:
+        return True
+
+    # Builtin containers can always be copied, so only their contents are checked
+    if value_type in CONTAINER_TYPES:
+        if _seen is None:
+            _seen = set()
+        if id(value) in _seen:
+            return True
+        _seen.add(id(value))
+
+        items = itertools.chain(value, value.values()) if value_type is dict else value
+        return all(_is_copyable(item, _seen) for item in items)
+
+    # Other values of the same type are assumed to be copyable too, so the object graph isn't pickled on every change.
+    # Types that implement copying themselves are trusted to do it properly.
+    verdict = _copyable_types.get(value_type)
+    if verdict is None:
+        if issubclass(value_type, _RESOURCE_TYPES):
+            verdict = False
+        else:
+            verdict = hasattr(value_type, "__deepcopy__") or _dry_run(value)
+        _copyable_types[value_type] = verdict
+
+    return verdict
+
+
+def copy_value(value, comparable=False):
+    """
+    Deep-copies the given value, or wraps it in Uncopyable if it can't be copied.
+    Comparable values can always be copied, so they skip the check.
+    """
+
+    if comparable:
+        value_type = type(value)
+        if value_type in SCALAR_TYPES:
+            return value
+
+        # Scalars are immutable, so containers that only hold scalars are copied shallowly in C
+        if _element_types(value) <= SCALAR_TYPES:
+            return value if value_type is tuple or value_type is frozenset else value.copy()
+    elif not _is_copyable(value):
+        # Some objects (e.g. threads, locks, and pools) can't be copied, so the best we can do is to keep a reference
+        return Uncopyable(value)
+
+    try:
+        return copy.deepcopy(value)
+    except Exception:
+        return Uncopyable(value)
+
+
+def take(cur_locals, prev_locals, comparable_names):
+    """
+    Takes a snapshot of the given locals, reusing values from the previous snapshot if they haven't changed.
+    Only new and changed values are deep-copied. comparable_names is the set of names whose previous values
+    can be compared by equality, and it is updated in-place.
+
+    Returns the new snapshot and a list of names that were added, changed, or removed.
+    """
+
+    new_locals = {}
+    changed_names = []
+
+    for name, value in cur_locals.items():
+        if name in prev_locals and _is_unchanged(value, prev_locals[name], name in comparable_names):
+            new_locals[name] = prev_locals[name]
+            continue
+
+        # Copy new values so they don't change on the next frame
+        comparable = is_comparable(value)
+        new_locals[name] = copy_value(value, comparable)
+        changed_names.append(name)
+
+        if comparable:
+            comparable_names.add(name)
+        else:
+            comparable_names.discard(name)
+
+    # Deleted variables
+    for name in prev_locals:
+        if name not in new_locals:
+            changed_names.append(name)
+            comparable_names.discard(name)
+
+    return new_locals, changed_names
+
+
+_MISSING = object()
+
+
+def is_rebound(f_locals, refs):
+    """
+    Returns whether any locals were assigned, added, or deleted since the given shallow copy of them was taken.
+    Changes made to the values in place aren't detected.
+    """
+
+    if len(f_locals) != len(refs):
+        return True
+
+    return not all(map(operator.is_, map(f_locals.get, refs, itertools.repeat(_MISSING)), refs.values()))
+
+
+def subset(snapshot, names):
+    """Returns the part of the given snapshot that contains the given names, preserving its order"""
+
+    return {name: value for name, value in snapshot.items() if name in names}
@@ -0,0 +1,78 @@
+from .index import value_change
+from .output.json_writer import NEW_FRAME
+
+
+class State:
+    """
+    Holds the state of a recorded program at one step: the current value of every variable, and the frame that each
+    thread is executing along with the output that it has printed so far. States are built up by applying events to
+    them one at a time, and streamed recordings store a copy of the state at the start of each block (a keyframe) so
+    that it can be restored without reading the events that came before it.
+    """
+
+    def __init__(self, step=0, frames=None, values=None, outputs=None):
+        # Step of the last event that was applied
+        self.step = step
+        # Map of (process, thread) pairs to the frame that each thread is currently executing
+        self.frames = dict(frames or {})
+        # Map of variables to their current VarValue, which excludes ignored and deleted variables
+        self.values = dict(values or {})
+        # Map of (process, thread) pairs to the stdout output of each thread so far
+        self.outputs = dict(outputs or {})
+
+    def apply(self, event):
+        self.step = event["step"]
+
+        if event["event"] == NEW_FRAME:
+            # Recordings from older versions don't have processes or threads
+            key = event.get("process"), event.get("thread", 0)
+            self.frames[key] = event["frame_info"]
+
+            # Recordings from older versions store the full output of the thread in every frame
+            if "output" in event:
+                self.outputs[key] = event["output"]
+            elif event.get("new_output"):
+                self.outputs[key] = self.outputs.get(key, "") + event["new_output"]
+
+            return
+
+        change = value_change(event, self.values)
+        if change is not None:
+            var, value = change
+            if value is None:
+                self.values.pop(var, None)
+            else:
+                self.values[var] = value
+
+    def scopes(self):
+        """Returns a map of (file, function) pairs to the variables in them and their current values"""
+
+        scopes = {}
+        for var, value in self.values.items():
+            scopes.setdefault(var.function_key(), {})[var] = value
+
+        return scopes
+
+    def thread_scope(self, process, thread):
+        """Returns the variables in the function that the given thread is executing and their current values"""
+
+        frame_info = self.frames.get((process, thread))
+        if frame_info is None:
+            return {}
+
+        return self.scopes().get((frame_info.file, frame_info.function), {})
+
+    def to_keyframe(self):
+        # Keyframes are stored as plain lists because JSON can't have tuple keys
+        return {
+            "frames": [[process, thread, frame_info] for (process, thread), frame_info in self.frames.items()],
+            "values": [[var, value] for var, value in self.values.items()],
+            "outputs": [[process, thread, output] for (process, thread), output in self.outputs.items()],
+        }
+
+    @classmethod
+    def from_keyframe(cls, step, keyframe):
+        frames = {(process, thread): frame_info for process, thread, frame_info in keyframe["frames"]}
+        # Keyframes from older versions don't have outputs
+        outputs = {(process, thread): output for process, thread, output in keyframe.get("outputs", ())}
+        return cls(step, frames, map(tuple, keyframe["values"]), outputs)
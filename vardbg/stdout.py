@@ -0,0 +1,49 @@
+import io
+import threading
+
+from . import internal
+
+
+class StdoutCapture(io.TextIOBase):
+    """Replacement for sys.stdout that keeps the output of each thread separately"""
+
+    def __init__(self, discard=False):
+        super().__init__()
+
+        # Output of the current thread that hasn't been taken yet
+        self.local = threading.local()
+        # Whether to drop output instead of keeping it, e.g. when nothing would show it
+        self.discard = discard
+
+    def _get_pending(self):
+        pending = getattr(self.local, "pending", None)
+        if pending is None:
+            pending = []
+            self.local.pending = pending
+
+        return pending
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+
+        if not self.discard:
+            self._get_pending().append(text)
+        return len(text)
+
+    def take_output(self):
+        """Returns the output written by the current thread since the last call"""
+
+        pending = self._get_pending()
+        if not pending:
+            return ""
+
+        text = "".join(pending)
+        pending.clear()
+        return text
+
+    # Called by the debugged program while tracing is active
+    internal.add_funcs(_get_pending, writable, write)
@@ -0,0 +1,42 @@
+class Suppressor:
+    """Learns which lines never change any variables and skips snapshots after them"""
+
+    def __init__(self, threshold, recheck_interval):
+        # Number of executions without changes before a line is suppressed
+        self.threshold = threshold
+        # Suppressed lines are still verified with a full snapshot once every this many executions
+        self.recheck_interval = recheck_interval
+
+        # Map of (code object, line number) to the number of executions without changes,
+        # or None if the line has ever changed a variable
+        self.quiet_counts = {}
+
+    def _is_checked(self, count):
+        # Whether the given execution of a quiet line (counting from 1) gets a snapshot
+        return count <= self.threshold or (count - self.threshold) % self.recheck_interval == 0
+
+    def should_snapshot(self, key):
+        """Counts an execution of the given line and returns whether it needs a snapshot after it"""
+
+        count = self.quiet_counts.get(key, 0)
+        if count is None:
+            return True
+
+        # Every execution is counted here, and record() only clears the count if a snapshot finds changes
+        count += 1
+        self.quiet_counts[key] = count
+        return self._is_checked(count)
+
+    def will_check(self, key):
+        """
+        Returns whether the next execution of the given quiet line gets a snapshot, which means that a snapshot
+        must also be taken right before it so that the diff only covers that line.
+        """
+
+        count = self.quiet_counts.get(key, 0)
+        return count is not None and self._is_checked(count + 1)
+
+    def record(self, key, changed):
+        # Lines that have changed variables once are never suppressed again
+        if changed:
+            self.quiet_counts[key] = None
@@ -1,25 +1,80 @@
 import abc
-import copy
-import io
+import dis
+import fnmatch
+import inspect
+import site
 import sys
+import sysconfig
+import threading
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-import dictdiffer
-
-from . import data, internal, timing
+from . import data, diff, internal, multiprocess, output, snapshot, timing
+from .stdout import StdoutCapture
 
 if TYPE_CHECKING:
     from .debugger import Debugger
 
 
 ALLOWED_EVENTS = {"call", "line", "return"}
+CALL_EVENTS = {"call", "return"}
 DISALLOWED_FUNC_NAMES = {"<genexpr>", "<listcomp>", "<dictcomp>", "<setcomp>"}
 
+# Code flags of generators and coroutines, whose frames return every time they're suspended
+SUSPENDABLE_FLAGS = (
+    inspect.CO_GENERATOR | inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE | inspect.CO_ASYNC_GENERATOR
+)
+YIELD_VALUE = dis.opmap["YIELD_VALUE"]
+# Used by yield from and await before Python 3.11
+YIELD_FROM = dis.opmap.get("YIELD_FROM")
+
 # Known stdlib module path
 STDLIB_DIR = Path(abc.__file__).parent
 
 
+def _get_site_dirs():
+    paths = sysconfig.get_paths()
+    dirs = {paths["purelib"], paths["platlib"]}
+
+    # These are missing in some old virtualenvs
+    if hasattr(site, "getsitepackages"):
+        dirs.update(site.getsitepackages())
+    if hasattr(site, "getusersitepackages"):
+        dirs.add(site.getusersitepackages())
+
+    return {Path(d) for d in dirs}
+
+
+# Known third-party package paths
+SITE_DIRS = _get_site_dirs()
+
+
+def _match_any(patterns, module, path):
+    return any(fnmatch.fnmatchcase(module, pat) or fnmatch.fnmatchcase(path, pat) for pat in patterns)
+
+
+def _is_at_yield(frame):
+    code = frame.f_code.co_code
+    lasti = frame.f_lasti
+    if code[lasti] == YIELD_VALUE:
+        return True
+
+    # Frames suspended by YIELD_FROM point to the instruction before it so that it's repeated on resumption
+    return YIELD_FROM is not None and lasti + 2 < len(code) and code[lasti + 2] == YIELD_FROM
+
+
+def _get_task_name():
+    # Only programs that have already imported asyncio can be running tasks
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None or asyncio._get_running_loop() is None:
+        return None
+
+    # current_task() was added in Python 3.7 and task names in Python 3.8
+    current_task = getattr(asyncio, "current_task", None) or asyncio.Task.current_task
+    task = current_task()
+    return None if task is None else getattr(task, "get_name", lambda: None)()
+
+
 class FrameScope:
     """Scope of one stack frame and its snapshots."""
 
@@ -28,114 +83,299 @@ class FrameScope:
         self.prev_frame_info = None
         self.prev_event = None
         self.prev_locals = {}
+        # Shallow copy of the previous frame's locals, used to detect assignments after suppressed lines
+        self.prev_refs = {}
         # New frame's locals
         self.new_locals = {}
+        # Names of locals whose snapshots can be checked for changes by comparison
+        self.comparable_names = set()
+        # Names of locals that changed between the previous and new snapshots
+        self.changed_names = []
+        # When the function started executing (only used in calls-only mode)
+        self.start_time = None
+        # Name of the asyncio task that the frame last ran in (None if it's not running in a task)
+        self.task = None
+
+
+class ThreadState:
+    """Tracing state of one thread."""
+
+    def __init__(self, thread_id):
+        # Sequential ID of this thread (the first traced thread is 0)
+        self.id = thread_id
+        # Stack with frame scopes
+        self.scope_stack = []
+        # Number of nested frames being skipped by the backend, e.g. because they exceed the maximum depth
+        self.skipped_depth = 0
+        # Frame and instruction that the last exception was raised at
+        self.raised_at = None, None
 
 
 class Tracer(abc.ABC):
     def __init__(self: "Debugger"):
         # Function being debugged
         self.func = None
-        # Stack with frame scopes
-        self.scope_stack = []
-
-        # stdout buffer
-        self.stdout_buf = io.StringIO()
-
-        # File content cache
-        self.file_cache = {}
-        # stdlib status cache
-        self.stdlib_cache = {}
+        # Tracing state of the current thread (the state is discarded when its thread exits)
+        self.thread_local = threading.local()
+        # Number of threads seen so far
+        self.thread_count = 0
+        # Lock that serializes event processing across threads
+        self.trace_lock = threading.Lock()
+        # Scopes of suspended generator and coroutine frames, which are reused when the frames are resumed
+        self.suspended_scopes = {}
+
+        # stdout buffer, which drops output if no writer uses it
+        self.stdout_buf = StdoutCapture(discard=output.OUTPUT not in self.out.consumes)
+
+        # Map of file paths to their vardbg directives by line number
+        self.directive_cache = {}
+        # Map of (code object, line number) pairs to their shared FrameInfo objects
+        self.frame_info_cache = {}
+        # stdlib/site-packages status cache
+        self.library_cache = {}
+        # Map of code objects to whether they should be traced
+        self.code_verdicts = {}
 
         # Propagate initialization to other mixins
         super().__init__()
 
-    def is_stdlib(self, path):
-        if path in self.stdlib_cache:
-            return self.stdlib_cache[path]
+    def is_library(self, path):
+        if path in self.library_cache:
+            return self.library_cache[path]
         else:
-            # Compare parents with known stdlib path
-            status = STDLIB_DIR in Path(path).parents
-            self.stdlib_cache[path] = status
+            # Compare parents with known stdlib and site-packages paths
+            parents = Path(path).parents
+            status = STDLIB_DIR in parents or any(site_dir in parents for site_dir in SITE_DIRS)
+            self.library_cache[path] = status
             return status
 
-    def trace_callback(self: "Debugger", frame, event, arg):
-        """Frame execution callback"""
-
-        # Get time as early as possible
-        call_time = timing.profiler_time()
-
+    def _get_verdict(self, frame):
         # Ignore our internal functions
         code = frame.f_code
         if code in internal.INTERNAL_FUNC_CODES:
-            return
+            return False
 
         # Ignore comprehensions and generator expressions
         # (they act strangely and most people wouldn't consider them to be functions)
         if code.co_name in DISALLOWED_FUNC_NAMES:
-            return
+            return False
 
-        # Ignore stdlib code
-        if self.is_stdlib(code.co_filename):
-            return
+        # Ignore code without a source file, e.g. frozen modules and code generated with exec(), which asyncio
+        # and multiprocessing run on behalf of the traced program
+        if code.co_filename.startswith("<"):
+            return False
+
+        # Child processes import modules while unpickling their targets, none of which is part of the traced program
+        if self.shard_dir is not None and code.co_name == "<module>":
+            return False
+
+        # User filters take precedence over library checks, with exclusions winning over inclusions
+        module = frame.f_globals.get("__name__", "")
+        if _match_any(self.exclude_patterns, module, code.co_filename):
+            return False
+        if _match_any(self.include_patterns, module, code.co_filename):
+            return True
+
+        # Ignore stdlib and site-packages code
+        return not self.is_library(code.co_filename)
+
+    def should_trace(self, frame):
+        # Checks are only performed the first time each code object is seen
+        code = frame.f_code
+        verdict = self.code_verdicts.get(code)
+        if verdict is None:
+            verdict = self._get_verdict(frame)
+            self.code_verdicts[code] = verdict
+
+        return verdict
+
+    def get_frame_info(self: "Debugger", frame):
+        # FrameInfo objects are immutable, so they're shared by all events on the same line of the same code
+        key = frame.f_code, frame.f_lineno
+        frame_info = self.frame_info_cache.get(key)
+        if frame_info is None:
+            frame_info = data.FrameInfo(frame, relative=self.use_relative_paths, directive_cache=self.directive_cache)
+            self.frame_info_cache[key] = frame_info
+
+        return frame_info
+
+    def get_thread_state(self: "Debugger"):
+        state = getattr(self.thread_local, "state", None)
+        if state is None:
+            with self.trace_lock:
+                state = ThreadState(self.thread_count)
+                self.thread_count += 1
+
+            self.thread_local.state = state
+
+        return state
+
+    def depth_exceeded(self: "Debugger", state):
+        # Entry function is at depth 0, so the stack holds the depth of the frame being called
+        return self.max_depth is not None and len(state.scope_stack) > self.max_depth
+
+    def should_snapshot(self: "Debugger", scope, frame, event, time):
+        # Skip snapshots after lines that have been learned to never change anything, unless the next line is
+        # about to be checked (its diff must only cover itself) or the suppressed line assigned a variable.
+        # Every execution is counted, but only snapshots before line events can be skipped.
+        if self.suppressor is not None and scope.prev_event == "line":
+            code = frame.f_code
+            if (
+                not self.suppressor.should_snapshot((code, scope.prev_frame_info.line))
+                and event == "line"
+                and not self.suppressor.will_check((code, frame.f_lineno))
+                and not snapshot.is_rebound(frame.f_locals, scope.prev_refs)
+            ):
+                return False
+
+        return event != "line" or self.sampler is None or self.sampler.sample(frame.f_code, frame.f_lineno, time)
+
+    def trace_callback(self: "Debugger", frame, event, arg):
+        """Global frame execution callback for the settrace backend, only called for new frames"""
+
+        # Get time as early as possible
+        call_time = timing.profiler_time()
+
+        # Returning None for rejected frames prevents Python from calling us for any events inside them, so calls
+        # into excluded and library code are opaque: they're executed and timed as a single step of the calling line
+        if not self.should_trace(frame) or self.depth_exceeded(self.get_thread_state()):
+            return None
+
+        # Disable line events for this frame entirely in calls-only mode (not supported on Python < 3.7)
+        if self.calls_only and hasattr(frame, "f_trace_lines"):
+            frame.f_trace_lines = False
+
+        self.trace_event(frame, event, call_time)
+
+        # Subscribe to the rest of this frame's events
+        return self.trace_local_callback
+
+    def trace_local_callback(self: "Debugger", frame, event, arg):
+        """Local frame execution callback for the settrace backend, only attached to traced frames"""
+
+        call_time = timing.profiler_time()
 
         # Ignore irrelevant events, but still attach to the next one
-        if event not in ALLOWED_EVENTS:
-            return self.trace_callback
+        if event in self.traced_events:
+            if event == "return" and self.is_suspending(frame):
+                event = "yield"
+
+            self.trace_event(frame, event, call_time)
+        elif event == "exception":
+            # Remember where exceptions are raised to tell them apart from suspensions if the frame returns
+            self.get_thread_state().raised_at = frame, frame.f_lasti
+
+        return self.trace_local_callback
+
+    def is_suspending(self: "Debugger", frame):
+        """Returns whether a returning frame is actually a generator or coroutine being suspended (settrace only)"""
+
+        if not frame.f_code.co_flags & SUSPENDABLE_FLAGS:
+            return False
 
+        # Exceptions thrown into suspended frames (e.g. GeneratorExit when they're closed) are raised at the yield
+        raised_frame, raised_lasti = self.get_thread_state().raised_at
+        if raised_frame is frame and raised_lasti == frame.f_lasti:
+            return False
+
+        return _is_at_yield(frame)
+
+    def trace_event(self: "Debugger", frame, event, call_time):
+        """Processes a call, line, return, or yield event from the tracing backend"""
+
+        state = self.get_thread_state()
+
+        # Events from different threads are processed one at a time in the order they arrive
+        with self.trace_lock:
+            self._process_event(state, frame, event, call_time)
+
+    def _process_event(self: "Debugger", state, frame, event, call_time):
         # Obtain frame scope
         if event == "call":
-            # Create and push a new scope for this stack frame (used for all of its snapshots)
-            scope = FrameScope()
-            self.scope_stack.append(scope)
+            # Create and push a new scope for this stack frame (used for all of its snapshots), unless it's a
+            # generator or coroutine being resumed, which continues with the scope that it was suspended with
+            scope = self.suspended_scopes.pop(frame, None)
+            if scope is None:
+                scope = FrameScope()
+            state.scope_stack.append(scope)
+
+            # Tasks can only switch at suspensions, so the task is the same until the frame returns
+            scope.task = _get_task_name()
         else:
             # Don't use pop since we may need to reuse the scope
-            scope = self.scope_stack[-1]
+            scope = state.scope_stack[-1]
 
         # The first frame is when function arguments are populated, so it's important
         # Set itself to the previous frame since its line number *is* where function arguments are defined
-        frame_info = data.FrameInfo(frame, relative=self.use_relative_paths, file_cache=self.file_cache)
+        frame_info = self.get_frame_info(frame)
         if scope.prev_frame_info is None:
             scope.prev_frame_info = frame_info
             scope.prev_event = event
 
         # Only invoke profiler if the last event was a normal line, since calls haven't executed anything yet
         # and returns aren't actually relevant to the code
-        should_profile = scope.prev_event == "line"
+        # In calls-only mode, the entire function is profiled as one frame on return instead.
+        if self.calls_only:
+            should_profile = event == "return" or event == "yield"
+        else:
+            should_profile = scope.prev_event == "line"
+
         if should_profile:
             # Call profiler first to avoid counting the time it takes to copy locals
-            self.profile_complete_frame(scope.prev_frame_info, call_time)
+            self.profile_complete_frame(scope.prev_frame_info, call_time, state.id, start_time=scope.start_time)
+
+        # Skipped lines are only counted and timed, so later diffs are against the last snapshot
+        if not self.should_snapshot(scope, frame, event, call_time):
+            scope.prev_frame_info = frame_info
+            scope.prev_event = event
+            self.profile_start_frame(state.id)
+            return
+
+        # Get new locals, only copying the ones that changed so they don't change on the next frame
+        f_locals = frame.f_locals
+        scope.new_locals, scope.changed_names = snapshot.take(f_locals, scope.prev_locals, scope.comparable_names)
 
-        # Get new locals and copy them so they don't change on the next frame
-        scope.new_locals = copy.deepcopy(frame.f_locals)
+        if self.suppressor is not None:
+            scope.prev_refs = dict(f_locals)
 
-        # Render output prefix for this frame
-        self.out.write_cur_frame(scope.prev_frame_info, self.stdout_buf.getvalue())
+            # Learn whether the last line changed anything
+            if scope.prev_event == "line":
+                self.suppressor.record((frame.f_code, scope.prev_frame_info.line), bool(scope.changed_names))
+
+        # Render output prefix for this frame along with the thread's new output
+        self.out.write_cur_frame(scope.prev_frame_info, self.stdout_buf.take_output(), state.id, scope.task)
 
         # Skip profiler for the first frame since it's before any real execution (just the function call)
         if should_profile:
             # Call profiler to print the last frame's execution
             self.profile_print_frame(scope.prev_frame_info)
 
-        # Diff and print changes
-        diff = dictdiffer.diff(scope.prev_locals, scope.new_locals)
-        self.process_locals_diff(diff, scope.prev_frame_info, scope.new_locals)
+        # Diff and print changes, skipping unchanged locals entirely
+        prev_changed = snapshot.subset(scope.prev_locals, scope.changed_names)
+        new_changed = snapshot.subset(scope.new_locals, scope.changed_names)
+        changes = diff.diff_locals(prev_changed, new_changed)
+        self.process_locals_diff(changes, scope.prev_frame_info, scope.new_locals)
 
         if event == "return":
             # Use pop() to return to the previous frame since the scope is no longer needed
-            self.scope_stack.pop()
+            state.scope_stack.pop()
         else:
             # Update previous frame info in preparation for the next frame
             scope.prev_frame_info = frame_info
             scope.prev_event = event
             scope.prev_locals = scope.new_locals
 
-        # Don't profile returns (performance isn't user code) or calls (nothing's actually executed yet)
-        if event == "line":
-            self.profile_start_frame()
+            if event == "yield":
+                # Keep the scope for when the frame is resumed, so it's only diffed against its state at suspension
+                state.scope_stack.pop()
+                self.suspended_scopes[frame] = scope
 
-        # Subscribe to the next frame, if any
-        return self.trace_callback
+        # Don't profile returns (performance isn't user code) or calls (nothing's actually executed yet),
+        # except for function calls in calls-only mode
+        if event == "line":
+            self.profile_start_frame(state.id)
+        elif event == "call" and self.calls_only:
+            scope.start_time = timing.profiler_time()
 
     def run(self: "Debugger", func, *args, **kwargs):
         # Set function
@@ -149,16 +389,27 @@ class Tracer(abc.ABC):
         real_stdout = sys.stdout
         sys.stdout = self.stdout_buf
 
-        # Run function with trace callback registered
-        sys.settrace(self.trace_callback)
-        self.profile_start_exec()
-        ret = self.func(*args, **kwargs)
-        self.profile_end_exec()
-        sys.settrace(None)
-
-        # Restore arguments
-        sys.argv = old_args
-        sys.stdout = real_stdout
+        # Propagate tracing to child processes
+        if self.shard_dir is not None:
+            multiprocess.enable(self)
+
+        # Run function with the tracing backend active
+        self.backend.start()
+        try:
+            self.profile_start_exec()
+            ret = self.func(*args, **kwargs)
+            self.profile_end_exec()
+        finally:
+            self.backend.stop()
+            if self.shard_dir is not None:
+                multiprocess.disable()
+
+            # Drop the scopes of generators and coroutines that were never finished
+            self.suspended_scopes.clear()
+
+            # Restore arguments
+            sys.argv = old_args
+            sys.stdout = real_stdout
 
         # Finalize variable history
         self.finalize_history()